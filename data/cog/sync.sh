@@ -2,7 +2,7 @@
 # Sync all Cloud-Optimized GeoTIFFs (~722MB)
 # Subdirs: precipitation, soil-moisture, precondition, ecmwf-hres,
 #          satellite-vis, satellite-ir, wind-u, wind-v, wind-gust,
-#          mslp, ivt, sst, arpege
+#          wind-uv, wind-speed, wind-direction, mslp, ivt, sst, arpege
 # Usage: ./sync.sh [pull|push] [rclone flags...]
 set -euo pipefail
 
@@ -11,7 +11,7 @@ REL="${DIR#$ROOT/}"
 REMOTE="${CHEIAS_REMOTE:-cheias:cheias-pt}"
 
 case "${1:-pull}" in
-  pull) rclone sync "$REMOTE/$REL" "$DIR" --exclude="sync.sh" --exclude="README.md" --progress "${@:2}" ;;
-  push) rclone sync "$DIR" "$REMOTE/$REL" --exclude="sync.sh" --exclude="README.md" --progress "${@:2}" ;;
+  pull) rclone sync "$REMOTE/$REL" "$DIR" --exclude="sync.sh" --exclude="README.md" --exclude="*.part*" --progress "${@:2}" ;;
+  push) rclone sync "$DIR" "$REMOTE/$REL" --exclude="sync.sh" --exclude="README.md" --exclude="*.part*" --progress "${@:2}" ;;
   *) echo "Usage: $0 [pull|push] [rclone flags...]"; exit 1 ;;
 esac
@@ -16,9 +16,9 @@ Key timesteps:
 """
 
 import sys
+from functools import lru_cache
 import numpy as np
 import rasterio
-from rasterio.transform import xy
 from pathlib import Path
 
 PROJECT = Path("/home/nls/Documents/dev/cheias-pt")
@@ -54,18 +54,25 @@ TIMESTEPS = [
 ]
 
 
+@lru_cache(maxsize=None)
+def lonlat_grid(transform, height, width):
+    """Pixel-centre (lons, lats) grids of a north-up affine, computed once per grid."""
+    lon = transform.c + (np.arange(width) + 0.5) * transform.a
+    lat = transform.f + (np.arange(height) + 0.5) * transform.e
+    lons, lats = np.meshgrid(lon, lat)
+    lons.flags.writeable = False
+    lats.flags.writeable = False
+    return lons, lats
+
+
 def read_cog(filepath):
     """Read a COG and return (data_array, transform, crs, lons, lats)."""
     with rasterio.open(filepath) as src:
         data = src.read(1).astype(np.float32)
         transform = src.transform
         crs = src.crs
-        height, width = data.shape
-        rows, cols = np.mgrid[0:height, 0:width]
-        lons_flat, lats_flat = rasterio.transform.xy(transform, rows.ravel(), cols.ravel())
-        lons = np.array(lons_flat).reshape(height, width)
-        lats = np.array(lats_flat).reshape(height, width)
-        return data, transform, crs, lons, lats
+    lons, lats = lonlat_grid(transform, *data.shape)
+    return data, transform, crs, lons, lats
 
 
 def compute_gradient_magnitude(mslp, lons, lats):
@@ -113,8 +120,8 @@ def find_gradient_ridge(grad_mag, lons, lats, domain):
     lon_min, lon_max, lat_min, lat_max = domain
     mask = (lons >= lon_min) & (lons <= lon_max) & (lats >= lat_min) & (lats <= lat_max)
     grad_in_domain = np.where(mask, grad_mag, 0.0)
-    # Get top 200 strongest gradient points
-    flat_indices = np.argsort(grad_in_domain.ravel())[-200:]
+    # Top 200 strongest gradient points (unordered; callers sort the 200)
+    flat_indices = np.argpartition(grad_in_domain.ravel(), -200)[-200:]
     rows, cols = np.unravel_index(flat_indices, grad_mag.shape)
     pts = [(lons[r, c], lats[r, c], grad_mag[r, c]) for r, c in zip(rows, cols)]
     return pts
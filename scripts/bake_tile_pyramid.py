@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Pre-render WebMercator tile pyramids for daily COG time series.
+
+The soil-moisture / precipitation tile layers went through TiTiler, which
+reprojects and colormaps `cog/<variable>/<date>.tif` on every tile request,
+so each scroll scrub fans out into dozens of dates × tiles of on-the-fly
+rendering. This script bakes those tiles once:
+
+  - every date of a variable, zooms 4–10, 256 px PNG tiles
+  - same colormaps and rescale ranges as the TiTiler layers in
+    layer-manager.ts (YlGnBu 0.05–0.50, YlOrRd 1–80), via the shared LUTs
+  - a COG is EPSG:4326 on a regular grid, so each Mercator tile samples it
+    separably: one bilinear weight matrix for the tile's rows, one for its
+    columns (resample.py), applied to the nearest-filled frame
+  - jobs run per (date, tile) on a RenderPool; tiles with no data pixels
+    are skipped, and only tiles intersecting the COG bounds are enumerated
+
+Output: data/tiles/<variable>/<date>.pmtiles (one PMTiles archive per date,
+        served statically) + a "tiles" block per variable in
+        data/frontend/raster-manifest.json
+
+Usage:
+    python scripts/bake_tile_pyramid.py
+    python scripts/bake_tile_pyramid.py --variable precipitation --max-zoom 9
+"""
+
+import argparse
+import json
+import math
+import re
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from frame_encoder import encode_frame
+from pmtiles_writer import PMTilesWriter
+from render_pool import RenderPool, lut_from_cmap, lut_lookup
+from resample import bilinear_weights, fill_stack, read_stack
+from stac_catalog import scan, search
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+
+ROOT = Path(__file__).resolve().parent.parent
+COG = ROOT / "data" / "cog"
+TILES = ROOT / "data" / "tiles"
+MANIFEST = ROOT / "data" / "frontend" / "raster-manifest.json"
+
+# raster-frames / cog subdirectory → manifest key, colormap, rescale (as the TiTiler layers)
+VARIABLES = {
+    "soil-moisture": {"key": "soil_moisture", "cmap": "YlGnBu", "rescale": (0.05, 0.50),
+                      "attribution": "Soil moisture: Open-Meteo / ERA5-Land"},
+    "precipitation": {"key": "precipitation", "cmap": "YlOrRd", "rescale": (1.0, 80.0),
+                      "attribution": "Precipitation: Open-Meteo / ERA5"},
+}
+
+MIN_ZOOM = 4
+MAX_ZOOM = 10
+TILE_SIZE = 256
+
+DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+# ─── Tile geometry ───────────────────────────────────────────────────────────
+
+def lonlat_to_tile(lon, lat, z):
+    """Fractional WebMercator tile coordinates of a lon/lat at zoom z."""
+    n = 1 << z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return x, y
+
+
+def tiles_for_bounds(bounds, z):
+    """(x, y) of every tile at zoom z intersecting (west, south, east, north)."""
+    west, south, east, north = bounds
+    x0, y0 = lonlat_to_tile(west, north, z)
+    x1, y1 = lonlat_to_tile(east, south, z)
+    n = 1 << z
+    xs = range(max(int(x0), 0), min(int(math.ceil(x1)), n))
+    ys = range(max(int(y0), 0), min(int(math.ceil(y1)), n))
+    return [(x, y) for x in xs for y in ys]
+
+
+def tile_pixel_lonlat(z, x, y, size=TILE_SIZE):
+    """Longitudes of a tile's pixel columns and latitudes of its pixel rows (centres)."""
+    n = 1 << z
+    t = (np.arange(size) + 0.5) / size
+    lons = (x + t) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * (y + t) / n))))
+    return lons, lats
+
+
+# ─── Rendering ───────────────────────────────────────────────────────────────
+
+def render_tile(t, out_path, shared, z, x, y, geo, vmin, vmax):
+    """RenderPool job: date index t, tile z/x/y → PNG (nothing written if empty)."""
+    west, xres, north, yres = geo
+    filled = shared["filled"][t]
+    nodata = shared["nodata"][t]
+    h, w = filled.shape
+
+    lons, lats = tile_pixel_lonlat(z, x, y)
+    cols = (lons - west) / xres
+    rows = (north - lats) / yres
+    wy, in_rows = bilinear_weights(rows, h)
+    wx, in_cols = bilinear_weights(cols, w)
+
+    near_r = np.clip(rows.astype(np.intp), 0, h - 1)
+    near_c = np.clip(cols.astype(np.intp), 0, w - 1)
+    valid = np.outer(in_rows, in_cols) & ~nodata[np.ix_(near_r, near_c)]
+    if not valid.any():
+        return
+
+    data = (wx @ (wy @ filled).T).T
+    norm = np.clip((data - vmin) / (vmax - vmin), 0, 1)
+    norm[~valid] = np.nan
+    rgba = (lut_lookup(shared["lut"], norm) * 255).astype(np.uint8)
+    encode_frame(rgba, out_path)
+
+
+def pack_archive(tile_dir, out_path, bounds, metadata):
+    """Staged z/x/y.png tree → one PMTiles archive. Returns the tile count."""
+    with PMTilesWriter(out_path, "png") as writer:
+        for png in tile_dir.glob("*/*/*.png"):
+            z, x, y = int(png.parent.parent.name), int(png.parent.name), int(png.stem)
+            writer.add_tile(z, x, y, png.read_bytes())
+        writer.bounds = bounds
+        writer.metadata = metadata
+        return len(writer)
+
+
+def daily_cogs(name):
+    """Daily COGs of one variable from the STAC index, after rescanning its directory.
+
+    The rescan is incremental (unchanged files are skipped by size/mtime), so
+    new COGs are always baked and deleted ones dropped from the index.
+    """
+    scan([f"cog/{name}"])
+    items = search(collection=name)
+    return [COG.parent / item["href"] for item in items if DATE_RE.fullmatch(item["id"])]
+
+
+def bake_variable(name, cfg, min_zoom, max_zoom, workers=None):
+    """Bake every date of one variable. Returns the manifest "tiles" block."""
+    cogs = daily_cogs(name)
+    if not cogs:
+        return None
+
+    with rasterio.open(cogs[0]) as ds:
+        west, south, east, north = ds.bounds
+        geo = (ds.transform.c, ds.transform.a, ds.transform.f, -ds.transform.e)
+    bounds = (west, south, east, north)
+    stack = read_stack(cogs)
+
+    out_dir = TILES / name
+    out_dir.mkdir(parents=True, exist_ok=True)
+    vmin, vmax = cfg["rescale"]
+    lut = lut_from_cmap(plt.get_cmap(cfg["cmap"]))
+    tiles = [(z, x, y) for z in range(min_zoom, max_zoom + 1) for x, y in tiles_for_bounds(bounds, z)]
+
+    shared = {"filled": fill_stack(stack), "nodata": np.isnan(stack), "lut": lut}
+    with tempfile.TemporaryDirectory(dir=TILES, prefix=f".{name}-") as staging, \
+            RenderPool(shared, workers=workers) as pool:
+        staging = Path(staging)
+        print(f"  {name}: {len(cogs)} dates × {len(tiles)} tiles (z{min_zoom}–{max_zoom}) "
+              f"on {pool.workers} workers")
+        for t, cog in enumerate(cogs):
+            for z, x, y in tiles:
+                dst = staging / cog.stem / str(z) / str(x) / f"{y}.png"
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                pool.submit(f"{cog.stem}/{z}/{x}/{y}", render_tile, t, dst,
+                            z=z, x=x, y=y, geo=geo, vmin=vmin, vmax=vmax)
+        failed = pool.wait(every=max(len(cogs) * len(tiles) // 10, 1))
+        if failed:
+            print(f"  ⚠ {len(failed)} tiles failed")
+
+        total_bytes = 0
+        written = 0
+        for cog in cogs:
+            archive = out_dir / f"{cog.stem}.pmtiles"
+            written += pack_archive(staging / cog.stem, archive, bounds, {
+                "name": f"{name} {cog.stem}",
+                "format": "png",
+                "minzoom": min_zoom,
+                "maxzoom": max_zoom,
+                "colormap": cfg["cmap"].lower(),
+                "rescale": [vmin, vmax],
+                "attribution": cfg["attribution"],
+            })
+            total_bytes += archive.stat().st_size
+
+    skipped = len(cogs) * len(tiles) - written
+    print(f"  {name}: {written} tiles written, {skipped} empty skipped, "
+          f"{total_bytes / 1e6:.1f} MB in {len(cogs)} archives")
+
+    return {
+        "format": "pmtiles",
+        "tile_type": "png",
+        "tile_size": TILE_SIZE,
+        "minzoom": min_zoom,
+        "maxzoom": max_zoom,
+        "bounds": [round(v, 6) for v in bounds],
+        "colormap": cfg["cmap"].lower(),
+        "rescale": [vmin, vmax],
+        "bytes": total_bytes,
+        "frames": [
+            {"date": cog.stem, "url": f"tiles/{name}/{cog.stem}.pmtiles"} for cog in cogs
+        ],
+    }
+
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Bake WebMercator PMTiles pyramids from daily COGs")
+    parser.add_argument("--variable", action="append", choices=list(VARIABLES),
+                        help="Variable to bake, repeatable (default: all)")
+    parser.add_argument("--min-zoom", type=int, default=MIN_ZOOM)
+    parser.add_argument("--max-zoom", type=int, default=MAX_ZOOM)
+    parser.add_argument("--workers", type=int, default=None, help="Render processes (default: all cores)")
+    args = parser.parse_args()
+
+    if not 0 <= args.min_zoom <= args.max_zoom:
+        parser.error("Need 0 ≤ --min-zoom ≤ --max-zoom")
+
+    t0 = time.time()
+    print(f"Baking tile pyramids z{args.min_zoom}–{args.max_zoom}")
+    TILES.mkdir(parents=True, exist_ok=True)
+
+    blocks = {}
+    for name in args.variable or VARIABLES:
+        cfg = VARIABLES[name]
+        block = bake_variable(name, cfg, args.min_zoom, args.max_zoom, args.workers)
+        if block is None:
+            print(f"  {name}: no daily COGs in {COG / name}, skipping")
+            continue
+        blocks[cfg["key"]] = block
+
+    print(f"✓ Baked in {time.time() - t0:.0f}s → {TILES}")
+
+    if not MANIFEST.exists():
+        print(f"⚠ {MANIFEST} not found — run generate-cog-frames.py first; manifest not updated")
+        return
+
+    with open(MANIFEST) as f:
+        manifest = json.load(f)
+    for key, block in blocks.items():
+        manifest.setdefault(key, {})["tiles"] = block
+    with open(MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"✓ Manifest: {MANIFEST}")
+
+
+if __name__ == "__main__":
+    main()
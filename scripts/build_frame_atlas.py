@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Pack each variable's daily raster frames into a few sprite-atlas sheets.
+
+phase4_manifest lists one PNG URL per frame, so preloading a variable costs
+77+ HTTP requests — painful on high-latency mobile connections. This script
+packs all frames of a variable into lossless sheets laid out on a regular
+grid, capped at MAX_SHEET_SIDE px per side so a decoded sheet stays within
+mobile memory/texture limits (77 frames of 700×1060 → 6 sheets at 4096).
+
+The manifest gets an "atlas" block per variable with the sheet URLs and, per
+frame, its pixel rectangle and normalized UV rectangle, so the temporal
+player fetches each sheet once and slices frames with createImageBitmap.
+
+Output: data/raster-frames/<variable>-atlas/sheet-NN.{webp,png}
+        + an "atlas" block per variable in data/frontend/raster-manifest.json
+
+Usage:
+    python scripts/build_frame_atlas.py                  # lossless WebP, 4096 px sheets
+    python scripts/build_frame_atlas.py --format png
+    python scripts/build_frame_atlas.py --max-side 8192  # fewer, larger sheets
+"""
+
+import argparse
+import json
+import math
+from pathlib import Path
+
+from PIL import Image
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+
+ROOT = Path(__file__).resolve().parent.parent
+FRAMES = ROOT / "data" / "raster-frames"
+MANIFEST = ROOT / "data" / "frontend" / "raster-manifest.json"
+
+# Manifest key → raster-frames subdirectory
+VARIABLES = {
+    "soil_moisture": "soil-moisture",
+    "precipitation": "precipitation",
+}
+
+MAX_SHEET_SIDE = 4096
+WEBP_MAX_SIDE = 16383  # libwebp hard limit
+FORMATS = ("webp", "png")
+
+
+# ─── Packing ─────────────────────────────────────────────────────────────────
+
+def grid_layout(n_frames, frame_w, frame_h, max_side):
+    """Columns/rows per sheet and number of sheets for a regular grid."""
+    cols = max_side // frame_w
+    rows = max_side // frame_h
+    if cols < 1 or rows < 1:
+        raise ValueError(f"Frame {frame_w}×{frame_h} does not fit in a {max_side} px sheet")
+    per_sheet = cols * rows
+    n_sheets = math.ceil(n_frames / per_sheet)
+    return cols, rows, per_sheet, n_sheets
+
+
+def save_sheet(img, path, fmt):
+    """Write a sheet losslessly (exact=True keeps RGB under zero alpha)."""
+    if fmt == "webp":
+        img.save(path, format="WEBP", lossless=True, quality=100, method=6, exact=True)
+    else:
+        img.save(path, format="PNG", optimize=True, compress_level=9)
+
+
+def build_atlas(png_dir, out_dir, url_prefix, fmt="webp", max_side=MAX_SHEET_SIDE):
+    """Pack one variable's PNG frames. Returns the manifest "atlas" block."""
+    pngs = sorted(png_dir.glob("*.png"))
+    if not pngs:
+        return None
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for old in out_dir.glob("sheet-*"):
+        old.unlink()
+
+    with Image.open(pngs[0]) as first:
+        frame_w, frame_h = first.size
+    cols, rows, per_sheet, n_sheets = grid_layout(len(pngs), frame_w, frame_h, max_side)
+
+    sheets = []
+    frames = []
+    total_bytes = 0
+    for s in range(n_sheets):
+        chunk = pngs[s * per_sheet:(s + 1) * per_sheet]
+        sheet_cols = min(cols, len(chunk))
+        sheet_rows = math.ceil(len(chunk) / cols)
+        sheet_w, sheet_h = sheet_cols * frame_w, sheet_rows * frame_h
+        sheet = Image.new("RGBA", (sheet_w, sheet_h), (0, 0, 0, 0))
+
+        for k, png in enumerate(chunk):
+            with Image.open(png) as img:
+                if img.size != (frame_w, frame_h):
+                    raise ValueError(f"{png.name}: {img.size}, expected {(frame_w, frame_h)}")
+                x, y = (k % cols) * frame_w, (k // cols) * frame_h
+                sheet.paste(img.convert("RGBA"), (x, y))
+            frames.append({
+                "date": png.stem,
+                "sheet": s,
+                "rect": [x, y, frame_w, frame_h],
+                "uv": [
+                    round(x / sheet_w, 6), round(y / sheet_h, 6),
+                    round((x + frame_w) / sheet_w, 6), round((y + frame_h) / sheet_h, 6),
+                ],
+            })
+
+        path = out_dir / f"sheet-{s:02d}.{fmt}"
+        save_sheet(sheet, path, fmt)
+        size = path.stat().st_size
+        total_bytes += size
+        sheets.append({"url": f"{url_prefix}/{path.name}", "width": sheet_w, "height": sheet_h, "bytes": size})
+
+    png_bytes = sum(p.stat().st_size for p in pngs)
+    print(f"  {png_dir.name}: {len(pngs)} frames → {n_sheets} {fmt} sheet(s) "
+          f"({cols}×{rows} grid), {png_bytes / 1e6:.1f} MB → {total_bytes / 1e6:.1f} MB")
+
+    return {
+        "format": fmt,
+        "max_side": max_side,
+        "frame_width": frame_w,
+        "frame_height": frame_h,
+        "bytes": total_bytes,
+        "sheets": sheets,
+        "frames": frames,
+    }
+
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack raster frames into sprite-atlas sheets")
+    parser.add_argument("--format", choices=FORMATS, default="webp", help="Sheet encoding (lossless)")
+    parser.add_argument("--max-side", type=int, default=MAX_SHEET_SIDE, help="Max sheet width/height in px")
+    args = parser.parse_args()
+
+    if args.format == "webp" and args.max_side > WEBP_MAX_SIDE:
+        parser.error(f"WebP sheets are limited to {WEBP_MAX_SIDE} px per side")
+
+    print(f"Building frame atlases ({args.format}, ≤{args.max_side} px sheets)")
+
+    blocks = {}
+    for key, subdir in VARIABLES.items():
+        block = build_atlas(
+            FRAMES / subdir,
+            FRAMES / f"{subdir}-atlas",
+            f"raster-frames/{subdir}-atlas",
+            fmt=args.format,
+            max_side=args.max_side,
+        )
+        if block is None:
+            print(f"  {subdir}: no PNG frames, skipping")
+            continue
+        blocks[key] = block
+
+    if not MANIFEST.exists():
+        print(f"⚠ {MANIFEST} not found — run generate-cog-frames.py first; manifest not updated")
+        return
+
+    with open(MANIFEST) as f:
+        manifest = json.load(f)
+    for key, block in blocks.items():
+        manifest.setdefault(key, {})["atlas"] = block
+    with open(MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"✓ Manifest: {MANIFEST}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""CDS request planning and concurrent queue submission for the ERA5 fetch scripts.
+
+fetch_era5_synoptic.py and fetch_era5_precip_hourly.py used to call
+`client.retrieve` once per batch, blocking through the whole CDS queue
+wait before the next request was even submitted. This module:
+
+  - plans: splits each (label, request, nc_path) batch so no request
+    exceeds the CDS per-request field limit (variables × days × times),
+    optionally one request per variable (smaller requests tend to leave
+    the CDS queue sooner and fail independently)
+  - submits up to MAX_ACTIVE requests at once without waiting
+    (`wait_until_complete=False`), polls their state every POLL_SECONDS
+    and logs a progress line whenever the queue changes
+  - downloads each request as soon as it completes (thread pool) and
+    hands the NetCDF to the caller's converter on a single thread, so COG
+    conversion overlaps with the remaining queue wait; the converter runs
+    serially because it owns the COG manifest
+
+Batches whose NetCDF is already converted (`skip(nc_path)`) are never
+submitted; batches with a cached NetCDF go straight to the converter.
+
+Usage:
+    from cds_queue import plan, run_queue
+
+    batches = plan(build_requests(), per_variable=True)
+    results = run_queue(batches, convert=process, skip=manifest.done)
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+log = logging.getLogger("era5")
+
+DATASET = "reanalysis-era5-single-levels"
+
+# CDS rejects requests above its cost limit; for ERA5 single levels the
+# limit is counted in fields (one variable at one time step). Stay well under.
+MAX_FIELDS = 60000
+MAX_ACTIVE = 8  # concurrently submitted requests (CDS queues the rest per user anyway)
+POLL_SECONDS = 15
+DOWNLOAD_WORKERS = 3
+
+
+# ---------------------------------------------------------------------------
+# Planning
+# ---------------------------------------------------------------------------
+def request_cost(request):
+    """Number of fields a request retrieves (variables × days × times)."""
+    return len(request["variable"]) * len(request["day"]) * len(request["time"])
+
+
+def _part(label, request, nc_path, suffix, **overrides):
+    return (f"{label}_{suffix}", {**request, **overrides},
+            nc_path.with_name(f"{nc_path.stem}_{suffix}{nc_path.suffix}"))
+
+
+def plan(batches, max_fields=MAX_FIELDS, per_variable=False):
+    """Split (label, request, nc_path) batches into CDS-sized requests.
+
+    A batch that already fits (and is not split per variable) keeps its
+    label and NetCDF path, so existing caches still hit. Split parts get a
+    `_<variable>` and/or `_dDD-DD` suffix on both.
+    """
+    planned = []
+    for label, request, nc_path in batches:
+        parts = [(label, request, nc_path)]
+        if per_variable and len(request["variable"]) > 1:
+            parts = [_part(label, request, nc_path, var, variable=[var])
+                     for var in request["variable"]]
+
+        for part_label, part_req, part_nc in parts:
+            if request_cost(part_req) <= max_fields:
+                planned.append((part_label, part_req, part_nc))
+                continue
+            days = part_req["day"]
+            per_req = max(1, max_fields // (len(part_req["variable"]) * len(part_req["time"])))
+            for i in range(0, len(days), per_req):
+                chunk = days[i:i + per_req]
+                planned.append(_part(part_label, part_req, part_nc,
+                                     f"d{chunk[0]}-{chunk[-1]}", day=chunk))
+
+    if len(planned) != len(batches):
+        log.info("PLAN: %d batches -> %d CDS requests (max %d fields%s)",
+                 len(batches), len(planned), max_fields, ", per variable" if per_variable else "")
+    return planned
+
+
+# ---------------------------------------------------------------------------
+# Queue
+# ---------------------------------------------------------------------------
+def _state(remote):
+    """Refresh and return a submitted request's state (queued/accepted/running/successful/failed)."""
+    remote.update()
+    reply = remote.reply
+    state = reply.get("state", "queued")
+    if state == "failed":
+        error = reply.get("error") or {}
+        raise RuntimeError(error.get("message") or error.get("reason") or "request failed")
+    return "completed" if state == "successful" else state
+
+
+def _download(remote, nc_path: Path):
+    tmp = nc_path.with_name(f".{nc_path.name}.part")
+    remote.download(str(tmp))
+    tmp.replace(nc_path)
+    log.info("  Downloaded: %s (%.1f MB)", nc_path.name, nc_path.stat().st_size / 1e6)
+    return nc_path
+
+
+def run_queue(batches, convert, skip=None, client=None, dataset=DATASET,
+              max_active=MAX_ACTIVE, poll=POLL_SECONDS):
+    """Submit batches concurrently, poll the CDS queue, convert each download as it lands.
+
+    `convert(nc_path, label, request)` turns a downloaded NetCDF into COGs;
+    `skip(nc_path)` returns True for batches already fully converted.
+    Returns {"ok": n, "fail": n}.
+    """
+    results = {"ok": 0, "fail": 0}
+    pending = []
+    converter = ThreadPoolExecutor(max_workers=1)
+    downloader = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+    conversions = []  # (label, future)
+
+    def _convert(nc_path, label, request):
+        convert(nc_path, label, request)
+        return label
+
+    def _fetch_then_convert(remote, label, request, nc_path):
+        _download(remote, nc_path)
+        conversions.append((label, converter.submit(_convert, nc_path, label, request)))
+
+    for label, request, nc_path in batches:
+        if skip is not None and skip(nc_path):
+            log.info("SKIP %s: all COGs already exist", label)
+            results["ok"] += 1
+        elif nc_path.exists():
+            log.info("NC cache hit: %s", nc_path.name)
+            conversions.append((label, converter.submit(_convert, nc_path, label, request)))
+        else:
+            pending.append((label, request, nc_path))
+
+    if pending:
+        if client is None:
+            import cdsapi
+
+            client = cdsapi.Client(wait_until_complete=False)
+
+        total = len(pending)
+        active = {}  # label -> (remote, request, nc_path, submitted_at)
+        downloads = []  # (label, future)
+        last_status = None
+        t0 = time.time()
+
+        while pending or active:
+            while pending and len(active) < max_active:
+                label, request, nc_path = pending.pop(0)
+                try:
+                    remote = client.retrieve(dataset, request)
+                    active[label] = (remote, request, nc_path, time.time())
+                    log.info("SUBMITTED %s (%d fields)", label, request_cost(request))
+                except Exception as e:
+                    log.error("  FAILED to submit %s: %s", label, e)
+                    results["fail"] += 1
+
+            counts = {}
+            for label, (remote, request, nc_path, submitted) in list(active.items()):
+                try:
+                    state = _state(remote)
+                except Exception as e:
+                    log.error("  FAILED %s in CDS queue: %s", label, e)
+                    results["fail"] += 1
+                    del active[label]
+                    continue
+                if state == "completed":
+                    log.info("READY %s after %.0fs in queue", label, time.time() - submitted)
+                    downloads.append((label, downloader.submit(_fetch_then_convert,
+                                                               remote, label, request, nc_path)))
+                    del active[label]
+                else:
+                    counts[state] = counts.get(state, 0) + 1
+
+            status = (tuple(sorted(counts.items())), len(downloads), len(conversions))
+            if status != last_status:
+                queue = ", ".join(f"{n} {state}" for state, n in sorted(counts.items())) or "empty"
+                log.info("QUEUE [%4.0fs]: %s | %d/%d ready | %d waiting to submit",
+                         time.time() - t0, queue, len(downloads), total, len(pending))
+                last_status = status
+            if active:
+                time.sleep(poll)
+
+        for label, future in downloads:
+            try:
+                future.result()
+            except Exception as e:
+                log.error("  FAILED to download %s: %s", label, e)
+                results["fail"] += 1
+
+    downloader.shutdown()
+    for label, future in conversions:
+        try:
+            future.result()
+            results["ok"] += 1
+        except Exception as e:
+            log.error("  FAILED to process %s: %s", label, e)
+            results["fail"] += 1
+    converter.shutdown()
+    return results
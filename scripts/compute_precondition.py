@@ -1,55 +1,305 @@
-"""Dataset 6: Precondition Index — Computed from soil moisture + precipitation"""
-import numpy as np
-import pandas as pd
+"""Dataset 6: Precondition Index — Computed from soil moisture + precipitation
+
+The index used to be computed on the merged long-format table, with a
+Python `classify` call per row and the precip_14d 0.90 quantile taken over
+the whole table on every run. It is now computed on aligned (points × days)
+arrays:
+
+  - sm_rootzone, precip_3d and precip_14d are scattered into (P, D) arrays
+    (P grid points sorted by lat/lon, D days); the index is plain array
+    arithmetic and classes come from one `np.digitize` over RISK_BINS
+  - the normalization quantile (p90 of precip_14d), the point list and the
+    index/class arrays are cached in precondition-state.npz; a run only
+    reads input rows newer than the last cached day and computes those
+    columns, so the daily operational update touches only the new days
+    (--rebuild recomputes everything, including the quantile)
+  - the same pass writes gridded COGs for the new days (one Delaunay
+    triangulation of the points, all days interpolated at once, masked to
+    Portugal) and the frontend frames (precondition-frames.json and
+    precondition-peak.json, same format as parquet_to_frontend_json.py)
+
+Output: data/temporal/precondition/precondition.parquet (+ precondition-state.npz)
+        data/cog/precondition/YYYY-MM-DD.tif
+        data/frontend/precondition-{frames,peak}.json
+
+Usage:
+    python scripts/compute_precondition.py            # append new days (full build the first time)
+    python scripts/compute_precondition.py --rebuild  # recompute all days and the p90
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-# Load the soil moisture and precipitation data
-sm = pd.read_parquet("data/temporal/moisture/soil_moisture.parquet")
-precip = pd.read_parquet("data/temporal/precipitation/precipitation.parquet")
+import numpy as np
+import pandas as pd
+import rasterio
+import shapely
+from rasterio.transform import from_bounds
+from scipy.interpolate import LinearNDInterpolator
+from scipy.spatial import Delaunay
 
-print(f"Soil moisture: {len(sm)} records", flush=True)
-print(f"Precipitation: {len(precip)} records", flush=True)
+# ─── Config ──────────────────────────────────────────────────────────────────
 
-# Merge on date + lat + lon
-df = sm.merge(precip, on=["date", "lat", "lon"], how="inner")
-print(f"Merged: {len(df)} records", flush=True)
+ROOT = Path(__file__).resolve().parent.parent
+DATA = ROOT / "data"
+SM_PATH = DATA / "temporal" / "moisture" / "soil_moisture.parquet"
+PRECIP_PATH = DATA / "temporal" / "precipitation" / "precipitation.parquet"
+OUT_PATH = DATA / "temporal" / "precondition" / "precondition.parquet"
+STATE_PATH = OUT_PATH.with_name("precondition-state.npz")
+COG_DIR = DATA / "cog" / "precondition"
+FRONTEND = DATA / "frontend"
+DISTRICTS = ROOT / "assets" / "districts.geojson"
 
 # Porosity constant (sandy loam typical for Portuguese basins)
 POROSITY = 0.42  # m³/m³
 ROOT_DEPTH_MM = 1000  # 1m root zone in mm
 
-# Compute remaining capacity
-df["remaining_capacity_mm"] = (POROSITY - df["sm_rootzone"]) * ROOT_DEPTH_MM
-df["remaining_capacity_mm"] = df["remaining_capacity_mm"].clip(lower=1.0)  # avoid div/0
-
-# Component 1: Forward-looking — 3-day precip / remaining capacity
-df["ratio_3d"] = df["precip_3d"] / df["remaining_capacity_mm"]
-
-# Component 2: Antecedent wetness (normalized 14-day precip)
-precip_14d_p90 = df["precip_14d"].quantile(0.90)
-df["antecedent_score"] = (df["precip_14d"] / precip_14d_p90).clip(upper=1.0)
-
-# Combined score
-df["precondition_index"] = 0.6 * df["ratio_3d"] + 0.4 * df["antecedent_score"]
-
-# Classification
-def classify(score):
-    if score < 0.3: return "green"
-    elif score < 0.6: return "yellow"
-    elif score < 0.9: return "orange"
-    else: return "red"
-
-df["risk_class"] = df["precondition_index"].apply(classify)
-
-outpath = Path("data/temporal/precondition/precondition.parquet")
-outpath.parent.mkdir(parents=True, exist_ok=True)
-df.to_parquet(outpath)
-print(f"Saved: {outpath}", flush=True)
-print(f"\nRisk class distribution (all dates, all points):", flush=True)
-print(df["risk_class"].value_counts(normalize=True).round(3), flush=True)
-print(f"\nPeak precondition days (>50% of grid in orange/red):", flush=True)
-daily_risk = df.groupby("date")["risk_class"].apply(
-    lambda x: (x.isin(["orange", "red"])).mean()
-).reset_index(name="frac_high_risk")
-peak_days = daily_risk[daily_risk["frac_high_risk"] > 0.5].sort_values("frac_high_risk", ascending=False)
-print(peak_days.head(10), flush=True)
+W_RATIO_3D = 0.6
+W_ANTECEDENT = 0.4
+ANTECEDENT_QUANTILE = 0.90
+
+RISK_BINS = [0.3, 0.6, 0.9]
+RISK_CLASSES = np.array(["green", "yellow", "orange", "red"])
+HIGH_RISK = 2  # orange and above
+
+# Same grid as generate-cog-frames.py
+WEST, SOUTH, EAST, NORTH = -9.6, 36.9, -6.1, 42.2
+PIXEL_SIZE = 0.02
+
+WORKERS = min(8, os.cpu_count() or 1)
+COG_PROFILE = {"driver": "COG", "dtype": "float32", "count": 1, "crs": "EPSG:4326",
+               "nodata": np.nan, "compress": "DEFLATE"}
+
+
+# ─── Index ───────────────────────────────────────────────────────────────────
+
+def precondition(sm, p3, p14, p90):
+    """Components and index for (P, D) arrays of sm_rootzone, precip_3d, precip_14d."""
+    # Component 1: Forward-looking — 3-day precip / remaining capacity (≥ 1 mm, avoid div/0)
+    remaining = np.maximum((POROSITY - sm) * ROOT_DEPTH_MM, 1.0)
+    ratio_3d = p3 / remaining
+    # Component 2: Antecedent wetness (14-day precip normalized by the cached p90)
+    antecedent = np.minimum(p14 / p90, 1.0)
+    index = W_RATIO_3D * ratio_3d + W_ANTECEDENT * antecedent
+    return {"remaining_capacity_mm": remaining, "ratio_3d": ratio_3d,
+            "antecedent_score": antecedent, "precondition_index": index}
+
+
+def classify(index):
+    """Risk class codes 0..3 (green…red); NaN falls in red, as the per-row classify did."""
+    return np.digitize(index, RISK_BINS).astype(np.int8)
+
+
+# ─── Inputs ──────────────────────────────────────────────────────────────────
+
+def load_inputs(after=None):
+    """Merged soil-moisture × precipitation rows, only days after `after` if given."""
+    filters = [("date", ">", pd.Timestamp(after))] if after else None
+    sm = pd.read_parquet(SM_PATH, filters=filters)
+    precip = pd.read_parquet(PRECIP_PATH, filters=filters)
+    print(f"Soil moisture: {len(sm)} records", flush=True)
+    print(f"Precipitation: {len(precip)} records", flush=True)
+    df = sm.merge(precip, on=["date", "lat", "lon"], how="inner")
+    print(f"Merged: {len(df)} records", flush=True)
+    return df
+
+
+def to_arrays(df, points, columns):
+    """Scatter long-format rows into (P, D) arrays; returns (arrays, days, point_idx, day_idx)."""
+    point_idx = points.get_indexer(pd.MultiIndex.from_arrays([df["lat"], df["lon"]]))
+    day_idx, days = pd.factorize(df["date"].dt.normalize(), sort=True)
+    arrays = {}
+    for col in columns:
+        arr = np.full((len(points), len(days)), np.nan, dtype=np.float64)
+        arr[point_idx, day_idx] = df[col].to_numpy(dtype=np.float64)
+        arrays[col] = arr
+    return arrays, days, point_idx, day_idx
+
+
+# ─── State ───────────────────────────────────────────────────────────────────
+
+def load_state():
+    if not STATE_PATH.exists():
+        return None
+    with np.load(STATE_PATH) as z:
+        return {key: z[key] for key in z.files}
+
+
+def save_state(state):
+    tmp = STATE_PATH.with_name(f".{STATE_PATH.stem}.tmp.npz")
+    np.savez_compressed(tmp, **state)
+    os.replace(tmp, STATE_PATH)
+
+
+def state_points(state):
+    return pd.MultiIndex.from_arrays([state["lat"], state["lon"]], names=["lat", "lon"])
+
+
+# ─── Outputs ─────────────────────────────────────────────────────────────────
+
+def portugal_mask(grid_lon, grid_lat):
+    import geopandas as gpd
+
+    polygon = shapely.union_all(gpd.read_file(DISTRICTS).geometry.values)
+    return shapely.contains_xy(polygon, grid_lon, grid_lat)
+
+
+def grid_days(lat, lon, index):
+    """(P, D) point values → (D, rows, cols) north-up grids, one triangulation for all days."""
+    ncols = int(round((EAST - WEST) / PIXEL_SIZE))
+    nrows = int(round((NORTH - SOUTH) / PIXEL_SIZE))
+    fine_lons = WEST + (np.arange(ncols) + 0.5) * PIXEL_SIZE
+    fine_lats = NORTH - (np.arange(nrows) + 0.5) * PIXEL_SIZE
+    grid_lon, grid_lat = np.meshgrid(fine_lons, fine_lats)
+
+    interp = LinearNDInterpolator(Delaunay(np.column_stack([lon, lat])), index)
+    grids = interp(grid_lon, grid_lat)                       # (rows, cols, D)
+    grids[~portugal_mask(grid_lon, grid_lat)] = np.nan
+    return np.moveaxis(grids, -1, 0).astype(np.float32), from_bounds(WEST, SOUTH, EAST, NORTH,
+                                                                     ncols, nrows)
+
+
+def _write_cog(path, data, transform):
+    tmp = path.with_name(f".{path.name}")
+    with rasterio.open(tmp, "w", width=data.shape[1], height=data.shape[0], transform=transform,
+                       **COG_PROFILE) as dst:
+        dst.write(data, 1)
+    os.replace(tmp, path)
+
+
+def write_cogs(dates, grids, transform):
+    COG_DIR.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        for future in [pool.submit(_write_cog, COG_DIR / f"{d}.tif", g, transform)
+                       for d, g in zip(dates, grids)]:
+            future.result()
+    print(f"✓ {len(dates)} COGs → {COG_DIR}", flush=True)
+
+
+def _write_json(name, data):
+    path = FRONTEND / name
+    tmp = path.with_name(f".{name}")
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    return path.stat().st_size / 1024
+
+
+def write_frontend(state):
+    """precondition-frames.json + precondition-peak.json from the cached arrays."""
+    # Drop points that are always zero (ocean/border artefacts), as parquet_to_frontend_json.py
+    keep = state["sm_max"] > 0
+    lat = np.round(state["lat"][keep], 2).tolist()
+    lon = np.round(state["lon"][keep], 2).tolist()
+    index = np.round(state["index"][keep].astype(np.float64), 3)
+    classes = RISK_CLASSES[state["risk"][keep]]
+
+    frames = []
+    for d, date in enumerate(state["dates"]):
+        present = ~np.isnan(index[:, d])
+        frames.append({"date": str(date), "points": [
+            {"lat": lat[i], "lon": lon[i], "index": float(index[i, d]), "risk_class": str(classes[i, d])}
+            for i in np.flatnonzero(present)
+        ]})
+
+    # Peak: highest fraction of points at index ≥ 0.6
+    high = np.where(np.isnan(index), False, index >= RISK_BINS[1])
+    counts = (~np.isnan(index)).sum(axis=0)
+    frac = np.where(counts > 0, high.sum(axis=0) / np.maximum(counts, 1), 0)
+    peak = frames[int(np.argmax(frac))]
+
+    FRONTEND.mkdir(parents=True, exist_ok=True)
+    kb_frames = _write_json("precondition-frames.json", frames)
+    kb_peak = _write_json("precondition-peak.json", {"date": peak["date"], "points": peak["points"]})
+    print(f"✓ Frontend: precondition-frames.json ({len(frames)} frames, {kb_frames:.0f} KB), "
+          f"precondition-peak.json (peak={peak['date']}, {kb_peak:.0f} KB)", flush=True)
+
+
+def write_parquet(df, computed, point_idx, day_idx, append):
+    """Long-format table (input columns + components + risk_class), appended or rewritten."""
+    for col, arr in computed.items():
+        df[col] = arr[point_idx, day_idx]
+    df["risk_class"] = RISK_CLASSES[classify(df["precondition_index"].to_numpy())]
+    if append and OUT_PATH.exists():
+        old = pd.read_parquet(OUT_PATH)
+        df = pd.concat([old[old["date"] < df["date"].min()], df], ignore_index=True)
+    OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = OUT_PATH.with_name(f".{OUT_PATH.name}")
+    df.to_parquet(tmp)
+    os.replace(tmp, OUT_PATH)
+    print(f"Saved: {OUT_PATH} ({len(df)} records)", flush=True)
+
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rebuild", action="store_true",
+                        help="recompute all days and the normalization quantile")
+    args = parser.parse_args()
+
+    state = None if args.rebuild else load_state()
+    after = str(state["dates"][-1]) if state is not None else None
+    df = load_inputs(after)
+    if df.empty:
+        print(f"No new days after {after} — nothing to do", flush=True)
+        return
+
+    points = (state_points(state) if state is not None
+              else pd.MultiIndex.from_frame(df[["lat", "lon"]].drop_duplicates().sort_values(["lat", "lon"])))
+    if state is not None and (points.get_indexer(pd.MultiIndex.from_arrays([df["lat"], df["lon"]])) < 0).any():
+        print("⚠ New grid points in the inputs — rebuilding from scratch", flush=True)
+        state, after = None, None
+        df = load_inputs()
+        points = pd.MultiIndex.from_frame(df[["lat", "lon"]].drop_duplicates().sort_values(["lat", "lon"]))
+
+    arrays, days, point_idx, day_idx = to_arrays(df, points, ["sm_rootzone", "precip_3d", "precip_14d"])
+    dates = np.array(days.strftime("%Y-%m-%d"), dtype=str)
+
+    if state is None:
+        p90 = float(np.nanquantile(arrays["precip_14d"], ANTECEDENT_QUANTILE))
+        print(f"precip_14d p{ANTECEDENT_QUANTILE * 100:.0f}: {p90:.1f} mm", flush=True)
+    else:
+        p90 = float(state["p90"])
+        print(f"Appending {len(dates)} day(s) after {after} (cached p90 {p90:.1f} mm)", flush=True)
+
+    computed = precondition(arrays["sm_rootzone"], arrays["precip_3d"], arrays["precip_14d"], p90)
+    index = computed["precondition_index"].astype(np.float32)
+    risk = classify(index)
+    sm_max = np.nan_to_num(np.fmax.reduce(arrays["sm_rootzone"], axis=1), nan=0)
+
+    if state is None:
+        state = {"lat": points.get_level_values(0).to_numpy(), "lon": points.get_level_values(1).to_numpy(),
+                 "dates": dates, "index": index, "risk": risk, "sm_max": sm_max, "p90": np.float64(p90)}
+    else:
+        state = {**state,
+                 "dates": np.concatenate([state["dates"], dates]),
+                 "index": np.concatenate([state["index"], index], axis=1),
+                 "risk": np.concatenate([state["risk"], risk], axis=1),
+                 "sm_max": np.maximum(state["sm_max"], sm_max)}
+
+    write_parquet(df, computed, point_idx, day_idx, append=after is not None)
+    grids, transform = grid_days(state["lat"], state["lon"], index)
+    write_cogs(dates, grids, transform)
+    write_frontend(state)
+    save_state(state)
+
+    valid = ~np.isnan(state["index"])
+    codes = state["risk"][valid]
+    print(f"\nRisk class distribution (all dates, all points):", flush=True)
+    for code in np.argsort(-np.bincount(codes, minlength=len(RISK_CLASSES))):
+        print(f"  {RISK_CLASSES[code]:<7} {np.mean(codes == code):.3f}", flush=True)
+
+    high = np.where(valid, state["risk"] >= HIGH_RISK, False).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    peak = np.argsort(-high, kind="stable")
+    peak = peak[high[peak] > 0.5][:10]
+    print(f"\nPeak precondition days (>50% of grid in orange/red):", flush=True)
+    for d in peak:
+        print(f"  {state['dates'][d]}  {high[d]:.3f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
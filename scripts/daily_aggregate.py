@@ -0,0 +1,102 @@
+"""Vectorized hourly → daily aggregation for Open-Meteo responses.
+
+Open-Meteo returns hourly series as parallel lists: ISO time strings
+("2026-01-28T13:00") and values with `None` for gaps. Instead of grouping
+hour by hour in Python dicts, the time axis is split into day runs once and
+every statistic is a single `ufunc.reduceat` over those run boundaries.
+When every day has 24 hours (the normal UTC case) a plain reshape is used.
+
+Values can be 1-D (one point) or 2-D (points × hours), so a whole grid of
+points sharing the same time axis aggregates in one call.
+
+Usage:
+    from daily_aggregate import hourly_to_daily
+    dates, daily_mean = hourly_to_daily(hourly["time"], hourly["soil_moisture_0_to_7cm"])
+    dates, daily = hourly_to_daily(times, stack, how=("mean", "max"))  # stack: (n_points, n_hours)
+"""
+
+import numpy as np
+
+STATS = ("mean", "sum", "max", "min")
+
+
+def to_float_array(values):
+    """Convert a (nested) list with `None` gaps to a float64 array with NaN."""
+    return np.array(values, dtype=np.float64)
+
+
+def day_boundaries(times):
+    """Split ISO timestamps into day runs.
+
+    Timestamps must be sorted (as Open-Meteo returns them).
+
+    Returns (dates, starts): the unique YYYY-MM-DD strings and the index of
+    the first hour of each day along the time axis.
+    """
+    days = np.asarray(times, dtype="U10")  # truncates "YYYY-MM-DDTHH:MM" to the date
+    if days.size == 0:
+        return [], np.zeros(0, dtype=np.intp)
+    starts = np.concatenate(([0], np.flatnonzero(days[1:] != days[:-1]) + 1))
+    return days[starts].tolist(), starts
+
+
+def _reduce(ufunc, arr, starts, hours_per_day):
+    """Apply `ufunc` per day along the last axis (reshape fast path if regular)."""
+    if hours_per_day:
+        shaped = arr.reshape(arr.shape[:-1] + (-1, hours_per_day))
+        return ufunc.reduce(shaped, axis=-1)
+    return ufunc.reduceat(arr, starts, axis=-1)
+
+
+def hourly_to_daily(times, values, how="mean"):
+    """Aggregate hourly values to daily statistics, skipping NaN/None.
+
+    Args:
+        times: sequence of ISO timestamps, length n_hours.
+        values: list or array shaped (n_hours,) or (n_points, n_hours).
+        how: one statistic name from STATS, or a tuple of names.
+
+    Returns (dates, result). `result` is an array shaped (n_days,) or
+    (n_points, n_days) when `how` is a string, otherwise a dict keyed by
+    statistic. Days with no valid hours are NaN for every statistic.
+    """
+    names = (how,) if isinstance(how, str) else tuple(how)
+    unknown = [n for n in names if n not in STATS]
+    if unknown:
+        raise ValueError(f"Unknown statistic(s) {unknown}, expected one of {STATS}")
+
+    arr = to_float_array(values)
+    if arr.shape[-1] != len(times):
+        raise ValueError(f"values have {arr.shape[-1]} hours but times has {len(times)}")
+
+    dates, starts = day_boundaries(times)
+    n_hours = arr.shape[-1]
+    counts = np.diff(np.append(starts, n_hours))
+    hours_per_day = int(counts[0]) if counts.size and (counts == counts[0]).all() else 0
+
+    valid = ~np.isnan(arr)
+    n_valid = _reduce(np.add, valid.astype(np.int32), starts, hours_per_day)
+    empty = n_valid == 0
+
+    result = {}
+    if "mean" in names or "sum" in names:
+        total = _reduce(np.add, np.where(valid, arr, 0.0), starts, hours_per_day)
+        if "sum" in names:
+            result["sum"] = np.where(empty, np.nan, total)
+        if "mean" in names:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result["mean"] = np.where(empty, np.nan, total / n_valid)
+    # fmax/fmin ignore NaN unless every hour of the day is NaN
+    if "max" in names:
+        result["max"] = _reduce(np.fmax, arr, starts, hours_per_day)
+    if "min" in names:
+        result["min"] = _reduce(np.fmin, arr, starts, hours_per_day)
+
+    if isinstance(how, str):
+        return dates, result[how]
+    return dates, {n: result[n] for n in names}
+
+
+def nan_to_none(arr):
+    """Array → list with NaN replaced by `None` (JSON-friendly)."""
+    return [None if np.isnan(v) else float(v) for v in np.asarray(arr, dtype=np.float64)]
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""Derive packed wind textures, speed and direction from the wind-u/wind-v COGs.
+
+wind-u and wind-v are separate float32 COGs per hour, so the frontend
+(`compositeUV` in weather-layers.ts) fetches two files and interleaves them
+on every frame change, and the analysis scripts recompute speed/direction
+per timestep. This script derives everything once, over the whole stack:
+
+  - u and v of every paired timestep are read in parallel into (T, H, W)
+    stacks; speed and meteorological direction are computed in bulk over
+    the stacks and saved as .npy cubes (memory-mappable, see `open_cube`)
+  - one shared quantization range [-R, R] for the source (max |u|, |v|
+    over the stack, rounded up to RANGE_STEP m/s so it rarely changes
+    between runs), recorded in the manifest as scale/offset per encoding:
+      value = offset + code × scale
+  - per timestep, written by a thread pool:
+      raster-frames/wind-uv/<t>.png   RGBA uint8, R=u, G=v, A=0 for nodata
+                                      (GPU particle layers, imageUnscale)
+      cog/wind-uv/<t>.tif             2-band uint16 COG, nodata 65535
+      cog/wind-speed/<t>.tif          float32 COG, m/s
+      cog/wind-direction/<t>.tif      float32 COG, degrees the wind blows FROM
+
+Timesteps whose outputs exist are skipped unless the range changed (or
+--force).
+
+Output: the files above + data/temporal/era5/cubes/<source>/{u,v,speed,direction}.npy
+        + data/frontend/wind-manifest.json
+
+Usage:
+    python scripts/derive_wind_fields.py                  # ERA5 (data/cog/wind-{u,v})
+    python scripts/derive_wind_fields.py --source arpege  # data/cog/arpege/wind-{u,v}
+    python scripts/derive_wind_fields.py --force
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+from frame_encoder import encode_frame
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+
+ROOT = Path(__file__).resolve().parent.parent
+DATA = ROOT / "data"
+CUBES = DATA / "temporal" / "era5" / "cubes"
+MANIFEST = DATA / "frontend" / "wind-manifest.json"
+
+# Source → COG root (holding wind-u/, wind-v/) and packed PNG texture directory
+SOURCES = {
+    "era5": {"cog": DATA / "cog", "png": DATA / "raster-frames" / "wind-uv"},
+    "arpege": {"cog": DATA / "cog" / "arpege", "png": DATA / "raster-frames" / "arpege-wind-uv"},
+}
+
+RANGE_STEP = 5.0  # m/s
+UINT8_MAX = 255
+UINT16_NODATA = 65535
+UINT16_MAX = UINT16_NODATA - 1
+WORKERS = min(8, os.cpu_count() or 1)
+
+COG_PROFILE = {"driver": "COG", "compress": "LZW"}
+
+
+# ─── Derivation ──────────────────────────────────────────────────────────────
+
+def wind_speed(u, v):
+    return np.hypot(u, v)
+
+
+def wind_direction(u, v):
+    """Meteorological wind direction: direction FROM which wind blows, 0=N, 90=E."""
+    return (270 - np.degrees(np.arctan2(v, u))) % 360
+
+
+def texture_range(u, v, step=RANGE_STEP):
+    """Symmetric component range R (m/s) covering the whole stack, rounded up to `step`."""
+    peak = max(float(np.nanmax(np.abs(u))), float(np.nanmax(np.abs(v))), step)
+    return math.ceil(peak / step) * step
+
+
+def encoding(vrange, levels):
+    """scale/offset such that value = offset + code × scale maps codes 0..levels onto [-R, R]."""
+    return {"scale": 2 * vrange / levels, "offset": -vrange}
+
+
+def quantize(x, vrange, levels):
+    """Float components → integer codes 0..levels (NaN → 0; callers mask separately)."""
+    codes = np.rint((np.clip(x, -vrange, vrange) + vrange) * (levels / (2 * vrange)))
+    return np.nan_to_num(codes, nan=0)
+
+
+# ─── I/O ─────────────────────────────────────────────────────────────────────
+
+def paired_timestamps(cog_root):
+    """Timestamps present in both wind-u/ and wind-v/."""
+    u = {p.stem for p in (cog_root / "wind-u").glob("*.tif")}
+    v = {p.stem for p in (cog_root / "wind-v").glob("*.tif")}
+    return sorted(u & v)
+
+
+def _read(path):
+    with rasterio.open(path) as ds:
+        return ds.read(1).astype(np.float32), ds.transform, ds.crs
+
+
+def read_components(cog_root, timestamps, pool):
+    """(u, v) stacks of shape (T, H, W) plus the grid transform and CRS."""
+    u_jobs = [pool.submit(_read, cog_root / "wind-u" / f"{t}.tif") for t in timestamps]
+    v_jobs = [pool.submit(_read, cog_root / "wind-v" / f"{t}.tif") for t in timestamps]
+    u = np.stack([job.result()[0] for job in u_jobs])
+    v = np.stack([job.result()[0] for job in v_jobs])
+    _, transform, crs = u_jobs[0].result()
+    return u, v, transform, crs
+
+
+def save_cubes(out_dir, cubes, timestamps, transform, crs):
+    """Write each (T, H, W) cube as .npy plus a cube.json with its time axis and grid."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, cube in cubes.items():
+        tmp = out_dir / f".{name}.npy"
+        np.save(tmp, cube.astype(np.float32))
+        os.replace(tmp, out_dir / f"{name}.npy")
+    meta = {
+        "timestamps": timestamps,
+        "shape": list(next(iter(cubes.values())).shape),
+        "transform": list(transform)[:6],
+        "crs": str(crs),
+        "variables": sorted(cubes),
+    }
+    with open(out_dir / "cube.json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def open_cube(name, source="era5"):
+    """Memory-mapped (T, H, W) cube written by this script, plus its cube.json metadata."""
+    out_dir = CUBES / source
+    with open(out_dir / "cube.json") as f:
+        meta = json.load(f)
+    return np.load(out_dir / f"{name}.npy", mmap_mode="r"), meta
+
+
+def _write_cog(path, bands, transform, crs, nodata):
+    tmp = path.with_name(f".{path.name}")
+    with rasterio.open(tmp, "w", width=bands.shape[2], height=bands.shape[1], count=bands.shape[0],
+                       dtype=bands.dtype, transform=transform, crs=crs, nodata=nodata,
+                       **COG_PROFILE) as dst:
+        dst.write(bands)
+    os.replace(tmp, path)
+
+
+def _write_png(path, rgba):
+    tmp = path.with_name(f".{path.name}")
+    encode_frame(rgba, tmp, fmt="png")
+    os.replace(tmp, path)
+
+
+def write_timestep(paths, u, v, speed, direction, vrange, transform, crs):
+    """All four outputs of one timestep."""
+    valid = np.isfinite(u) & np.isfinite(v)
+
+    rgba = np.zeros((*u.shape, 4), dtype=np.uint8)
+    rgba[..., 0] = quantize(u, vrange, UINT8_MAX)
+    rgba[..., 1] = quantize(v, vrange, UINT8_MAX)
+    rgba[..., 3] = np.where(valid, 255, 0)
+    _write_png(paths["png"], rgba)
+
+    uv = np.stack([quantize(u, vrange, UINT16_MAX), quantize(v, vrange, UINT16_MAX)])
+    uv = np.where(valid, uv, UINT16_NODATA).astype(np.uint16)
+    _write_cog(paths["uv"], uv, transform, crs, UINT16_NODATA)
+
+    _write_cog(paths["speed"], speed[None].astype(np.float32), transform, crs, np.nan)
+    _write_cog(paths["direction"], direction[None].astype(np.float32), transform, crs, np.nan)
+
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def derive(source, previous=None, workers=WORKERS, force=False):
+    """Derive all outputs for one source; returns its manifest block (None if no input).
+
+    `previous` is the source's existing manifest block, used to detect a range change.
+    """
+    cfg = SOURCES[source]
+    cog_root = cfg["cog"]
+    timestamps = paired_timestamps(cog_root)
+    if not timestamps:
+        print(f"⚠ No paired wind-u/wind-v COGs in {cog_root}")
+        return None
+
+    out_dirs = {"png": cfg["png"], "uv": cog_root / "wind-uv",
+                "speed": cog_root / "wind-speed", "direction": cog_root / "wind-direction"}
+    for d in out_dirs.values():
+        d.mkdir(parents=True, exist_ok=True)
+    ext = {"png": ".png", "uv": ".tif", "speed": ".tif", "direction": ".tif"}
+
+    previous_range = (previous or {}).get("texture", {}).get("range")
+
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        u, v, transform, crs = read_components(cog_root, timestamps, pool)
+        print(f"  Read {len(timestamps)} timesteps {u.shape[1]}×{u.shape[2]} in {time.time() - t0:.1f}s")
+
+        # Bulk derivation over the whole (T, H, W) stack
+        speed = wind_speed(u, v)
+        direction = wind_direction(u, v)
+        vrange = texture_range(u, v)
+        save_cubes(CUBES / source, {"u": u, "v": v, "speed": speed, "direction": direction},
+                   timestamps, transform, crs)
+
+        rewrite = force or previous_range != [-vrange, vrange]
+        jobs, skipped = [], 0
+        for i, t in enumerate(timestamps):
+            paths = {key: d / f"{t}{ext[key]}" for key, d in out_dirs.items()}
+            if not rewrite and all(p.exists() for p in paths.values()):
+                skipped += 1
+                continue
+            jobs.append(pool.submit(write_timestep, paths, u[i], v[i], speed[i], direction[i],
+                                    vrange, transform, crs))
+        for job in jobs:
+            job.result()
+
+    print(f"✓ {source}: wrote {len(jobs)} timesteps, skipped {skipped} "
+          f"(range ±{vrange:g} m/s) in {time.time() - t0:.1f}s")
+
+    left, top = transform.c, transform.f
+    right = left + transform.a * u.shape[2]
+    bottom = top + transform.e * u.shape[1]
+    rel = {key: d.relative_to(DATA).as_posix() + "/" for key, d in out_dirs.items()}
+    return {
+        "bounds": [left, bottom, right, top],
+        "width": u.shape[2],
+        "height": u.shape[1],
+        "timestamps": timestamps,
+        "texture": {
+            "png_dir": rel["png"],
+            "cog_dir": rel["uv"],
+            "bands": ["u", "v"],
+            "units": "m/s",
+            "range": [-vrange, vrange],
+            "uint8": encoding(vrange, UINT8_MAX),
+            "uint16": {**encoding(vrange, UINT16_MAX), "nodata": UINT16_NODATA},
+        },
+        "speed": {"cog_dir": rel["speed"], "units": "m/s",
+                  "min": round(float(np.nanmin(speed)), 2), "max": round(float(np.nanmax(speed)), 2)},
+        "direction": {"cog_dir": rel["direction"], "units": "degrees",
+                      "convention": "meteorological (direction wind blows from, 0=N, 90=E)"},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--source", choices=sorted(SOURCES), nargs="+", default=["era5"])
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--force", action="store_true", help="rewrite existing outputs")
+    args = parser.parse_args()
+
+    manifest = {}
+    if MANIFEST.exists():
+        with open(MANIFEST) as f:
+            manifest = json.load(f)
+
+    updated = False
+    for source in args.source:
+        block = derive(source, manifest.get(source), args.workers, args.force)
+        if block is not None:
+            manifest[source] = block
+            updated = True
+
+    if updated:
+        MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+        with open(MANIFEST, "w") as f:
+            json.dump(manifest, f, indent=2)
+        print(f"✓ Manifest: {MANIFEST}")
+
+
+if __name__ == "__main__":
+    main()
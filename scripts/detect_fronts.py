@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""Automated frontal-zone detection over the whole MSLP / 10 m wind archive.
+
+analyze_frontal_positions.py looks at four hand-picked timesteps. This
+script runs the same idea — fronts sit on ridges of the pressure-gradient
+magnitude with a cyclonic wind shift — over every timestep, vectorized
+over chunks of the memory-mapped (T, H, W) cubes:
+
+  - lon/lat and the metric grid spacing are computed once from the affine
+    (`lonlat_grid`); MSLP is stacked into a .npy cube next to the wind
+    cubes written by derive_wind_fields.py (built once, then memory-mapped)
+  - |∇p| in hPa/100 km per pixel; ridge pixels are local maxima of |∇p|
+    across the isobars (non-maximum suppression along ∇p, 4 direction bins)
+  - candidates per timestep are the TOP_K strongest gradients, selected
+    with one `argpartition` over the chunk, above MIN_GRADIENT, on a ridge
+    and with cyclonic relative vorticity (ζ = ∂v/∂x − ∂u/∂y > 0)
+  - the candidate mask is closed over 1 px gaps and thinned (Zhang–Suen,
+    all frames of a chunk at once); each skeleton is traced into ordered
+    polylines, simplified, and kept if longer than MIN_LENGTH_KM
+
+The thermal front parameter needs a temperature field (θ or T850), which
+the archive does not hold, so detection uses the MSLP gradient ridge.
+
+Output: data/qgis/fronts-auto.geojson — one LineString per front and
+        timestep, with "datetime", length and gradient/vorticity stats
+
+Usage:
+    python scripts/derive_wind_fields.py   # wind cubes (once)
+    python scripts/detect_fronts.py
+    python scripts/detect_fronts.py --start 2026-01-26 --end 2026-01-31 --top-k 300
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import shapely
+from scipy import ndimage
+
+from analyze_frontal_positions import lonlat_grid
+from derive_wind_fields import CUBES, SOURCES, open_cube
+from feature_writer import FeatureWriter
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+
+ROOT = Path(__file__).resolve().parent.parent
+OUT = ROOT / "data" / "qgis" / "fronts-auto.geojson"
+
+KM_PER_DEG = 111.2
+TOP_K = 400             # strongest-gradient pixels considered per timestep
+MIN_GRADIENT = 1.0      # hPa / 100 km
+MIN_LENGTH_KM = 500.0
+SIMPLIFY_DEG = 0.25
+CHUNK = 48              # timesteps per vectorized chunk
+WORKERS = min(8, os.cpu_count() or 1)
+
+# Non-maximum suppression: ∇p direction bin → (row, col) offset of the neighbours compared
+NMS_OFFSETS = [(0, 1), (1, 1), (1, 0), (1, -1)]
+
+NEIGHBOURS_8 = np.ones((3, 3), dtype=bool)
+
+
+# ─── Grids and cubes ─────────────────────────────────────────────────────────
+
+def grid_spacing_km(transform, height, width):
+    """(dx, dy) pixel spacing in km: dx per row (H, 1), dy scalar."""
+    _, lats = lonlat_grid(transform, height, width)
+    dx = abs(transform.a) * KM_PER_DEG * np.cos(np.radians(lats[:, :1]))
+    dy = abs(transform.e) * KM_PER_DEG
+    return dx, dy
+
+
+def _read_band(path):
+    if not path.exists():
+        return None
+    with rasterio.open(path) as ds:
+        return ds.read(1).astype(np.float32)
+
+
+def mslp_cube(source, meta, workers=WORKERS):
+    """Memory-mapped MSLP cube (hPa) on the wind cubes' time axis, built on first use."""
+    path = CUBES / source / "mslp.npy"
+    meta_path = CUBES / source / "cube.json"
+    if path.exists() and path.stat().st_mtime >= meta_path.stat().st_mtime:
+        return np.load(path, mmap_mode="r")
+
+    mslp_dir = SOURCES[source]["cog"] / "mslp"
+    tmp = path.with_name(".mslp.npy")
+    cube = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=tuple(meta["shape"]))
+    missing = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, frame in enumerate(pool.map(_read_band, (mslp_dir / f"{t}.tif" for t in meta["timestamps"]))):
+            if frame is None:
+                cube[i] = np.nan
+                missing += 1
+            else:
+                # ERA5 msl is in Pa; ARPEGE pressure_msl already in hPa
+                cube[i] = frame / 100 if np.nanmedian(frame) > 2000 else frame
+    cube.flush()
+    del cube
+    os.replace(tmp, path)
+    print(f"  MSLP cube: {len(meta['timestamps'])} timesteps ({missing} missing) → {path}")
+    return np.load(path, mmap_mode="r")
+
+
+# ─── Detection (vectorized over a (T, H, W) chunk) ───────────────────────────
+
+def pressure_gradient(p, dx, dy):
+    """∂p/∂x, ∂p/∂y (northward) and |∇p| in hPa/100 km for a (T, H, W) stack."""
+    d_row, d_col = np.gradient(p, axis=(1, 2))
+    gx = d_col / dx * 100
+    gy = -d_row / dy * 100  # rows run southward
+    return gx, gy, np.hypot(gx, gy)
+
+
+def relative_vorticity(u, v, dx, dy):
+    """ζ = ∂v/∂x − ∂u/∂y in 1e-5 s⁻¹ for (T, H, W) stacks of m/s."""
+    dv_col = np.gradient(v, axis=2)
+    du_row = np.gradient(u, axis=1)
+    return (dv_col / (dx * 1000) + du_row / (dy * 1000)) * 1e5
+
+
+def ridge_mask(grad, gx, gy):
+    """Pixels where |∇p| is a local maximum across the isobars (along ∇p)."""
+    # ∇p direction in (row, col) space, folded to [0, π) and binned to 0/45/90/135°
+    angle = np.arctan2(-gy, gx) % np.pi
+    bins = np.rint(angle / (np.pi / 4)).astype(np.int8) % 4
+    g = np.nan_to_num(grad, nan=-np.inf)
+    padded = np.pad(g, ((0, 0), (1, 1), (1, 1)), constant_values=-np.inf)
+    h, w = g.shape[1:]
+    ridge = np.zeros(g.shape, dtype=bool)
+    for b, (dr, dc) in enumerate(NMS_OFFSETS):
+        ahead = padded[:, 1 + dr:1 + dr + h, 1 + dc:1 + dc + w]
+        behind = padded[:, 1 - dr:1 - dr + h, 1 - dc:1 - dc + w]
+        ridge |= (bins == b) & (g >= ahead) & (g >= behind)
+    return ridge
+
+
+def top_k_mask(grad, k):
+    """Mask of the k largest values of each frame of a (T, H, W) stack."""
+    flat = np.nan_to_num(grad, nan=-np.inf).reshape(len(grad), -1)
+    k = min(k, flat.shape[1])
+    idx = np.argpartition(flat, -k, axis=1)[:, -k:]
+    mask = np.zeros(flat.shape, dtype=bool)
+    np.put_along_axis(mask, idx, True, axis=1)
+    return mask.reshape(grad.shape)
+
+
+def skeletonize(mask):
+    """Zhang–Suen thinning of a (T, H, W) boolean stack, all frames at once."""
+    img = np.pad(mask, ((0, 0), (1, 1), (1, 1))).astype(np.uint8)
+    c = img[:, 1:-1, 1:-1]
+    while True:
+        changed = False
+        for step in (0, 1):
+            p = [img[:, :-2, 1:-1], img[:, :-2, 2:], img[:, 1:-1, 2:], img[:, 2:, 2:],
+                 img[:, 2:, 1:-1], img[:, 2:, :-2], img[:, 1:-1, :-2], img[:, :-2, :-2]]
+            n = sum(q.astype(np.int8) for q in p)
+            a = sum(((p[i] == 0) & (p[(i + 1) % 8] == 1)).astype(np.int8) for i in range(8))
+            p2, p4, p6, p8 = p[0], p[2], p[4], p[6]
+            if step == 0:
+                cond = (p2 * p4 * p6 == 0) & (p4 * p6 * p8 == 0)
+            else:
+                cond = (p2 * p4 * p8 == 0) & (p2 * p6 * p8 == 0)
+            remove = (c == 1) & (n >= 2) & (n <= 6) & (a == 1) & cond
+            if remove.any():
+                c[remove] = 0
+                changed = True
+        if not changed:
+            return c.astype(bool)
+
+
+def trace_paths(skel):
+    """Ordered (row, col) pixel paths along a thin 8-connected skeleton (one frame)."""
+    pixels = set(zip(*map(np.ndarray.tolist, np.nonzero(skel))))
+
+    def neighbours(p):
+        r, c = p
+        return [(r + dr, c + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)
+                if (dr or dc) and (r + dr, c + dc) in pixels]
+
+    # Start from endpoints so each front is traced end to end; loops/branches come last
+    starts = sorted(pixels, key=lambda p: (len(neighbours(p)) != 1, p))
+    visited, paths = set(), []
+    for start in starts:
+        if start in visited:
+            continue
+        path, cur = [start], start
+        visited.add(start)
+        while True:
+            ahead = [q for q in neighbours(cur) if q not in visited]
+            if not ahead:
+                break
+            # Prefer edge neighbours over diagonals so corners are not cut
+            cur = min(ahead, key=lambda q: abs(q[0] - cur[0]) + abs(q[1] - cur[1]))
+            visited.add(cur)
+            path.append(cur)
+        paths.append(path)
+    return paths
+
+
+def path_length_km(lons, lats):
+    dlon = np.diff(lons) * np.cos(np.radians((lats[1:] + lats[:-1]) / 2))
+    return float(np.hypot(dlon, np.diff(lats)).sum() * KM_PER_DEG)
+
+
+def detect_chunk(p, u, v, transform, top_k, min_gradient):
+    """Front skeletons plus |∇p| and ζ for a (T, H, W) chunk."""
+    dx, dy = grid_spacing_km(transform, *p.shape[1:])
+    gx, gy, grad = pressure_gradient(p, dx, dy)
+    vort = relative_vorticity(u, v, dx, dy)
+    fronts = (top_k_mask(grad, top_k) & (grad >= min_gradient)
+              & ridge_mask(grad, gx, gy) & (vort > 0))
+    closed = ndimage.binary_closing(fronts, structure=NEIGHBOURS_8[None]) | fronts
+    return skeletonize(closed), grad, vort
+
+
+def front_features(timestamp, skel, grad, vort, transform, min_length_km):
+    """(properties, geometry) per front traced from one frame's skeleton."""
+    lons, lats = lonlat_grid(transform, *skel.shape)
+    features = []
+    for path in trace_paths(skel):
+        if len(path) < 2:
+            continue
+        rows, cols = np.array(path).T
+        length = path_length_km(lons[rows, cols], lats[rows, cols])
+        if length < min_length_km:
+            continue
+        line = shapely.simplify(shapely.linestrings(lons[rows, cols], lats[rows, cols]), SIMPLIFY_DEG)
+        g, z = grad[rows, cols], vort[rows, cols]
+        features.append(({
+            "datetime": f"{timestamp}:00:00Z",
+            "length_km": round(length),
+            "mean_gradient_hpa_100km": round(float(np.nanmean(g)), 2),
+            "max_gradient_hpa_100km": round(float(np.nanmax(g)), 2),
+            "mean_vorticity_1e5_s": round(float(np.nanmean(z)), 2),
+        }, shapely.geometry.mapping(shapely.set_precision(line, 1e-4))))
+    return features
+
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--source", choices=sorted(SOURCES), default="era5")
+    parser.add_argument("--start", help="first timestamp (YYYY-MM-DD[THH])")
+    parser.add_argument("--end", help="last timestamp, inclusive (YYYY-MM-DD[THH])")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--min-gradient", type=float, default=MIN_GRADIENT, help="hPa/100 km")
+    parser.add_argument("--min-length", type=float, default=MIN_LENGTH_KM, help="km")
+    parser.add_argument("--out", type=Path, default=OUT)
+    args = parser.parse_args()
+
+    t0 = time.time()
+    if not (CUBES / args.source / "cube.json").exists():
+        print(f"⚠ No wind cubes in {CUBES / args.source} — run derive_wind_fields.py first")
+        return
+    u, meta = open_cube("u", args.source)
+    v, _ = open_cube("v", args.source)
+    p = mslp_cube(args.source, meta)
+    transform = rasterio.Affine(*meta["transform"])
+
+    timestamps = meta["timestamps"]
+    selected = [i for i, t in enumerate(timestamps)
+                if (not args.start or t >= args.start) and (not args.end or t[:len(args.end)] <= args.end)]
+    if not selected:
+        print("⚠ No timesteps in the requested range")
+        return
+    first, last = selected[0], selected[-1] + 1
+    print(f"Detecting fronts over {last - first} timesteps "
+          f"({timestamps[first]} → {timestamps[last - 1]}), grid {p.shape[1]}×{p.shape[2]}")
+
+    members = {"metadata": {
+        "method": "MSLP gradient ridge (top-k argpartition, NMS across isobars, "
+                  "cyclonic vorticity, Zhang–Suen skeleton)",
+        "source": args.source,
+        "top_k": args.top_k,
+        "min_gradient_hpa_100km": args.min_gradient,
+        "min_length_km": args.min_length,
+        "script": "scripts/detect_fronts.py",
+    }}
+    per_step = []
+    with FeatureWriter(args.out, members=members) as writer:
+        for start in range(first, last, CHUNK):
+            stop = min(start + CHUNK, last)
+            skel, grad, vort = detect_chunk(np.asarray(p[start:stop]), np.asarray(u[start:stop]),
+                                            np.asarray(v[start:stop]), transform,
+                                            args.top_k, args.min_gradient)
+            for j in range(stop - start):
+                features = front_features(timestamps[start + j], skel[j], grad[j], vort[j],
+                                          transform, args.min_length)
+                for properties, geometry in features:
+                    writer.write(properties, geometry)
+                per_step.append(len(features))
+
+    counts = np.array(per_step)
+    print(f"✓ {counts.sum()} fronts over {len(counts)} timesteps "
+          f"({(counts > 0).sum()} with ≥1 front, max {counts.max()}) in {time.time() - t0:.1f}s")
+    print(f"✓ {args.out}")
+
+
+if __name__ == "__main__":
+    main()
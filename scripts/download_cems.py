@@ -5,29 +5,44 @@ Downloads and processes all Portuguese CEMS flood extent data.
 
 Queries the CEMS Rapid Mapping API for EMSR861 and EMSR864,
 identifies Portuguese AOIs with downloadable products,
-downloads ZIPs, extracts observedEventA shapefiles,
-converts to enriched GeoJSON, and rebuilds merged files.
+downloads ZIPs (streamed, resumable, ETag-revalidated) and reads the
+observedEventA shapefiles straight out of them via /vsizip/, one product
+per worker process. New products are upserted into the GeoParquet store
+(flood_store.py; products already stored are revalidated by ETag and only
+re-processed if the ZIP changed), from which the
+merged GeoJSON files are rebuilt; the combined extent is tiled to
+combined.pmtiles (layer "flood-extent") and per-zoom simplified tiers go
+to combined-generalized.parquet (generalize.py).
 
 Run: source .venv/bin/activate && python scripts/download_cems.py
 """
 
+import fnmatch
 import json
 import os
 import shutil
-import subprocess
+import urllib.error
 import urllib.request
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import geopandas as gpd
 import pandas as pd
 
+from flood_store import KEY, STORE, area_ha, load, product_keys, upsert
+from generalize import write_tiers
+from vector_tiles import VectorLayer, write_pmtiles
+
 # ── Config ────────────────────────────────────────────────────────────────────
 
 BASE_DIR = Path(__file__).resolve().parent.parent / "data" / "flood-extent"
 API_BASE = "https://rapidmapping.emergency.copernicus.eu/backend/dashboard-api/public-activations/"
 DL_BASE = "https://rapidmapping.emergency.copernicus.eu/backend"
 
+WORKERS = 6  # products downloaded + processed concurrently
+CHUNK_SIZE = 1 << 20  # streamed download write size
+
 ACTIVATIONS = {
     "EMSR861": "Kristin",
     "EMSR864": "Leonardo/Marta",
@@ -106,53 +121,106 @@ def fetch_activation(code: str) -> dict:
     return data
 
 
-def download_file(url: str, dest: Path) -> bool:
-    """Download a file with progress indication."""
+def _etag_path(path: Path) -> Path:
+    return path.with_name(path.name + ".etag")
+
+
+def zip_path_for(activation: str, aoi_num: int, prod_code: str, version: int) -> Path:
+    return BASE_DIR / f"{activation}_AOI{aoi_num:02d}_{prod_code}_v{version}.zip"
+
+
+def download_file(url: str, dest: Path, tag: str) -> str | None:
+    """Stream a file to disk; resumes partial downloads and revalidates by ETag.
+
+    Returns "saved", "unchanged" (304, or an existing file without an ETag
+    to revalidate) or None on failure.
+
+    A finished download keeps its ETag in a `<name>.etag` sidecar and is
+    revalidated with If-None-Match (304 → keep). An interrupted one is left
+    as `<name>.part` (+ its ETag) and resumed with a Range request; If-Range
+    makes the server send the whole file instead if it changed meanwhile.
+    A 416 on resume means the part is already complete (finalized if its
+    size matches the server's) or unusable (deleted and downloaded again).
+    """
+    etag_file = _etag_path(dest)
+    part = dest.with_name(dest.name + ".part")
+    part_etag_file = _etag_path(part)
+
+    headers = {"User-Agent": "cheias-pt/1.0"}
     if dest.exists():
-        print(f"    Already exists: {dest.name}")
-        return True
-    print(f"    Downloading: {url}")
+        if not etag_file.exists():
+            print(f"    {tag}: already exists")
+            return "unchanged"
+        headers["If-None-Match"] = etag_file.read_text().strip()
+    elif part.exists() and part_etag_file.exists():
+        headers["Range"] = f"bytes={part.stat().st_size}-"
+        headers["If-Range"] = part_etag_file.read_text().strip()
+
     try:
-        req = urllib.request.Request(url)
+        req = urllib.request.Request(url, headers=headers)
         with urllib.request.urlopen(req, timeout=120) as resp:
-            total = int(resp.headers.get("Content-Length", 0))
-            data = resp.read()
-            dest.write_bytes(data)
-            size_mb = len(data) / (1024 * 1024)
-            print(f"    Saved: {dest.name} ({size_mb:.1f} MB)")
-            return True
+            etag = resp.headers.get("ETag")
+            resumed = resp.status == 206
+            offset = part.stat().st_size if resumed else 0
+            if etag:
+                part_etag_file.write_text(etag)
+            length = resp.headers.get("Content-Length")
+            with open(part, "ab" if resumed else "wb") as fp:
+                shutil.copyfileobj(resp, fp, CHUNK_SIZE)
+                received = fp.tell() - offset
+            if length is not None and received != int(length):
+                raise IOError(f"connection closed after {received} of {length} bytes")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            print(f"    {tag}: unchanged (ETag)")
+            return "unchanged"
+        if e.code == 416 and "Range" in headers:
+            # Content-Range: bytes */<total size>
+            total = (e.headers.get("Content-Range") or "").rpartition("/")[2]
+            if total.isdigit() and int(total) == part.stat().st_size:
+                offset, resumed = int(total), True
+            else:
+                print(f"    {tag}: partial download does not match the server, restarting")
+                part.unlink()
+                part_etag_file.unlink(missing_ok=True)
+                return download_file(url, dest, tag)
+        else:
+            print(f"    {tag}: FAILED: {e}")
+            return None
     except Exception as e:
-        print(f"    FAILED: {e}")
-        return False
-
-
-def extract_zip(zip_path: Path) -> Path:
-    """Extract ZIP to directory, return extraction path."""
-    extract_dir = zip_path.with_suffix("")
-    if extract_dir.exists():
-        print(f"    Already extracted: {extract_dir.name}")
-        return extract_dir
-    print(f"    Extracting: {zip_path.name}")
-    with zipfile.ZipFile(zip_path, "r") as zf:
-        zf.extractall(extract_dir)
-    return extract_dir
-
-
-def find_observed_event_shp(extract_dir: Path) -> Path | None:
-    """Find the observedEventA shapefile in extracted product."""
-    for shp in extract_dir.rglob("*observedEventA*.shp"):
-        return shp
-    # Some products use different naming
-    for shp in extract_dir.rglob("*observed_event*.shp"):
-        return shp
+        print(f"    {tag}: FAILED: {e} (partial download kept for resume)")
+        return None
+
+    os.replace(part, dest)
+    if part_etag_file.exists():
+        os.replace(part_etag_file, etag_file)
+    size_mb = dest.stat().st_size / (1024 * 1024)
+    resumed_mb = offset / (1024 * 1024)
+    note = f", resumed at {resumed_mb:.1f} MB" if resumed else ""
+    print(f"    {tag}: saved {dest.name} ({size_mb:.1f} MB{note})")
+    return "saved"
+
+
+def find_member(zip_path: Path, *patterns: str) -> str | None:
+    """GDAL /vsizip/ path of the first .shp in the ZIP matching any pattern."""
+    with zipfile.ZipFile(zip_path) as zf:
+        names = zf.namelist()
+    for pattern in patterns:
+        for name in names:
+            if fnmatch.fnmatch(Path(name).name, pattern):
+                return f"/vsizip/{zip_path}/{name}"
     return None
 
 
-def find_image_footprint_shp(extract_dir: Path) -> Path | None:
+def find_observed_event_shp(zip_path: Path) -> str | None:
+    """Find the observedEventA shapefile inside a product ZIP."""
+    # Some products use different naming
+    return find_member(zip_path, "*observedEventA*.shp", "*observed_event*.shp")
+
+
+def find_image_footprint_shp(zip_path: Path) -> str | None:
     """Find the imageFootprintA shapefile for sensor metadata."""
-    for shp in extract_dir.rglob("*imageFootprintA*.shp"):
-        return shp
-    return None
+    return find_member(zip_path, "*imageFootprintA*.shp")
 
 
 def process_product(
@@ -162,31 +230,36 @@ def process_product(
     mon_number: int,
     version: int,
     storm: str,
+    in_store: bool = False,
 ) -> gpd.GeoDataFrame | None:
-    """Process a single CEMS product: download, extract, convert to GeoDataFrame."""
+    """Process a single CEMS product: download, read from the ZIP, convert to GeoDataFrame.
+
+    A product already `in_store` is only revalidated; it is re-processed
+    only if the server sent a changed ZIP.
+    """
     prod_code = product_code(mon_number)
     aoi_str = f"AOI{aoi_num:02d}"
-    zip_name = f"{activation}_{aoi_str}_{prod_code}_v{version}.zip"
-    zip_path = BASE_DIR / zip_name
+    tag = f"{activation} {aoi_str} {prod_code} v{version}"
+    zip_path = zip_path_for(activation, aoi_num, prod_code, version)
+    zip_name = zip_path.name
 
-    # Download
+    # Download (conditional GET for products with a stored ETag)
     url = download_url(activation, aoi_num, prod_code, version)
-    if not download_file(url, zip_path):
+    status = download_file(url, zip_path, tag)
+    if status is None:
+        return None
+    if in_store and status == "unchanged":
         return None
 
-    # Extract
-    extract_dir = extract_zip(zip_path)
-
-    # Find observedEventA shapefile
-    shp_path = find_observed_event_shp(extract_dir)
+    # Find observedEventA shapefile (read in place via /vsizip/, no extraction)
+    shp_path = find_observed_event_shp(zip_path)
     if shp_path is None:
-        print(f"    WARNING: No observedEventA shapefile found in {extract_dir.name}")
+        print(f"    {tag}: WARNING: No observedEventA shapefile found in {zip_name}")
         return None
 
-    # Read shapefile
     gdf = gpd.read_file(shp_path)
     if gdf.empty:
-        print(f"    WARNING: Empty observedEventA in {extract_dir.name}")
+        print(f"    {tag}: WARNING: Empty observedEventA in {zip_name}")
         return None
 
     # Ensure WGS84
@@ -196,7 +269,7 @@ def process_product(
     # Try to get sensor info from imageFootprintA
     sensor = ""
     source_date = ""
-    fp_shp = find_image_footprint_shp(extract_dir)
+    fp_shp = find_image_footprint_shp(zip_path)
     if fp_shp is not None:
         try:
             fp = gpd.read_file(fp_shp)
@@ -220,16 +293,17 @@ def process_product(
     gdf["source_date"] = source_date
     gdf["sensor"] = sensor
     gdf["product_type"] = product_type_label(mon_number)
+    gdf["product"] = prod_code
+    gdf["version"] = version
     gdf["storm"] = storm
 
-    # Calculate area in hectares (ETRS89-LAEA Europe, equal-area)
-    gdf_proj = gdf.to_crs(epsg=3035)
-    gdf["area_ha"] = gdf_proj.geometry.area / 10000
+    # Calculate area in hectares (ETRS89-LAEA Europe, equal-area); cached in the store
+    gdf["area_ha"] = area_ha(gdf)
 
     # Keep useful original columns
     keep_cols = [
         "geometry", "activation", "aoi", "locality", "source_date",
-        "sensor", "product_type", "storm", "area_ha",
+        "sensor", "product_type", "product", "version", "storm", "area_ha",
     ]
     # Preserve CEMS classification columns if present
     for col in ["event_type", "obj_desc", "det_method", "notation",
@@ -249,7 +323,7 @@ def process_product(
 
     n_features = len(gdf)
     total_ha = gdf["area_ha"].sum()
-    print(f"    Processed: {n_features} features, {total_ha:,.0f} ha")
+    print(f"    {tag}: {n_features} features, {total_ha:,.0f} ha")
     return gdf
 
 
@@ -262,8 +336,11 @@ def main():
 
     os.makedirs(BASE_DIR, exist_ok=True)
 
-    # Collect all GeoDataFrames per activation
-    all_gdfs = {"EMSR861": [], "EMSR864": []}
+    # Products already in the GeoParquet store are revalidated by ETag (cheap
+    # 304) and re-processed only if changed; without a local ZIP + ETag there
+    # is nothing to revalidate against, so they are skipped
+    stored = product_keys()
+    jobs = []
 
     for activation, storm in ACTIVATIONS.items():
         print(f"\n{'─' * 60}")
@@ -317,35 +394,62 @@ def main():
 
                 prod_code = product_code(mon_number)
 
+                in_store = (activation, f"AOI{aoi_num:02d}", prod_code, version_num) in stored
+                if in_store and not _etag_path(
+                        zip_path_for(activation, aoi_num, prod_code, version_num)).exists():
+                    print(f"    {prod_code} v{version_num}: in store")
+                    continue
+
                 # Check if already downloaded
                 key = (activation, aoi_num, prod_code, version_num)
                 if key in ALREADY_HAVE:
                     print(f"    {prod_code} v{version_num}: already have, re-processing...")
 
-                # Process the product
-                gdf = process_product(
-                    activation, aoi_num, aoi_name,
-                    mon_number, version_num, storm,
-                )
-                if gdf is not None and not gdf.empty:
-                    all_gdfs[activation].append(gdf)
+                jobs.append((activation, aoi_num, aoi_name, mon_number, version_num, storm, in_store))
+
+    # ── Download + process products in parallel ───────────────────────────────
+    print(f"\n{'=' * 60}")
+    print(f"Processing {len(jobs)} products on {WORKERS} workers...")
+    print(f"{'=' * 60}")
+
+    new_parts = []
+    with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+        futures = [pool.submit(process_product, *job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                gdf = future.result()
+            except Exception as e:
+                print(f"    {job[0]} AOI{job[1]:02d} {product_code(job[3])}: FAILED: {e}")
+                continue
+            if gdf is not None and not gdf.empty:
+                new_parts.append(gdf)
+
+    # ── Upsert into the store ─────────────────────────────────────────────────
+    if new_parts:
+        new = gpd.GeoDataFrame(pd.concat(new_parts, ignore_index=True), crs="EPSG:4326")
+        upsert(new)
+        print(f"\n  Store: upserted {len(new_parts)} products ({len(new)} features) → {STORE.name}")
+
+    store = load()
+    if store is None:
+        print("\n  No flood extent data in store")
+        return
 
     # ── Merge and save ────────────────────────────────────────────────────────
     print(f"\n{'=' * 60}")
     print("Merging and saving GeoJSON files...")
     print(f"{'=' * 60}")
 
+    # Store rows are Hilbert-ordered; product order keeps the GeoJSON outputs stable
+    store = store.sort_values(KEY, kind="stable").reset_index(drop=True)
     combined_parts = []
 
     for activation in ACTIVATIONS:
-        gdfs = all_gdfs[activation]
-        if not gdfs:
+        merged = store[store["activation"] == activation].reset_index(drop=True)
+        if merged.empty:
             print(f"\n  {activation}: No data to merge")
             continue
 
-        merged = pd.concat(gdfs, ignore_index=True)
-        merged = gpd.GeoDataFrame(merged, geometry="geometry", crs="EPSG:4326")
-
         out_path = BASE_DIR / f"{activation.lower()}.geojson"
         merged.to_file(out_path, driver="GeoJSON")
 
@@ -370,8 +474,21 @@ def main():
         size_mb = out_path.stat().st_size / (1024 * 1024)
         print(f"\n  Combined: {len(combined)} features, {combined['area_ha'].sum():,.0f} ha, {size_mb:.1f} MB")
 
+        pmtiles_path = BASE_DIR / "combined.pmtiles"
+        n_tiles = write_pmtiles(
+            pmtiles_path,
+            [VectorLayer("flood-extent", combined, minzoom=4, maxzoom=14)],
+            metadata={"name": "flood-extent", "attribution": "Copernicus EMS Rapid Mapping"},
+        )
+        size_mb = pmtiles_path.stat().st_size / (1024 * 1024)
+        print(f"  Tiled: {pmtiles_path.name} ({n_tiles} tiles, {size_mb:.1f} MB)")
+
+        # Each product's polygons form one coverage; simplify shared edges together
+        write_tiers(combined, BASE_DIR / "combined-generalized.parquet",
+                    group_by=["activation", "aoi", "product_type", "source_date"])
+
     print(f"\n{'=' * 60}")
-    print("Done! Run tippecanoe to rebuild PMTiles.")
+    print("Done!")
     print(f"{'=' * 60}")
 
 
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Keyframe + delta encoding of raster animation frames.
+
+The temporal player fetches 77 full PNGs per variable, each compressed on its
+own, while consecutive soil-moisture days differ only slightly. This script
+re-encodes the rendered frames in data/raster-frames/<variable>/ as:
+
+  - a keyframe every KEYFRAME_INTERVAL days: the full RGBA bytes
+  - delta frames: (frame − keyframe) mod 256 per byte, i.e. the int8 residual
+    in two's complement, optionally rounded to multiples of --step
+
+Every delta is taken against its group's keyframe (never the previous day),
+so the client reconstructs any day in O(1): one keyframe plus one delta.
+Bytes are stored planar (R plane, G plane, B plane, A plane) and
+zlib-compressed, which the browser inflates natively with
+DecompressionStream('deflate'). Raw bytes avoid canvas premultiplied-alpha
+round-trips that would corrupt residuals decoded from PNG.
+
+Output: data/raster-frames/<variable>-delta/YYYY-MM-DD.bin
+        + a "delta" block per variable in data/frontend/raster-manifest.json
+
+Usage:
+    python scripts/encode_frame_deltas.py                 # lossless, keyframe every 7 days
+    python scripts/encode_frame_deltas.py --interval 10   # fewer keyframes
+    python scripts/encode_frame_deltas.py --step 4        # lossy residuals, |error| ≤ 2
+"""
+
+import argparse
+import json
+import zlib
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+
+ROOT = Path(__file__).resolve().parent.parent
+FRAMES = ROOT / "data" / "raster-frames"
+MANIFEST = ROOT / "data" / "frontend" / "raster-manifest.json"
+
+# Manifest key → raster-frames subdirectory
+VARIABLES = {
+    "soil_moisture": "soil-moisture",
+    "precipitation": "precipitation",
+}
+
+KEYFRAME_INTERVAL = 7
+ZLIB_LEVEL = 9
+ENCODING = "zlib-planar-rgba"
+
+
+# ─── Encoding ────────────────────────────────────────────────────────────────
+
+def load_rgba(path):
+    """PNG → (H, W, 4) uint8."""
+    return np.asarray(Image.open(path).convert("RGBA"), dtype=np.uint8)
+
+
+def residual(frame, key, step=1):
+    """Per-byte residual frame − key as uint8 (two's-complement int8, mod 256).
+
+    With step > 1 the residual is rounded to a multiple of `step` and clamped
+    so that key + residual stays in [0, 255]; reconstruction error is then at
+    most step / 2 and never wraps.
+    """
+    r = frame.astype(np.int16) - key.astype(np.int16)
+    if step > 1:
+        k = key.astype(np.int16)
+        r = np.clip(np.round(r / step).astype(np.int16) * step, -k, 255 - k)
+    return (r & 0xFF).astype(np.uint8)
+
+
+def reconstruct(key, delta):
+    """Inverse of `residual`: (key + delta) mod 256."""
+    return key + delta  # uint8 arithmetic wraps
+
+
+def pack_planes(rgba):
+    """(H, W, 4) → zlib-compressed planar bytes."""
+    planar = np.ascontiguousarray(rgba.transpose(2, 0, 1))
+    return zlib.compress(planar.tobytes(), ZLIB_LEVEL)
+
+
+def encode_variable(png_dir, out_dir, url_prefix, interval=KEYFRAME_INTERVAL, step=1):
+    """Encode one variable's frames. Returns the manifest "delta" block."""
+    pngs = sorted(png_dir.glob("*.png"))
+    if not pngs:
+        return None
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    frames = []
+    key = None
+    key_idx = 0
+    width = height = None
+    png_bytes = delta_bytes = 0
+    max_err = 0
+
+    for i, png in enumerate(pngs):
+        rgba = load_rgba(png)
+        if width is None:
+            height, width = rgba.shape[:2]
+        elif rgba.shape[:2] != (height, width):
+            raise ValueError(f"{png.name}: {rgba.shape[1]}×{rgba.shape[0]}, expected {width}×{height}")
+
+        if i % interval == 0:
+            key, key_idx = rgba, i
+            payload = rgba
+        else:
+            payload = residual(rgba, key, step)
+            err = np.abs(reconstruct(key, payload).astype(np.int16) - rgba.astype(np.int16)).max()
+            max_err = max(max_err, int(err))
+
+        out_path = out_dir / f"{png.stem}.bin"
+        out_path.write_bytes(pack_planes(payload))
+
+        png_bytes += png.stat().st_size
+        delta_bytes += out_path.stat().st_size
+        frames.append({
+            "date": png.stem,
+            "url": f"{url_prefix}/{out_path.name}",
+            "key": key_idx,
+        })
+
+    if step == 1 and max_err:
+        raise AssertionError(f"Lossless delta round-trip failed (max error {max_err})")
+
+    print(f"  {png_dir.name}: {len(frames)} frames, "
+          f"{-(-len(frames) // interval)} keyframes, "
+          f"{png_bytes / 1e6:.1f} MB PNG → {delta_bytes / 1e6:.1f} MB delta "
+          f"({100 * delta_bytes / max(png_bytes, 1):.0f}%), max error {max_err}")
+
+    return {
+        "encoding": ENCODING,
+        "width": width,
+        "height": height,
+        "keyframe_interval": interval,
+        "step": step,
+        "bytes": delta_bytes,
+        "frames": frames,
+    }
+
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyframe + delta encode raster animation frames")
+    parser.add_argument("--interval", type=int, default=KEYFRAME_INTERVAL,
+                        help="Days between keyframes")
+    parser.add_argument("--step", type=int, default=1,
+                        help="Residual quantization step (1 = lossless)")
+    args = parser.parse_args()
+
+    if args.interval < 1 or args.step < 1:
+        parser.error("--interval and --step must be ≥ 1")
+
+    print(f"Delta-encoding raster frames (keyframe every {args.interval} days, step {args.step})")
+
+    blocks = {}
+    for key, subdir in VARIABLES.items():
+        block = encode_variable(
+            FRAMES / subdir,
+            FRAMES / f"{subdir}-delta",
+            f"raster-frames/{subdir}-delta",
+            interval=args.interval,
+            step=args.step,
+        )
+        if block is None:
+            print(f"  {subdir}: no PNG frames, skipping")
+            continue
+        blocks[key] = block
+
+    if not MANIFEST.exists():
+        print(f"⚠ {MANIFEST} not found — run generate-cog-frames.py first; manifest not updated")
+        return
+
+    with open(MANIFEST) as f:
+        manifest = json.load(f)
+    for key, block in blocks.items():
+        manifest.setdefault(key, {})["delta"] = block
+    with open(MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"✓ Manifest: {MANIFEST}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""ERA5 NetCDF → per-timestep COG conversion shared by the ERA5 fetch scripts.
+
+fetch_era5_synoptic.py and fetch_era5_precip_hourly.py used to loop
+variable × timestep calling `rio.to_raster` on one slice at a time, and to
+decide whether a NetCDF was already converted by opening it and stat-ing
+every output path. This module does both cheaply:
+
+  - the NetCDF is opened with dask chunks along time; each TIME_CHUNK block
+    of a variable is read once and its timesteps are written as COGs by a
+    thread pool (GDAL compresses outside the GIL), straight through
+    rasterio's COG driver with the affine computed once from the lat/lon
+    coordinates
+  - a small JSON manifest next to the NetCDF cache records every emitted
+    (output, time) key plus each fully converted NetCDF (by size/mtime),
+    so the skip decision is a dict lookup and needs neither the NetCDF nor
+    the COG directories; a missing manifest is rebuilt on the next
+    conversion from the COGs already on disk
+
+Time keys are YYYY-MM-DDTHH, the COG file stem.
+
+Usage:
+    from era5_cogs import CogManifest, nc_to_cogs
+
+    manifest = CogManifest(NC_CACHE / "cog-manifest-synoptic.json")
+    if not manifest.done(nc_path):
+        nc_to_cogs(nc_path, {"msl": (COG_DIR / "mslp", 1.0)}, manifest)
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+log = logging.getLogger("era5")
+
+TIME_CHUNK = 24  # timesteps read per dask chunk
+WORKERS = min(8, os.cpu_count() or 1)
+
+COG_PROFILE = {
+    "driver": "COG",
+    "dtype": "float32",
+    "count": 1,
+    "crs": "EPSG:4326",
+    "compress": "LZW",
+    "nodata": np.nan,
+}
+
+
+class CogManifest:
+    """Emitted (output name, time key) pairs and fully converted NetCDFs, persisted as JSON."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.keys = {}  # output name → set of time keys
+        self.files = {}  # NetCDF name → [size, mtime_ns]
+        if path.exists():
+            with open(path) as f:
+                data = json.load(f)
+            self.keys = {name: set(times) for name, times in data.get("keys", {}).items()}
+            self.files = data.get("files", {})
+
+    @staticmethod
+    def _stamp(nc_path: Path):
+        st = nc_path.stat()
+        return [st.st_size, st.st_mtime_ns]
+
+    def done(self, nc_path: Path) -> bool:
+        """True if `nc_path` was fully converted (and, if still cached, has not changed since)."""
+        stamp = self.files.get(nc_path.name)
+        if stamp is None:
+            return False
+        return not nc_path.exists() or self._stamp(nc_path) == stamp
+
+    def has(self, name: str, time_key: str) -> bool:
+        return time_key in self.keys.get(name, ())
+
+    def add(self, name: str, time_keys):
+        self.keys.setdefault(name, set()).update(time_keys)
+
+    def mark_done(self, nc_path: Path):
+        self.files[nc_path.name] = self._stamp(nc_path)
+
+    def save(self):
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"files": self.files,
+                       "keys": {name: sorted(times) for name, times in sorted(self.keys.items())}},
+                      f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+
+def grid_transform(lat: np.ndarray, lon: np.ndarray):
+    """Affine of a regular lat/lon grid (pixel-centre coordinates) and whether lat must be flipped."""
+    dx = float(lon[1] - lon[0])
+    dy = float(lat[0] - lat[1])
+    flip = dy < 0
+    north = float(lat.max())
+    return from_origin(float(lon[0]) - dx / 2, north + abs(dy) / 2, dx, abs(dy)), flip
+
+
+def _write_cog(path: Path, data: np.ndarray, transform):
+    tmp = path.with_name(f".{path.name}")
+    with rasterio.open(tmp, "w", width=data.shape[1], height=data.shape[0], transform=transform,
+                       **COG_PROFILE) as dst:
+        dst.write(data.astype(np.float32), 1)
+    os.replace(tmp, path)
+
+
+def nc_to_cogs(nc_path: Path, outputs: dict, manifest: CogManifest, workers: int = WORKERS,
+               chunk: int = TIME_CHUNK):
+    """Write one COG per (variable, timestep) of an ERA5 NetCDF.
+
+    `outputs` maps NetCDF short name → (output dir, scale factor); a COG is
+    <output dir>/<YYYY-MM-DDTHH>.tif. Keys already in the manifest (or, for
+    a fresh manifest, already on disk) are skipped. Marks the NetCDF done in
+    the manifest when every variable was present. Returns (written, skipped).
+    """
+    import xarray as xr
+
+    written = skipped = 0
+    complete = True
+    with xr.open_dataset(nc_path, chunks={}) as ds, ThreadPoolExecutor(max_workers=workers) as pool:
+        # ERA5 NetCDF uses 'valid_time' for the time dimension
+        time_dim = "valid_time" if "valid_time" in ds.dims else "time"
+        ds = ds.chunk({time_dim: chunk})
+        time_keys = np.datetime_as_string(ds[time_dim].values, unit="h")
+        transform, flip = grid_transform(ds["latitude"].values, ds["longitude"].values)
+
+        for short_name, (out_dir, scale) in outputs.items():
+            if short_name not in ds:
+                log.warning("  Variable %s not found in %s. Available: %s",
+                            short_name, nc_path.name, list(ds.data_vars))
+                complete = False
+                continue
+            out_dir.mkdir(parents=True, exist_ok=True)
+            name = out_dir.name
+            todo = [i for i, key in enumerate(time_keys)
+                    if not manifest.has(name, key) and not (out_dir / f"{key}.tif").exists()]
+            pending = set(todo)
+            manifest.add(name, (key for i, key in enumerate(time_keys) if i not in pending))
+            skipped += len(time_keys) - len(todo)
+            if not todo:
+                continue
+
+            da = ds[short_name].transpose(time_dim, "latitude", "longitude")
+            for start in range(0, len(todo), chunk):
+                idx = todo[start:start + chunk]
+                block = da.isel({time_dim: idx}).values  # one dask read per chunk
+                if flip:
+                    block = block[:, ::-1]
+                if scale != 1.0:
+                    block = block * scale
+                futures = [pool.submit(_write_cog, out_dir / f"{time_keys[i]}.tif", block[j], transform)
+                           for j, i in enumerate(idx)]
+                for future in futures:
+                    future.result()
+                manifest.add(name, (time_keys[i] for i in idx))
+                written += len(idx)
+            manifest.save()
+
+    if complete:
+        manifest.mark_done(nc_path)
+    manifest.save()
+    return written, skipped
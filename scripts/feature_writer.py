@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Streaming feature-collection writer: GeoJSON, NDJSON, GeoParquet, FlatGeobuf.
+
+The fetch scripts used to assemble the whole FeatureCollection as nested
+dicts and `json.dump` it at the end, so peak memory grew with the feature
+count (and reconstruct_ipma_warnings deep-copied each district polygon for
+every one of its 21 days). FeatureWriter emits features as they are
+produced instead:
+
+  - GeoJSON / NDJSON: each feature is serialized and written immediately;
+    only the open file handle is held
+  - GeoParquet / FlatGeobuf: features are buffered into fixed-size Arrow
+    record batches (WKB geometry) and flushed batch by batch; FlatGeobuf
+    spools through a temporary GeoParquet and is streamed into GDAL
+    (pyogrio) at close, so its packed spatial index is still built
+  - SharedGeometry pre-serializes a geometry once (JSON text, WKB on
+    demand) so a geometry repeated across many features is spliced in
+    rather than re-encoded or copied
+
+The format follows the file suffix (.geojson/.json, .ndjson/.geojsonl,
+.parquet, .fgb). Output goes to a temporary file and is moved into place
+on a clean exit, so a crash never leaves a truncated collection behind.
+
+Usage:
+    from feature_writer import FeatureWriter, SharedGeometry
+
+    with FeatureWriter(out_path, members={"metadata": {...}}) as writer:
+        district = SharedGeometry(geometry)
+        for day in days:
+            writer.write({"date": day, ...}, district)
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+FORMATS = {
+    ".geojson": "geojson",
+    ".json": "geojson",
+    ".ndjson": "ndjson",
+    ".geojsonl": "ndjson",
+    ".geojsons": "ndjson",
+    ".parquet": "geoparquet",
+    ".geoparquet": "geoparquet",
+    ".fgb": "flatgeobuf",
+}
+
+BATCH_SIZE = 10_000
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class SharedGeometry:
+    """A GeoJSON geometry serialized once, for reuse across many features."""
+
+    __slots__ = ("json", "type", "_wkb")
+
+    def __init__(self, geometry):
+        self.json = geometry if isinstance(geometry, str) else _dumps(geometry)
+        self.type = json.loads(self.json)["type"] if isinstance(geometry, str) else geometry["type"]
+        self._wkb = None
+
+    @property
+    def wkb(self):
+        if self._wkb is None:
+            self._wkb = shapely.to_wkb(shapely.from_geojson(self.json))
+        return self._wkb
+
+
+def _shared(geometry):
+    return geometry if isinstance(geometry, SharedGeometry) else SharedGeometry(geometry)
+
+
+# ─── Writers ─────────────────────────────────────────────────────────────────
+
+class _JSONWriter:
+    """GeoJSON FeatureCollection (or NDJSON) written feature by feature."""
+
+    def __init__(self, fp, members, ndjson):
+        self.fp = fp
+        self.ndjson = ndjson
+        self.first = True
+        if not ndjson:
+            head = "".join(f"{_dumps(k)}:{_dumps(v)}," for k, v in (members or {}).items())
+            fp.write('{"type":"FeatureCollection",' + head + '"features":[\n')
+
+    def write(self, properties, geometry):
+        feature = ('{"type":"Feature","properties":' + _dumps(properties)
+                   + ',"geometry":' + (geometry.json if geometry is not None else "null") + "}")
+        if self.ndjson:
+            self.fp.write(feature + "\n")
+        else:
+            self.fp.write(feature if self.first else ",\n" + feature)
+        self.first = False
+
+    def close(self):
+        if not self.ndjson:
+            self.fp.write("\n]}\n")
+
+
+class _ParquetWriter:
+    """GeoParquet 1.0 (WKB geometry column) written in record batches.
+
+    The property columns and their types are fixed by the first batch; a
+    later feature with a property that was never seen before raises
+    ValueError rather than being dropped silently.
+    """
+
+    def __init__(self, path, members, batch_size):
+        self.path = path
+        self.members = members
+        self.batch_size = batch_size
+        self.rows = []
+        self.wkb = []
+        self.writer = None
+        self.schema = None
+        self.types = set()
+        self.bbox = None
+
+    def write(self, properties, geometry):
+        self.rows.append(properties)
+        self.wkb.append(geometry)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        geoms = self.wkb
+        wkb = [g.wkb if g is not None else None for g in geoms]
+        self.types.update(g.type for g in geoms if g is not None)
+        bounds = shapely.bounds(shapely.from_wkb(wkb))
+        bounds = bounds[~np.isnan(bounds).any(axis=1)]
+        if len(bounds):
+            if self.bbox is not None:
+                bounds = np.vstack([bounds, self.bbox])
+            self.bbox = [*bounds[:, :2].min(axis=0).tolist(), *bounds[:, 2:].max(axis=0).tolist()]
+
+        if self.schema is None:
+            props = pa.Table.from_pylist(self.rows)
+            self.schema = props.schema
+        else:
+            unknown = set().union(*self.rows) - set(self.schema.names)
+            if unknown:
+                raise ValueError(f"{self.path}: properties {sorted(unknown)} not in the first "
+                                 f"batch's columns {self.schema.names}")
+            props = pa.Table.from_pylist(self.rows, schema=self.schema)
+        table = props.append_column("geometry", pa.array(wkb, pa.binary()))
+
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+        self.writer.write_table(table)
+        self.rows, self.wkb = [], []
+
+    def close(self):
+        self.flush()
+        if self.writer is None:
+            return
+        geo = {
+            "version": "1.0.0",
+            "primary_column": "geometry",
+            "columns": {"geometry": {"encoding": "WKB", "geometry_types": sorted(self.types)}},
+        }
+        if self.bbox is not None:
+            geo["columns"]["geometry"]["bbox"] = self.bbox
+        metadata = {"geo": json.dumps(geo)}
+        if self.members:
+            metadata["collection"] = _dumps(self.members)
+        self.writer.add_key_value_metadata(metadata)
+        self.writer.close()
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class _FlatGeobufWriter(_ParquetWriter):
+    """FlatGeobuf via a spooled GeoParquet streamed into GDAL at close."""
+
+    def __init__(self, path, members, batch_size):
+        self.target = path
+        self.spool = tempfile.NamedTemporaryFile(suffix=".parquet", dir=Path(path).parent, delete=False)
+        self.spool.close()
+        super().__init__(self.spool.name, None, batch_size)
+
+    def close(self):
+        import pyogrio
+
+        try:
+            super().close()
+            if self.writer is None:
+                empty = pa.table({"geometry": pa.array([], pa.binary())})
+                reader = pa.RecordBatchReader.from_batches(empty.schema, empty.to_batches())
+            else:
+                source = pq.ParquetFile(self.spool.name)
+                reader = pa.RecordBatchReader.from_batches(
+                    source.schema_arrow, source.iter_batches(batch_size=self.batch_size))
+            geometry_type = next(iter(self.types)) if len(self.types) == 1 else "Unknown"
+            pyogrio.write_arrow(reader, self.target, driver="FlatGeobuf", geometry_name="geometry",
+                                geometry_type=geometry_type, crs="EPSG:4326")
+        finally:
+            os.unlink(self.spool.name)
+
+    def abort(self):
+        super().abort()
+        os.unlink(self.spool.name)
+
+
+class FeatureWriter:
+    """Context manager streaming features into a GeoJSON-family, GeoParquet or FlatGeobuf file.
+
+    `members` are extra top-level FeatureCollection members (e.g. "metadata");
+    GeoParquet keeps them as "collection" file metadata, NDJSON and
+    FlatGeobuf drop them.
+    """
+
+    def __init__(self, path, driver=None, members=None, batch_size=BATCH_SIZE):
+        self.path = Path(path)
+        self.driver = driver or FORMATS.get(self.path.suffix.lower())
+        if self.driver not in set(FORMATS.values()):
+            raise ValueError(f"Unknown feature format for {self.path} (driver={driver!r})")
+        self.members = members
+        self.batch_size = batch_size
+        self.count = 0
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=f".{self.path.name}.", dir=self.path.parent)
+        os.close(fd)
+        self.tmp = tmp
+        self.fp = None
+        if self.driver in ("geojson", "ndjson"):
+            self.fp = open(tmp, "w", encoding="utf-8")
+            self.sink = _JSONWriter(self.fp, self.members, self.driver == "ndjson")
+        elif self.driver == "geoparquet":
+            self.sink = _ParquetWriter(tmp, self.members, self.batch_size)
+        else:
+            os.unlink(tmp)  # GDAL creates the file itself
+            self.sink = _FlatGeobufWriter(tmp, self.members, self.batch_size)
+        return self
+
+    def write(self, properties, geometry):
+        """Append one feature. `geometry` is a GeoJSON dict, a SharedGeometry or None."""
+        self.sink.write(properties, None if geometry is None else _shared(geometry))
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.sink.close()
+            elif hasattr(self.sink, "abort"):
+                self.sink.abort()
+            if self.fp is not None:
+                self.fp.close()
+            if exc_type is None:
+                os.replace(self.tmp, self.path)
+        finally:
+            if os.path.exists(self.tmp):
+                os.unlink(self.tmp)
+        return False
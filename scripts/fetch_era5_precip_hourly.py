@@ -14,19 +14,24 @@ Output: data/cog/precipitation-hourly/YYYY-MM-DDTHH.tif
 """
 import cdsapi
 import xarray as xr
-import rioxarray  # noqa: F401 — registers .rio accessor
 import numpy as np
 from pathlib import Path
 from datetime import datetime, timedelta
 import sys
+import time
 import logging
 
+from cds_queue import run_queue
+from era5_cogs import CogManifest, nc_to_cogs
+
 # ---------------------------------------------------------------------------
 # Config
 # ---------------------------------------------------------------------------
 BASE_DIR = Path("/home/nls/Documents/dev/cheias-pt")
 NC_CACHE = BASE_DIR / "data" / "temporal" / "era5" / "_nc_cache"
 COG_DIR = BASE_DIR / "data" / "cog" / "precipitation-hourly"
+# Emitted time keys and fully converted NetCDFs — see era5_cogs.py
+MANIFEST = NC_CACHE / "cog-manifest-precip-hourly.json"
 
 # CDS API variable name
 VARIABLE = "mean_total_precipitation_rate"
@@ -67,14 +72,6 @@ def ensure_dirs():
     COG_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def cog_path_for(time_val) -> Path:
-    """Generate COG path for a specific time."""
-    ts = np.datetime64(time_val)
-    dt = ts.astype("datetime64[s]").astype(datetime)
-    fname = dt.strftime("%Y-%m-%dT%H") + ".tif"
-    return COG_DIR / fname
-
-
 def build_requests():
     """Build CDS API request dicts, one per storm window per month.
 
@@ -112,77 +109,19 @@ def build_requests():
     return requests
 
 
-def all_cogs_exist(nc_path: Path) -> bool:
-    """Quick check: if the NC file has been fully processed, skip."""
-    if not nc_path.exists():
-        return False
-    try:
-        ds = xr.open_dataset(nc_path)
-        time_dim = "valid_time" if "valid_time" in ds.dims else "time"
-        if SHORT_NAME not in ds:
-            ds.close()
-            return False
-        for t in ds[time_dim].values:
-            if not cog_path_for(t).exists():
-                ds.close()
-                return False
-        ds.close()
-        return True
-    except Exception:
-        return False
-
-
-def process_nc_to_cogs(nc_path: Path, label: str):
-    """Extract each timestep from a NetCDF, convert m/s -> mm/hr, write COG."""
+def process_nc_to_cogs(nc_path: Path, label: str, manifest: CogManifest):
+    """Extract each timestep from a NetCDF, convert m/s -> mm/hr, write COG (chunked, parallel)."""
     log.info("Processing %s -> COGs", nc_path.name)
-    ds = xr.open_dataset(nc_path)
-
-    time_dim = "valid_time" if "valid_time" in ds.dims else "time"
-
-    if SHORT_NAME not in ds:
-        log.error("  Variable %s not found in %s. Available: %s",
-                  SHORT_NAME, nc_path.name, list(ds.data_vars))
-        ds.close()
-        return
-
-    da = ds[SHORT_NAME]
-
-    # Rename dims for rioxarray
-    if "latitude" in da.dims and "longitude" in da.dims:
-        da = da.rename({"latitude": "y", "longitude": "x"})
-    da = da.rio.set_spatial_dims(x_dim="x", y_dim="y")
-    da = da.rio.write_crs("EPSG:4326")
-
-    total = 0
-    skipped = 0
-    for t_idx in range(len(ds[time_dim])):
-        t_val = ds[time_dim].values[t_idx]
-        out_path = cog_path_for(t_val)
-
-        if out_path.exists():
-            skipped += 1
-            continue
-
-        slice_da = da.isel({time_dim: t_idx})
-
-        # Convert kg/m2/s -> mm/hr
-        slice_da = slice_da * KGM2S_TO_MMHR
-
-        slice_da.rio.to_raster(
-            str(out_path),
-            driver="COG",
-            compress="LZW",
-            dtype="float32",
-        )
-        total += 1
-
-    ds.close()
-    log.info("  %s: wrote %d COGs, skipped %d existing", label, total, skipped)
+    t0 = time.time()
+    written, skipped = nc_to_cogs(nc_path, {SHORT_NAME: (COG_DIR, KGM2S_TO_MMHR)}, manifest)
+    log.info("  %s: wrote %d COGs, skipped %d existing in %.1fs",
+             label, written, skipped, time.time() - t0)
 
 
 def download_and_process(client, label, request, nc_path):
     """Download from CDS (if needed) and process to COGs."""
-    if all_cogs_exist(nc_path):
+    manifest = CogManifest(MANIFEST)
+    if manifest.done(nc_path):
         log.info("SKIP %s: all COGs already exist", label)
         return True
 
@@ -203,7 +142,7 @@ def download_and_process(client, label, request, nc_path):
         log.info("NC cache hit: %s", nc_path.name)
 
     try:
-        process_nc_to_cogs(nc_path, label)
+        process_nc_to_cogs(nc_path, label, manifest)
         return True
     except Exception as e:
         log.error("  FAILED to process %s: %s", label, e)
@@ -255,8 +194,8 @@ def run_test(client):
 # ---------------------------------------------------------------------------
 # Full acquisition
 # ---------------------------------------------------------------------------
-def run_full(client):
-    """Download and process all storm windows."""
+def run_full():
+    """Download and process all storm windows (submitted concurrently, see cds_queue.py)."""
     requests = build_requests()
     log.info("=" * 60)
     log.info("FULL MODE: %d batches to process", len(requests))
@@ -264,10 +203,10 @@ def run_full(client):
         log.info("  - %s", label)
     log.info("=" * 60)
 
-    results = {"ok": 0, "fail": 0}
-    for label, request, nc_path in requests:
-        ok = download_and_process(client, label, request, nc_path)
-        results["ok" if ok else "fail"] += 1
+    def convert(nc_path, label, request):
+        process_nc_to_cogs(nc_path, label, CogManifest(MANIFEST))
+
+    results = run_queue(requests, convert, skip=CogManifest(MANIFEST).done)
 
     log.info("=" * 60)
     log.info("DONE: %d OK, %d failed", results["ok"], results["fail"])
@@ -281,15 +220,14 @@ def run_full(client):
 # ---------------------------------------------------------------------------
 def main():
     ensure_dirs()
-    client = cdsapi.Client()
 
     mode = sys.argv[1] if len(sys.argv) > 1 else "test"
 
     if mode == "test":
-        success = run_test(client)
+        success = run_test(cdsapi.Client())
         sys.exit(0 if success else 1)
     elif mode == "full":
-        run_full(client)
+        run_full()
     else:
         print(f"Usage: {sys.argv[0]} [test|full]")
         sys.exit(1)
@@ -13,26 +13,32 @@ Temporal:
 
 Output: data/cog/{mslp,wind-u,wind-v,wind-gust}/YYYY-MM-DDTHH.tif
 
+Full and storms-only modes plan the batches into CDS-sized requests, submit
+them concurrently and convert each download as it completes (cds_queue.py).
+
 Usage:
   python scripts/fetch_era5_synoptic.py test          # single test day (Jan 28)
   python scripts/fetch_era5_synoptic.py full           # full Dec 1 - Feb 15
   python scripts/fetch_era5_synoptic.py storms-only    # only storm periods (hourly)
+  python scripts/fetch_era5_synoptic.py full --per-variable   # one CDS request per variable
 """
 import cdsapi
-import xarray as xr
-import rioxarray  # noqa: F401 — registers .rio accessor
-import numpy as np
 from pathlib import Path
 from datetime import datetime, timedelta
 import sys
-import os
+import time
 import logging
 
+from cds_queue import plan, run_queue
+from era5_cogs import CogManifest, nc_to_cogs
+
 # ---------------------------------------------------------------------------
 # Config
 # ---------------------------------------------------------------------------
 BASE_DIR = Path("/home/nls/Documents/dev/cheias-pt")
 NC_CACHE = BASE_DIR / "data" / "temporal" / "era5" / "_nc_cache"
+# Emitted (variable, time) keys and fully converted NetCDFs — see era5_cogs.py
+MANIFEST = NC_CACHE / "cog-manifest-synoptic.json"
 COG_DIRS = {
     "mean_sea_level_pressure": BASE_DIR / "data" / "cog" / "mslp",
     "10m_u_component_of_wind": BASE_DIR / "data" / "cog" / "wind-u",
@@ -165,89 +171,21 @@ def build_requests(storms_only=False):
     return requests
 
 
-def cog_path_for(variable: str, time_val) -> Path:
-    """Generate COG path for a variable at a specific time."""
-    if hasattr(time_val, "dt"):
-        ts = time_val
-    else:
-        ts = np.datetime64(time_val)
-    dt = ts.astype("datetime64[s]").astype(datetime)
-    fname = dt.strftime("%Y-%m-%dT%H") + ".tif"
-    return COG_DIRS[variable] / fname
-
-
-def all_cogs_exist(nc_path: Path) -> bool:
-    """Quick check: if the NC file has been fully processed, skip."""
-    if not nc_path.exists():
-        return False
-    try:
-        ds = xr.open_dataset(nc_path)
-        for var in VARIABLES:
-            sn = SHORT_NAMES[var]
-            if sn not in ds:
-                ds.close()
-                return False
-            for t in ds.valid_time.values:
-                if not cog_path_for(var, t).exists():
-                    ds.close()
-                    return False
-        ds.close()
-        return True
-    except Exception:
-        return False
-
-
-def process_nc_to_cogs(nc_path: Path, label: str):
-    """Extract each variable x timestep from a NetCDF to COG."""
+def process_nc_to_cogs(nc_path: Path, label: str, manifest: CogManifest, variables=VARIABLES):
+    """Extract each variable x timestep from a NetCDF to COG (chunked, parallel writes)."""
     log.info("Processing %s -> COGs", nc_path.name)
-    ds = xr.open_dataset(nc_path)
-
-    # ERA5 NetCDF uses 'valid_time' for the time dimension
-    time_dim = "valid_time" if "valid_time" in ds.dims else "time"
-
-    total = 0
-    skipped = 0
-    for var in VARIABLES:
-        sn = SHORT_NAMES[var]
-        if sn not in ds:
-            log.warning("  Variable %s (short: %s) not found in %s", var, sn, nc_path.name)
-            continue
-
-        da = ds[sn]
-
-        # Ensure CRS is set (ERA5 is regular lat-lon = EPSG:4326)
-        if "latitude" in da.dims and "longitude" in da.dims:
-            da = da.rename({"latitude": "y", "longitude": "x"})
-        da = da.rio.set_spatial_dims(x_dim="x", y_dim="y")
-        da = da.rio.write_crs("EPSG:4326")
-
-        for t_idx in range(len(ds[time_dim])):
-            t_val = ds[time_dim].values[t_idx]
-            out_path = cog_path_for(var, t_val)
-
-            if out_path.exists():
-                skipped += 1
-                continue
-
-            slice_da = da.isel({time_dim: t_idx})
-
-            # Write COG with LZW compression
-            slice_da.rio.to_raster(
-                str(out_path),
-                driver="COG",
-                compress="LZW",
-                dtype="float32",
-            )
-            total += 1
-
-    ds.close()
-    log.info("  %s: wrote %d COGs, skipped %d existing", label, total, skipped)
+    t0 = time.time()
+    outputs = {SHORT_NAMES[var]: (COG_DIRS[var], 1.0) for var in variables}
+    written, skipped = nc_to_cogs(nc_path, outputs, manifest)
+    log.info("  %s: wrote %d COGs, skipped %d existing in %.1fs",
+             label, written, skipped, time.time() - t0)
 
 
 def download_and_process(client, label, request, nc_path):
     """Download from CDS (if needed) and process to COGs."""
-    # Check if already fully processed
-    if all_cogs_exist(nc_path):
+    # Check if already fully processed (manifest lookup, no NetCDF/COG I/O)
+    manifest = CogManifest(MANIFEST)
+    if manifest.done(nc_path):
         log.info("SKIP %s: all COGs already exist", label)
         return True
 
@@ -269,7 +207,7 @@ def download_and_process(client, label, request, nc_path):
 
     # Process to COGs
     try:
-        process_nc_to_cogs(nc_path, label)
+        process_nc_to_cogs(nc_path, label, manifest)
         return True
     except Exception as e:
         log.error("  FAILED to process %s: %s", label, e)
@@ -315,17 +253,17 @@ def run_test(client):
 # ---------------------------------------------------------------------------
 # Full acquisition
 # ---------------------------------------------------------------------------
-def run_full(client):
+def run_full(per_variable=False):
     """Download and process the full temporal range."""
     requests = build_requests(storms_only=False)
     log.info("=" * 60)
     log.info("FULL MODE: %d batches to process", len(requests))
     log.info("=" * 60)
 
-    _run_batches(client, requests)
+    _run_batches(requests, per_variable)
 
 
-def run_storms_only(client):
+def run_storms_only(per_variable=False):
     """Download and process only the storm periods (hourly)."""
     requests = build_requests(storms_only=True)
     log.info("=" * 60)
@@ -334,15 +272,18 @@ def run_storms_only(client):
         log.info("  %s: %s to %s", name, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
     log.info("=" * 60)
 
-    _run_batches(client, requests)
+    _run_batches(requests, per_variable)
+
+
+def _run_batches(requests, per_variable=False):
+    """Plan, submit concurrently and process a list of CDS batches."""
+    manifest = CogManifest(MANIFEST)
 
+    def convert(nc_path, label, request):
+        # Fresh manifest per NetCDF: conversions run one at a time on the queue's converter thread
+        process_nc_to_cogs(nc_path, label, CogManifest(MANIFEST), request["variable"])
 
-def _run_batches(client, requests):
-    """Execute a list of CDS download+process batches."""
-    results = {"ok": 0, "fail": 0}
-    for label, request, nc_path in requests:
-        ok = download_and_process(client, label, request, nc_path)
-        results["ok" if ok else "fail"] += 1
+    results = run_queue(plan(requests, per_variable=per_variable), convert, skip=manifest.done)
 
     log.info("=" * 60)
     log.info("DONE: %d OK, %d failed", results["ok"], results["fail"])
@@ -360,19 +301,20 @@ def _run_batches(client, requests):
 # ---------------------------------------------------------------------------
 def main():
     ensure_dirs()
-    client = cdsapi.Client()
 
-    mode = sys.argv[1] if len(sys.argv) > 1 else "test"
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    mode = args[0] if args else "test"
+    per_variable = "--per-variable" in sys.argv
 
     if mode == "test":
-        success = run_test(client)
+        success = run_test(cdsapi.Client())
         sys.exit(0 if success else 1)
     elif mode == "full":
-        run_full(client)
+        run_full(per_variable)
     elif mode == "storms-only":
-        run_storms_only(client)
+        run_storms_only(per_variable)
     else:
-        print(f"Usage: {sys.argv[0]} [test|full|storms-only]")
+        print(f"Usage: {sys.argv[0]} [test|full|storms-only] [--per-variable]")
         sys.exit(1)
 
 
@@ -7,10 +7,15 @@ IR 10.8μm channel imagery, resamples to EPSG:4326, and exports as COGs.
 
 Target: Storm Kristin approach and landfall over Portugal (Jan 27-28, 2026).
 
+Downloading and processing overlap: one thread searches and streams the
+next native files (~200 MB each) to disk while a process pool runs the
+satpy conversion of earlier ones; a bounded queue (--prefetch) caps how
+many downloaded files wait on disk, so a run takes about max(download,
+processing) time instead of their sum.
+
 Requires:
   - eumdac (EUMETSAT Data Access Client)
-  - satpy (satellite data processing)
-  - rioxarray (COG export)
+  - satpy (satellite data processing, COG export via GDAL's COG driver)
   - python-dotenv (credential loading)
 
 Credentials: EUMETSAT_CONSUMER_KEY and EUMETSAT_CONSUMER_SECRET in .env
@@ -22,13 +27,21 @@ Usage:
   python scripts/fetch_eumetsat.py --test              # Single test timestamp
   python scripts/fetch_eumetsat.py --interval 3        # Every 3 hours
   python scripts/fetch_eumetsat.py --start 2026-01-27T06 --end 2026-01-28T18
+  python scripts/fetch_eumetsat.py --workers 3 --prefetch 4  # More overlap, more disk
 """
 
 import argparse
+import multiprocessing
 import os
+import queue
+import shutil
 import sys
+import threading
+import time
 import warnings
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 
 warnings.filterwarnings('ignore')
@@ -43,6 +56,8 @@ ENV_FILE = PROJECT_ROOT / '.env'
 VIS_OUTPUT_DIR = PROJECT_ROOT / 'data' / 'cog' / 'satellite-vis'
 IR_OUTPUT_DIR = PROJECT_ROOT / 'data' / 'cog' / 'satellite-ir'
 TMP_DIR = Path('/tmp/eumetsat_download')
+# Nearest-neighbour resampling LUTs (kd-tree, index arrays) for SEVIRI → AREA
+RESAMPLE_CACHE_DIR = PROJECT_ROOT / 'data' / 'temporal' / 'eumetsat' / '_resample_cache'
 
 # Euro-Atlantic domain: covers storm approach from Atlantic to Iberia
 # 30N-60N, 40W-10E at ~3km resolution
@@ -56,6 +71,10 @@ DEFAULT_INTERVAL_HOURS = 1
 
 COLLECTION_ID = 'EO:EUM:DAT:MSG:HRSEVIRI'
 
+CHUNK_SIZE = 1 << 20  # streaming download chunk
+PREFETCH = 2  # native files downloaded ahead of processing (bounds disk use)
+WORKERS = 2  # satpy conversion processes
+
 
 def get_credentials():
     """Load EUMETSAT credentials from .env file."""
@@ -88,44 +107,35 @@ def find_product(collection, target_time):
     return products[0]
 
 
-def download_native(product, download_dir):
-    """Download .nat file from product, return filepath."""
+def download_native(product, download_dir, tag=''):
+    """Download .nat file from product, return filepath.
+
+    Streams to a .part file in CHUNK_SIZE pieces (a native file is ~200 MB)
+    and renames it when complete, so an interrupted download is never
+    mistaken for a finished one.
+    """
     download_dir.mkdir(parents=True, exist_ok=True)
     for entry in product.entries:
         if str(entry).endswith('.nat'):
             filepath = download_dir / str(entry)
             if filepath.exists():
-                print(f"    Already downloaded: {filepath.name}")
+                print(f"    {tag}Already downloaded: {filepath.name}")
                 return filepath
-            with product.open(entry=entry) as fsrc:
-                content = fsrc.read()
-                with open(filepath, 'wb') as fdst:
-                    fdst.write(content)
-            size_mb = len(content) / 1024 / 1024
-            print(f"    Downloaded: {filepath.name} ({size_mb:.0f} MB)")
+            part = filepath.with_name(filepath.name + '.part')
+            with product.open(entry=entry) as fsrc, open(part, 'wb') as fdst:
+                shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+            os.replace(part, filepath)
+            size_mb = filepath.stat().st_size / 1024 / 1024
+            print(f"    {tag}Downloaded: {filepath.name} ({size_mb:.0f} MB)")
             return filepath
     return None
 
 
-def process_to_cog(nat_filepath, timestamp_str, vis_dir, ir_dir):
-    """Process native file to Natural Colour and IR COGs."""
-    from satpy import Scene
+@lru_cache(maxsize=1)
+def target_area():
+    """Euro-Atlantic lat/lon grid every timestamp is resampled to (built once)."""
     from pyresample import create_area_def
-    import rioxarray
-
-    vis_path = vis_dir / f'{timestamp_str}.tif'
-    ir_path = ir_dir / f'{timestamp_str}.tif'
-
-    # Skip if both outputs exist
-    if vis_path.exists() and ir_path.exists():
-        print(f"    Both COGs exist, skipping processing")
-        return True
-
-    # Load scene
-    scn = Scene(filenames=[str(nat_filepath)], reader='seviri_l1b_native')
-
-    # Define target area
-    area_def = create_area_def(
+    return create_area_def(
         'euro_atlantic',
         {'proj': 'longlat', 'datum': 'WGS84'},
         area_extent=AREA_EXTENT,
@@ -134,50 +144,79 @@ def process_to_cog(nat_filepath, timestamp_str, vis_dir, ir_dir):
         description='Euro-Atlantic domain for storm tracking'
     )
 
-    # Process Natural Colour RGB
-    if not vis_path.exists():
-        scn.load(['natural_color'])
-        resampled = scn.resample(area_def, resampler='nearest')
-
-        # Save intermediate GeoTIFF
-        tmp_vis = str(nat_filepath) + '_vis.tif'
-        resampled.save_dataset('natural_color', tmp_vis, writer='geotiff')
-
-        # Convert to COG
-        ds = rioxarray.open_rasterio(tmp_vis)
-        vis_dir.mkdir(parents=True, exist_ok=True)
-        ds.rio.to_raster(str(vis_path), driver='COG', compress='LZW')
-        ds.close()
-        os.remove(tmp_vis)
-        size_mb = vis_path.stat().st_size / 1024 / 1024
-        print(f"    Natural Colour COG: {vis_path.name} ({size_mb:.1f} MB)")
-
-        # Unload to free memory
-        scn.unload()
-        del resampled
-
-    # Process IR 10.8μm
-    if not ir_path.exists():
-        scn.load(['IR_108'])
-        resampled = scn.resample(area_def, resampler='nearest')
-
-        tmp_ir = str(nat_filepath) + '_ir.tif'
-        resampled.save_dataset('IR_108', tmp_ir, writer='geotiff')
-
-        ds = rioxarray.open_rasterio(tmp_ir)
-        ir_dir.mkdir(parents=True, exist_ok=True)
-        ds.rio.to_raster(str(ir_path), driver='COG', compress='LZW')
-        ds.close()
-        os.remove(tmp_ir)
-        size_mb = ir_path.stat().st_size / 1024 / 1024
-        print(f"    IR 10.8μm COG: {ir_path.name} ({size_mb:.1f} MB)")
-
-        scn.unload()
-        del resampled
 
+def process_to_cog(nat_filepath, timestamp_str, vis_dir, ir_dir):
+    """Process native file to Natural Colour and IR COGs.
+
+    Both products are loaded and resampled in one pass. The SEVIRI grid and
+    the target area are the same for every timestamp, so the nearest-neighbour
+    kd-tree and index arrays are computed on the first run and reused from
+    RESAMPLE_CACHE_DIR afterwards. The geotiff writer writes COGs directly
+    (GDAL COG driver), to a temp name that is renamed into place.
+    """
+    from satpy import Scene
+
+    outputs = {
+        'natural_color': (vis_dir / f'{timestamp_str}.tif', 'Natural Colour COG'),
+        'IR_108': (ir_dir / f'{timestamp_str}.tif', 'IR 10.8μm COG'),
+    }
+    missing = [name for name, (path, _) in outputs.items() if not path.exists()]
+
+    # Skip if both outputs exist
+    if not missing:
+        print(f"    Both COGs exist, skipping processing")
+        return True
+
+    # Load scene (only the products still missing) and resample once
+    scn = Scene(filenames=[str(nat_filepath)], reader='seviri_l1b_native')
+    scn.load(missing)
+    RESAMPLE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    resampled = scn.resample(target_area(), resampler='nearest', cache_dir=str(RESAMPLE_CACHE_DIR))
+
+    for name in missing:
+        path, label = outputs[name]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}')
+        resampled.save_dataset(name, str(tmp), writer='geotiff', driver='COG', compress='LZW')
+        os.replace(tmp, path)
+        size_mb = path.stat().st_size / 1024 / 1024
+        print(f"    {label}: {path.name} ({size_mb:.1f} MB)")
+
+    # Free memory before the next timestamp
+    del resampled, scn
     return True
 
 
+def _init_worker(dask_threads):
+    warnings.filterwarnings('ignore')
+    import dask
+    dask.config.set(scheduler='threads', num_workers=dask_threads)
+
+
+def downloader(collection, pending, ready):
+    """I/O stage: find and download each pending timestamp, in order, into `ready`.
+
+    `ready` is a bounded queue, so this blocks once that many native files
+    are waiting for a processing slot. Puts (ts_str, nat_path or None,
+    error or None) per timestamp and a final None.
+    """
+    try:
+        for n, (ts, ts_str) in enumerate(pending, 1):
+            tag = f'[dl {n}/{len(pending)}] {ts_str} '
+            try:
+                product = find_product(collection, ts)
+                if not product:
+                    ready.put((ts_str, None, f'No product found near {ts_str}'))
+                    continue
+                print(f"    {tag}Product: {product}")
+                nat_path = download_native(product, TMP_DIR, tag)
+                ready.put((ts_str, nat_path, None if nat_path else 'No .nat file in product'))
+            except Exception as e:
+                ready.put((ts_str, None, f'downloading: {e}'))
+    finally:
+        ready.put(None)
+
+
 def generate_timestamps(start, end, interval_hours):
     """Generate list of target timestamps."""
     timestamps = []
@@ -200,6 +239,10 @@ def main():
                         help='End datetime (YYYY-MM-DDTHH)')
     parser.add_argument('--keep-native', action='store_true',
                         help='Keep raw .nat files after processing')
+    parser.add_argument('--prefetch', type=int, default=PREFETCH,
+                        help=f'Native files to download ahead of processing (default: {PREFETCH})')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help=f'Processes converting native files to COGs (default: {WORKERS})')
     args = parser.parse_args()
 
     # Parse time range
@@ -233,59 +276,76 @@ def main():
     IR_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     TMP_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Process each timestamp
+    # Two-stage pipeline: a thread downloads ahead (up to --prefetch native
+    # files waiting) while a process pool converts already-downloaded ones.
+    # At most prefetch + workers + 1 native files are on disk at any time.
     success = 0
     failed = 0
     skipped = 0
 
-    for i, ts in enumerate(timestamps):
+    pending = []
+    for ts in timestamps:
         ts_str = ts.strftime('%Y-%m-%dT%H-%M')
         vis_exists = (VIS_OUTPUT_DIR / f'{ts_str}.tif').exists()
         ir_exists = (IR_OUTPUT_DIR / f'{ts_str}.tif').exists()
-
         if vis_exists and ir_exists:
-            print(f"[{i+1}/{len(timestamps)}] {ts_str} — already processed, skipping")
             skipped += 1
             continue
+        pending.append((ts, ts_str))
+    print(f"{skipped} timestamps already processed, {len(pending)} to fetch "
+          f"(prefetch {args.prefetch}, {args.workers} processing workers)\n")
 
-        print(f"[{i+1}/{len(timestamps)}] {ts_str}")
-
-        # Find product
-        product = find_product(collection, ts)
-        if not product:
-            print(f"    WARNING: No product found near {ts_str}")
-            failed += 1
-            continue
-
-        print(f"    Product: {product}")
-
-        # Download
-        try:
-            nat_path = download_native(product, TMP_DIR)
-            if not nat_path:
-                print(f"    ERROR: No .nat file in product")
-                failed += 1
-                continue
-        except Exception as e:
-            print(f"    ERROR downloading: {e}")
-            failed += 1
-            continue
+    ready = queue.Queue(maxsize=args.prefetch)
+    io_thread = threading.Thread(target=downloader, args=(collection, pending, ready), daemon=True)
+    io_thread.start()
 
-        # Process to COG
+    def finish(future):
+        nonlocal success, failed
+        ts_str, nat_path = running.pop(future)
         try:
-            process_to_cog(nat_path, ts_str, VIS_OUTPUT_DIR, IR_OUTPUT_DIR)
+            future.result()
             success += 1
+            print(f"[{success + failed}/{len(pending)}] {ts_str} ✓")
         except Exception as e:
-            print(f"    ERROR processing: {e}")
-            import traceback
-            traceback.print_exc()
             failed += 1
-            continue
+            print(f"[{success + failed}/{len(pending)}] {ts_str} ERROR processing: {e}")
         finally:
             # Clean up raw file to save disk
-            if not args.keep_native and nat_path and nat_path.exists():
+            if not args.keep_native and nat_path.exists():
                 nat_path.unlink()
-                print(f"    Cleaned up raw file")
+
+    t0 = time.time()
+    running = {}
+    # Until the nearest-neighbour cache exists, conversions run one at a time:
+    # concurrent first runs would each compute and write the same cache files
+    cache_warm = RESAMPLE_CACHE_DIR.exists() and any(RESAMPLE_CACHE_DIR.iterdir())
+    dask_threads = max(1, (os.cpu_count() or 1) // args.workers)
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(dask_threads,)) as pool:
+        while True:
+            # Free a processing slot before taking the next download off the queue
+            while len(running) >= args.workers:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+            job = ready.get()
+            if job is None:
+                break
+            ts_str, nat_path, error = job
+            if error:
+                failed += 1
+                print(f"[{success + failed}/{len(pending)}] {ts_str} ERROR: {error}")
+                continue
+            future = pool.submit(process_to_cog, nat_path, ts_str, VIS_OUTPUT_DIR, IR_OUTPUT_DIR)
+            running[future] = (ts_str, nat_path)
+            if not cache_warm:
+                wait([future])
+                finish(future)
+                cache_warm = RESAMPLE_CACHE_DIR.exists() and any(RESAMPLE_CACHE_DIR.iterdir())
+        for future in as_completed(list(running)):
+            finish(future)
+    io_thread.join()
+    print(f"\nPipeline finished in {(time.time() - t0) / 60:.1f} min")
 
     # Summary
     print(f"\n{'='*60}")
@@ -18,6 +18,9 @@ from pathlib import Path
 import numpy as np
 import requests
 
+from daily_aggregate import hourly_to_daily, to_float_array
+from feature_writer import FeatureWriter
+
 ROOT = Path(__file__).parent.parent
 DATA_DIR = ROOT / "data"
 
@@ -85,15 +88,10 @@ def compute_ivt_from_hourly(data):
     return np.sqrt(ivt_u**2 + ivt_v**2)
 
 
-def hourly_to_daily(times, values):
-    daily = {}
-    for t, v in zip(times, values):
-        date = t[:10]
-        if date not in daily:
-            daily[date] = []
-        if not np.isnan(v):
-            daily[date].append(v)
-    return {d: float(np.mean(vs)) if vs else 0.0 for d, vs in sorted(daily.items())}
+def daily_mean_ivt(times, values):
+    """Hourly IVT → {date: daily mean}, 0.0 for days with no valid hours."""
+    dates, daily = hourly_to_daily(times, values, how="mean")
+    return dict(zip(dates, np.nan_to_num(daily, nan=0.0).tolist()))
 
 
 def fetch_with_retry(lat, lon, session, max_retries=5):
@@ -190,9 +188,9 @@ def main():
                 times = hourly["time"]
                 for var_key in hourly:
                     if var_key != "time":
-                        hourly[var_key] = [float(v) if v is not None else float('nan') for v in hourly[var_key]]
+                        hourly[var_key] = to_float_array(hourly[var_key])
                 ivt_mag = compute_ivt_from_hourly(hourly)
-                daily = hourly_to_daily(times, ivt_mag.tolist())
+                daily = daily_mean_ivt(times, ivt_mag)
                 all_daily[key] = daily
                 fetched += 1
             except Exception as e:
@@ -259,34 +257,30 @@ def main():
     }
 
     print("\nStorm peaks:")
-    peak_features = []
-    for storm_name, (start, end) in storm_windows.items():
-        storm_dates = [d for d in dates if start <= d <= end]
-        if not storm_dates:
-            continue
-        storm_indices = [dates.index(d) for d in storm_dates]
-        storm_slice = ivt_grid[storm_indices]
-        max_val = storm_slice.max()
-        max_idx = np.unravel_index(storm_slice.argmax(), storm_slice.shape)
-        peak_date = storm_dates[max_idx[0]]
-        peak_lat = out_lats[max_idx[1]]
-        peak_lon = out_lons[max_idx[2]]
-        print(f"  {storm_name}: {peak_date}  max IVT = {max_val:.1f} "
-              f"at ({peak_lat:.1f}°N, {peak_lon:.1f}°E)")
-
-        # AR-threshold features
-        for di, d_idx in enumerate(storm_indices):
-            for li in range(n_out_lats):
-                for lj in range(n_out_lons):
-                    val = ivt_grid[d_idx, li, lj]
-                    if val > 250:
-                        peak_features.append({
-                            "type": "Feature",
-                            "geometry": {"type": "Point",
-                                         "coordinates": [float(out_lons[lj]), float(out_lats[li])]},
-                            "properties": {"ivt": round(float(val), 1),
-                                           "date": storm_dates[di], "storm": storm_name}
-                        })
+    peak_path = qgis_dir / "ivt-peak-storm.geojson"
+    with FeatureWriter(peak_path) as peaks:
+        for storm_name, (start, end) in storm_windows.items():
+            storm_dates = [d for d in dates if start <= d <= end]
+            if not storm_dates:
+                continue
+            storm_indices = [dates.index(d) for d in storm_dates]
+            storm_slice = ivt_grid[storm_indices]
+            max_val = storm_slice.max()
+            max_idx = np.unravel_index(storm_slice.argmax(), storm_slice.shape)
+            peak_date = storm_dates[max_idx[0]]
+            peak_lat = out_lats[max_idx[1]]
+            peak_lon = out_lons[max_idx[2]]
+            print(f"  {storm_name}: {peak_date}  max IVT = {max_val:.1f} "
+                  f"at ({peak_lat:.1f}°N, {peak_lon:.1f}°E)")
+
+            # AR-threshold features
+            for di, li, lj in zip(*np.nonzero(storm_slice > 250)):
+                peaks.write(
+                    {"ivt": round(float(storm_slice[di, li, lj]), 1),
+                     "date": storm_dates[di], "storm": storm_name},
+                    {"type": "Point", "coordinates": [float(out_lons[lj]), float(out_lats[li])]},
+                )
+    print(f"  Written {len(peaks)} AR-threshold features to {peak_path}")
 
     # === Write COGs ===
     print(f"\n=== Writing COGs ===")
@@ -324,12 +318,6 @@ def main():
             dst.update_tags(ns="rio_overview", resampling="average")
     print(f"  Written {n_days} COGs to {cog_dir}/")
 
-    # === Write GeoJSON ===
-    peak_path = qgis_dir / "ivt-peak-storm.geojson"
-    with open(peak_path, "w") as f:
-        json.dump({"type": "FeatureCollection", "features": peak_features}, f)
-    print(f"  Written {len(peak_features)} peak features to {peak_path}")
-
     # === Write Parquet ===
     print(f"\n=== Writing Parquet ===")
     import pyarrow as pa
@@ -389,7 +377,7 @@ Storm peaks detected:""")
     print(f"""
 Files created:
   COGs: {n_days} files at {cog_dir}/
-  GeoJSON: {peak_path} ({len(peak_features)} features)
+  GeoJSON: {peak_path} ({len(peaks)} features)
   Parquet: {parquet_path} ({len(rows_lat)} rows)
 """)
 
@@ -12,6 +12,8 @@ import time
 from pathlib import Path
 from itertools import product
 
+from daily_aggregate import hourly_to_daily, to_float_array
+
 # 1° grid across North Atlantic → Iberia (coarser than prompt's 0.5°)
 ivt_lats = np.arange(25, 55, 1.0)  # 30 points
 ivt_lons = np.arange(-45, 5, 1.0)  # 50 points
@@ -39,43 +41,34 @@ for i, (lat, lon) in enumerate(ivt_grid):
         data = resp.json()
         hourly = data["hourly"]
 
-        # Build hourly dataframe
-        hdf = pd.DataFrame({
-            "time": pd.to_datetime(hourly["time"]),
-            "rh": hourly["relative_humidity_2m"],
-            "ws": hourly["wind_speed_10m"],
-            "wd": hourly["wind_direction_10m"],
-            "precip": hourly["precipitation"],
-        })
-        hdf["date"] = hdf["time"].dt.date
+        rh = to_float_array(hourly["relative_humidity_2m"])
+        ws = to_float_array(hourly["wind_speed_10m"])
+        wd = to_float_array(hourly["wind_direction_10m"])
+        precip = to_float_array(hourly["precipitation"])
 
         # Compute moisture flux proxy per hour:
         # moisture_flux = (RH/100) * wind_speed * directional_weight
         # directional_weight = max(0, cos(wind_dir - 225°)) [favors SW→NE flow]
         # 225° = coming FROM southwest
-        hdf["rh_frac"] = hdf["rh"].fillna(50) / 100.0
-        hdf["ws_clean"] = hdf["ws"].fillna(0)
-        wd_rad = np.deg2rad(hdf["wd"].fillna(0) - 225)
-        hdf["dir_weight"] = np.clip(np.cos(wd_rad), 0, 1)
-        hdf["moisture_flux"] = hdf["rh_frac"] * hdf["ws_clean"] * hdf["dir_weight"]
+        rh_frac = np.nan_to_num(rh, nan=50.0) / 100.0
+        ws_clean = np.nan_to_num(ws, nan=0.0)
+        dir_weight = np.clip(np.cos(np.deg2rad(np.nan_to_num(wd, nan=0.0) - 225)), 0, 1)
+        moisture_flux = rh_frac * ws_clean * dir_weight
 
-        # Aggregate to daily
-        daily = hdf.groupby("date").agg({
-            "moisture_flux": "mean",
-            "rh": "mean",
-            "ws": "mean",
-            "precip": "sum",
-        }).reset_index()
+        # Aggregate to daily: one reduceat over the stacked means, one for the sum
+        dates, means = hourly_to_daily(hourly["time"], np.vstack([moisture_flux, rh, ws]), how="mean")
+        _, precip_sum = hourly_to_daily(hourly["time"], precip, how="sum")
+        precip_sum = np.nan_to_num(precip_sum, nan=0.0)
 
-        for _, row in daily.iterrows():
+        for d, date in enumerate(dates):
             all_records.append({
-                "date": row["date"],
+                "date": date,
                 "lat": float(lat),
                 "lon": float(lon),
-                "moisture_flux": row["moisture_flux"],
-                "rh_mean": row["rh"],
-                "wind_mean": row["ws"],
-                "precip_sum": row["precip"],
+                "moisture_flux": means[0, d],
+                "rh_mean": means[1, d],
+                "wind_mean": means[2, d],
+                "precip_sum": precip_sum[d],
             })
 
         if (i + 1) % 100 == 0:
@@ -17,24 +17,25 @@ Requirements:
 - Set EUMETSAT_CONSUMER_KEY and EUMETSAT_CONSUMER_SECRET in .env or as env vars
 
 Usage:
-    python scripts/fetch_lightning.py                    # Download & convert to GeoJSON
+    python scripts/fetch_lightning.py                    # Download, write GeoJSON + PMTiles
     python scripts/fetch_lightning.py --start 2026-01-27 --end 2026-01-29
     python scripts/fetch_lightning.py --list-only        # Just list available products
 """
 
 import argparse
-import json
 import os
-import shutil
-import subprocess
 import sys
 import tempfile
 from pathlib import Path
 
+import geopandas as gpd
 import netCDF4 as nc
 import numpy as np
 import requests
 
+from feature_writer import FeatureWriter
+from vector_tiles import VectorLayer, write_pmtiles
+
 # --- Configuration ---
 COLLECTION_ID = "EO:EUM:DAT:0691"  # LFL = Lightning Flash Level 2
 SEARCH_API = "https://api.eumetsat.int/data/search-products/1.0.0/os"
@@ -219,27 +220,8 @@ def extract_flashes(nc_path):
 
 
 def write_geojson(flashes, output_path):
-    """Write flash records as GeoJSON FeatureCollection."""
-    features = []
-    for f in flashes:
-        features.append({
-            "type": "Feature",
-            "geometry": {
-                "type": "Point",
-                "coordinates": [f["lon"], f["lat"]],
-            },
-            "properties": {
-                "timestamp": f["timestamp"],
-                "radiance": f["radiance"],
-                "duration_ms": f["duration_ms"],
-                "groups": f["groups"],
-                "events": f["events"],
-                "type": "flash",
-            },
-        })
-
-    geojson = {
-        "type": "FeatureCollection",
+    """Stream flash records out as a GeoJSON FeatureCollection."""
+    collection = {
         "properties": {
             "source": "EUMETSAT MTG Lightning Imager (LI) Level 2 — Lightning Flash",
             "collection": COLLECTION_ID,
@@ -249,14 +231,30 @@ def write_geojson(flashes, output_path):
             "license": "EUMETSAT Data Policy",
             "bbox": [BBOX_WEST, BBOX_SOUTH, BBOX_EAST, BBOX_NORTH],
         },
-        "features": features,
     }
 
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, "w") as fp:
-        json.dump(geojson, fp)
+    with FeatureWriter(output_path, members=collection) as writer:
+        for f in flashes:
+            writer.write({
+                "timestamp": f["timestamp"],
+                "radiance": f["radiance"],
+                "duration_ms": f["duration_ms"],
+                "groups": f["groups"],
+                "events": f["events"],
+                "type": "flash",
+            }, {"type": "Point", "coordinates": [f["lon"], f["lat"]]})
+
+    return len(writer)
 
-    return len(features)
+
+def flash_layer(flashes):
+    """Flash records → "lightning" vector tile layer, z4–14."""
+    gdf = gpd.GeoDataFrame(
+        [{k: v for k, v in f.items() if k not in ("lat", "lon")} | {"type": "flash"} for f in flashes],
+        geometry=gpd.points_from_xy([f["lon"] for f in flashes], [f["lat"] for f in flashes]),
+        crs="EPSG:4326",
+    )
+    return VectorLayer("lightning", gdf, minzoom=4, maxzoom=14)
 
 
 def main():
@@ -264,7 +262,8 @@ def main():
     parser.add_argument("--start", default="2026-01-27", help="Start date (YYYY-MM-DD)")
     parser.add_argument("--end", default="2026-01-29", help="End date (YYYY-MM-DD)")
     parser.add_argument("--list-only", action="store_true", help="List products without downloading")
-    parser.add_argument("--output", default=None, help="Output GeoJSON path")
+    parser.add_argument("--output", default=None,
+                        help="Output path; .geojson, .ndjson, .parquet or .fgb (default: GeoJSON)")
     args = parser.parse_args()
 
     start = args.start if "T" in args.start else f"{args.start}T00:00:00Z"
@@ -331,23 +330,12 @@ def main():
     write_geojson(all_flashes, qgis_output)
     print(f"Wrote {n} features to {qgis_output}")
 
-    # Convert to PMTiles
-    if shutil.which("tippecanoe"):
-        pmtiles_path = OUT_DIR / "lightning-kristin.pmtiles"
-        cmd = [
-            "tippecanoe",
-            "-o", str(pmtiles_path),
-            "-l", "lightning",
-            "-z", "14", "-Z", "4",
-            "--drop-densest-as-needed",
-            "--force",
-            str(output),
-        ]
-        print("Converting to PMTiles...")
-        subprocess.run(cmd, check=True)
-        print(f"Wrote {pmtiles_path}")
-    else:
-        print("tippecanoe not found — skipping PMTiles conversion")
+    # Tile straight from the flash records (no GeoJSON round-trip)
+    pmtiles_path = OUT_DIR / "lightning-kristin.pmtiles"
+    print("Tiling to PMTiles...")
+    n_tiles = write_pmtiles(pmtiles_path, [flash_layer(all_flashes)],
+                            metadata={"name": "lightning", "attribution": "EUMETSAT MTG-LI"})
+    print(f"Wrote {pmtiles_path} ({n_tiles} tiles)")
 
 
 if __name__ == "__main__":
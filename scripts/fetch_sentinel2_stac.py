@@ -17,6 +17,20 @@ Products generated:
   3. NDWI difference: after - before (positive = new water / flooding)
   4. STAC Item JSON per scene (1.0.0 spec)
   5. Full search results JSON
+  6. Entries for all rasters in the local STAC catalog (stac_catalog.py)
+
+STAC searches are cached per query in <output-dir>/.search-cache/, so reruns
+do not query Earth Search again unless --refresh-search is given.
+
+All rasters are processed in BLOCK x BLOCK windows aligned to the output
+tiles and written block by block, and the true-color stretch uses a
+streaming histogram instead of global percentiles over an in-memory stack,
+so memory stays bounded for any AOI size (all CEMS AOIs, national mosaics).
+
+With --composite, every candidate scene of a period contributes instead of
+only the least cloudy one: pixels are masked with the Scene Classification
+(SCL) band and combined per pixel (median, or the clear observation with
+the highest NDWI), so partly cloudy passes still fill the after-flood window.
 
 Output: data/sentinel-2/
 
@@ -24,6 +38,7 @@ Usage:
   python scripts/fetch_sentinel2_stac.py                  # Default search
   python scripts/fetch_sentinel2_stac.py --output-dir data/sentinel-2
   python scripts/fetch_sentinel2_stac.py --max-cloud-before 10  # Stricter cloud filter
+  python scripts/fetch_sentinel2_stac.py --composite median --max-cloud-after 80
 
 Attribution:
   Contains modified Copernicus Sentinel data 2026, processed by ESA.
@@ -33,22 +48,32 @@ Attribution:
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import logging
 import os
 import sys
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
 
 import numpy as np
 import rasterio
+from affine import Affine
 from rasterio.crs import CRS
-from rasterio.transform import from_bounds
-from rasterio.warp import reproject, Resampling
-from rasterio.windows import from_bounds as window_from_bounds
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import Resampling, transform_bounds
+from rasterio.windows import Window
+from pystac import Item
 from pystac_client import Client
 
+from stac_catalog import index_files, write_catalog
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s %(message)s",
@@ -81,12 +106,39 @@ TRUE_COLOR_BANDS = ["red", "green", "blue"]  # B04, B03, B02
 NDWI_GREEN = "green"  # B03
 NDWI_NIR = "nir"      # B08
 
+# Compositing: bands kept in composites and the Scene Classification (SCL)
+# classes counted as clear — 4 vegetation, 5 bare soil, 6 water, 7 unclassified,
+# 11 snow; excluded are no-data, saturated, dark/shadow, cloud and cirrus
+COMPOSITE_BANDS = ["red", "green", "blue", "nir"]  # B04, B03, B02, B08
+SCL_BAND = "scl"
+CLEAR_SCL = [4, 5, 6, 7, 11]
+COMPOSITE_METHODS = ["median", "max-ndwi"]
+
 # Percentile stretch for true-color
 STRETCH_LOW = 2
 STRETCH_HIGH = 98
 
 # Output CRS (Web Mercator for tiling compatibility)
 OUTPUT_CRS = CRS.from_epsg(32629)  # UTM 29N — native for Portugal
+RESOLUTION = 10.0  # metres, native for B02/B03/B04/B08
+
+# Processing window = output COG tile size; memory is bounded by a few
+# BLOCK x BLOCK arrays whatever the AOI size
+BLOCK = 512
+
+# GDAL settings for reading remote COGs: no directory listing on open, HTTP/2
+# multiplexed range requests, merged adjacent ranges and a shared block cache
+GDAL_ENV = {
+    "AWS_NO_SIGN_REQUEST": "YES",
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.TIF,.tiff",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_VERSION": "2",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_CACHEMAX": 512,
+    "VSI_CACHE": "TRUE",
+    "VSI_CACHE_SIZE": 64 * 1024 * 1024,
+}
 
 OUTPUT_DIR = Path("data/sentinel-2")
 
@@ -95,23 +147,61 @@ OUTPUT_DIR = Path("data/sentinel-2")
 # STAC search
 # ---------------------------------------------------------------------------
 
+_client: Client | None = None
+
+
+def stac_client() -> Client:
+    """Earth Search client, opened on first use (not at all when every search is cached)."""
+    global _client
+    if _client is None:
+        log.info("Connecting to Earth Search STAC: %s", STAC_URL)
+        _client = Client.open(STAC_URL)
+    return _client
+
+
 def search_scenes(
-    catalog: Client,
     date_start: str,
     date_end: str,
     max_cloud: int,
     max_items: int = 10,
+    cache_dir: Path | None = None,
+    refresh: bool = False,
 ) -> list[dict[str, Any]]:
-    """Search STAC catalog for Sentinel-2 scenes within date range and cloud cover."""
-    search = catalog.search(
-        collections=[COLLECTION],
-        bbox=BBOX,
-        datetime=f"{date_start}/{date_end}",
-        query={"eo:cloud_cover": {"lt": max_cloud}},
-        max_items=max_items,
-        sortby=[{"field": "properties.eo:cloud_cover", "direction": "asc"}],
-    )
-    items = list(search.items())
+    """Search STAC catalog for Sentinel-2 scenes within date range and cloud cover.
+
+    Results are cached in `cache_dir` keyed by the query, so reruns with the
+    same parameters do not hit Earth Search; `refresh` forces a new search.
+    """
+    query = {
+        "collections": [COLLECTION],
+        "bbox": BBOX,
+        "datetime": f"{date_start}/{date_end}",
+        "query": {"eo:cloud_cover": {"lt": max_cloud}},
+        "max_items": max_items,
+        "sortby": [{"field": "properties.eo:cloud_cover", "direction": "asc"}],
+    }
+    cache_path = None
+    if cache_dir is not None:
+        key = hashlib.sha1(json.dumps([STAC_URL, query], sort_keys=True).encode()).hexdigest()[:16]
+        cache_path = cache_dir / f"{key}.json"
+
+    if cache_path is not None and cache_path.exists() and not refresh:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        items = [Item.from_dict(d) for d in cached["items"]]
+        log.info("Using cached search from %s (%s)", cached["fetched_at"], cache_path.name)
+    else:
+        items = list(stac_client().search(**query).items())
+        if cache_path is not None:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = cache_path.with_suffix(".tmp")
+            with open(tmp, "w") as f:
+                json.dump({
+                    "query": query,
+                    "fetched_at": datetime.now(tz=timezone.utc).isoformat(),
+                    "items": [item.to_dict() for item in items],
+                }, f)
+            os.replace(tmp, cache_path)
     log.info(
         "Found %d scenes for %s to %s (cloud < %d%%)",
         len(items), date_start, date_end, max_cloud,
@@ -133,210 +223,352 @@ def select_best_scene(items: list) -> Any:
 # Raster I/O
 # ---------------------------------------------------------------------------
 
-def read_band_clipped(
-    href: str,
-    bbox: list[float],
-    target_crs: CRS = OUTPUT_CRS,
-) -> tuple[np.ndarray, rasterio.transform.Affine, CRS]:
-    """Read a single band from a COG href, clipped to bbox.
+@dataclass(frozen=True)
+class TargetGrid:
+    """Output pixel grid every band of every scene is warped into."""
 
-    The bbox is in EPSG:4326. We read the native window and reproject
-    to the target CRS, returning the clipped array and its transform.
-    """
-    os.environ["AWS_NO_SIGN_REQUEST"] = "YES"
-
-    with rasterio.open(href) as src:
-        # Compute window in source CRS (should be UTM for Sentinel-2)
-        # First, transform bbox to source CRS
-        from rasterio.warp import transform_bounds
-        src_bounds = transform_bounds(CRS.from_epsg(4326), src.crs, *bbox)
-        window = window_from_bounds(*src_bounds, transform=src.transform)
-
-        # Read windowed data
-        data = src.read(1, window=window)
-        win_transform = rasterio.windows.transform(window, src.transform)
-
-        if src.crs == target_crs:
-            return data, win_transform, target_crs
-
-        # Reproject if needed
-        dst_transform, dst_width, dst_height = rasterio.warp.calculate_default_transform(
-            src.crs, target_crs, data.shape[1], data.shape[0],
-            *src_bounds,
-        )
-        dst_data = np.zeros((dst_height, dst_width), dtype=data.dtype)
-        reproject(
-            source=data,
-            destination=dst_data,
-            src_transform=win_transform,
-            src_crs=src.crs,
-            dst_transform=dst_transform,
-            dst_crs=target_crs,
-            resampling=Resampling.bilinear,
-        )
-        return dst_data, dst_transform, target_crs
+    crs: CRS
+    transform: Affine
+    width: int
+    height: int
 
 
-def build_true_color(
-    item: Any,
+def target_grid(
     bbox: list[float],
-    output_path: Path,
-    stretch_low: int = STRETCH_LOW,
-    stretch_high: int = STRETCH_HIGH,
-) -> None:
-    """Build a 3-band uint8 true-color COG from a STAC item."""
-    bands = []
-    transform = None
-    crs = None
-
-    for band_name in TRUE_COLOR_BANDS:
-        href = item.assets[band_name].href
-        log.info("  Reading %s: %s", band_name, href.split("/")[-1])
-        data, transform, crs = read_band_clipped(href, bbox)
-        bands.append(data.astype(np.float32))
-
-    # Stack into (3, H, W)
-    height, width = bands[0].shape
-    # Handle potential size mismatches from different band resolutions
-    min_h = min(b.shape[0] for b in bands)
-    min_w = min(b.shape[1] for b in bands)
-    stack = np.stack([b[:min_h, :min_w] for b in bands])
-
-    # Percentile stretch to uint8
-    valid = stack[stack > 0]
-    if valid.size > 0:
-        low_val = np.percentile(valid, stretch_low)
-        high_val = np.percentile(valid, stretch_high)
-    else:
-        low_val, high_val = 0, 10000
-
-    stretched = np.clip((stack - low_val) / (high_val - low_val) * 255, 0, 255).astype(np.uint8)
-
-    # Write COG
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    crs: CRS = OUTPUT_CRS,
+    resolution: float = RESOLUTION,
+) -> TargetGrid:
+    """Grid covering the EPSG:4326 bbox in `crs`, snapped to whole `resolution` pixels."""
+    west, south, east, north = transform_bounds(CRS.from_epsg(4326), crs, *bbox)
+    west = np.floor(west / resolution) * resolution
+    north = np.ceil(north / resolution) * resolution
+    width = int(np.ceil((east - west) / resolution))
+    height = int(np.ceil((north - south) / resolution))
+    return TargetGrid(crs, from_origin(west, north, resolution, resolution), width, height)
+
+
+def block_windows(grid: TargetGrid, size: int = BLOCK) -> Iterator[Window]:
+    """size × size windows tiling `grid`, aligned to the output COG blocks."""
+    for row in range(0, grid.height, size):
+        for col in range(0, grid.width, size):
+            yield Window(col, row, min(size, grid.width - col), min(size, grid.height - row))
+
+
+def cog_profile(grid: TargetGrid, dtype: str, count: int = 1, nodata: float | None = None) -> dict:
+    """GTiff creation profile for a tiled output on `grid` with BLOCK-sized tiles."""
     profile = {
         "driver": "GTiff",
-        "dtype": "uint8",
-        "width": min_w,
-        "height": min_h,
-        "count": 3,
-        "crs": crs,
-        "transform": transform,
+        "dtype": dtype,
+        "width": grid.width,
+        "height": grid.height,
+        "count": count,
+        "crs": grid.crs,
+        "transform": grid.transform,
         "compress": "deflate",
         "tiled": True,
-        "blockxsize": 256,
-        "blockysize": 256,
+        "blockxsize": BLOCK,
+        "blockysize": BLOCK,
+        "BIGTIFF": "IF_SAFER",
     }
-    with rasterio.open(output_path, "w", **profile) as dst:
-        for i in range(3):
-            dst.write(stretched[i], i + 1)
-        dst.build_overviews([2, 4, 8, 16], Resampling.average)
-        dst.update_tags(ns="rio_overview", resampling="average")
+    if nodata is not None:
+        profile["nodata"] = nodata
+    return profile
 
-    log.info("Wrote true-color COG: %s (%d x %d)", output_path, min_w, min_h)
 
+def add_overviews(dst: Any) -> None:
+    dst.build_overviews([2, 4, 8, 16], Resampling.average)
+    dst.update_tags(ns="rio_overview", resampling="average")
 
-def compute_ndwi(
-    item: Any,
-    bbox: list[float],
-    output_path: Path,
-) -> np.ndarray:
-    """Compute NDWI = (Green - NIR) / (Green + NIR) and write as float32 COG.
 
-    Returns the NDWI array for difference computation.
+def asset_hrefs(item: Any, band_names: list[str]) -> dict[str, str]:
+    """Band name → COG href for the given assets of a STAC item."""
+    return {name: item.assets[name].href for name in band_names}
+
+
+class BandReader:
+    """Windowed reads of several bands (band name → COG href), all warped onto one grid.
+
+    Each band is opened once as a WarpedVRT over the whole grid; `read`
+    then fetches one window of every band concurrently, so only the source
+    blocks intersecting that window are requested. Nodata (0 in L2A) stays 0.
     """
-    green_href = item.assets[NDWI_GREEN].href
-    nir_href = item.assets[NDWI_NIR].href
 
-    log.info("  Reading green (B03): %s", green_href.split("/")[-1])
-    green, transform, crs = read_band_clipped(green_href, bbox)
-    log.info("  Reading NIR (B08): %s", nir_href.split("/")[-1])
-    nir, nir_transform, _ = read_band_clipped(nir_href, bbox)
+    def __init__(
+        self,
+        hrefs: dict[str, str],
+        grid: TargetGrid,
+        resampling: dict[str, Resampling] | None = None,
+    ) -> None:
+        self.hrefs = hrefs
+        self.band_names = list(hrefs)
+        self.grid = grid
+        self.resampling = resampling or {}
+
+    def __enter__(self) -> BandReader:
+        self.env = rasterio.Env(**GDAL_ENV)
+        self.env.__enter__()
+        self.sources = []
+        self.vrts = {}
+        for name, href in self.hrefs.items():
+            log.info("  Opening %s: %s", name, href.split("/")[-1])
+            src = rasterio.open(href)
+            self.sources.append(src)
+            self.vrts[name] = WarpedVRT(
+                src,
+                crs=self.grid.crs,
+                transform=self.grid.transform,
+                width=self.grid.width,
+                height=self.grid.height,
+                resampling=self.resampling.get(name, Resampling.bilinear),
+                src_nodata=src.nodata if src.nodata is not None else 0,
+                nodata=0,
+            )
+        self.pool = ThreadPoolExecutor(max_workers=len(self.band_names))
+        return self
+
+    def _read(self, name: str, window: Window) -> np.ndarray:
+        with rasterio.Env(**GDAL_ENV):
+            return self.vrts[name].read(1, window=window)
+
+    def read(self, window: Window) -> dict[str, np.ndarray]:
+        """One window of every band, read in parallel."""
+        futures = {name: self.pool.submit(self._read, name, window) for name in self.band_names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def __exit__(self, *exc: Any) -> None:
+        self.pool.shutdown()
+        for vrt in self.vrts.values():
+            vrt.close()
+        for src in self.sources:
+            src.close()
+        self.env.__exit__(*exc)
+
+
+class PercentileSketch:
+    """Streaming percentiles of integer reflectances via a fixed-bin histogram.
+
+    Memory is one int64 counter per bin regardless of how many pixels are
+    added; each percentile is accurate to one bin width (`bin_width` DN).
+    """
+
+    def __init__(self, max_value: int = 65535, bin_width: int = 1) -> None:
+        self.bin_width = bin_width
+        self.counts = np.zeros(max_value // bin_width + 1, dtype=np.int64)
+
+    def update(self, values: np.ndarray) -> None:
+        if values.size:
+            self.counts += np.bincount(values.ravel() // self.bin_width, minlength=self.counts.size)
 
-    # Align shapes
-    min_h = min(green.shape[0], nir.shape[0])
-    min_w = min(green.shape[1], nir.shape[1])
-    green = green[:min_h, :min_w].astype(np.float32)
-    nir = nir[:min_h, :min_w].astype(np.float32)
+    def percentile(self, q: float) -> float | None:
+        total = self.counts.sum()
+        if total == 0:
+            return None
+        cdf = np.cumsum(self.counts)
+        return float(np.searchsorted(cdf, q / 100 * total) * self.bin_width)
 
-    # NDWI: positive values = water
-    denominator = green + nir
-    ndwi = np.where(denominator > 0, (green - nir) / denominator, 0.0).astype(np.float32)
 
-    # Write COG
+def build_true_color(
+    hrefs: dict[str, str],
+    grid: TargetGrid,
+    output_path: Path,
+    stretch_low: int = STRETCH_LOW,
+    stretch_high: int = STRETCH_HIGH,
+) -> None:
+    """Build a 3-band uint8 true-color COG from red/green/blue band hrefs.
+
+    The stretch needs percentiles over the whole scene before the first
+    block can be written, so the raw reflectances are spooled block by
+    block into a local uint16 GTiff while the percentile sketch is built,
+    then stretched from the spool into the output.
+    """
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    profile = {
-        "driver": "GTiff",
-        "dtype": "float32",
-        "width": min_w,
-        "height": min_h,
-        "count": 1,
-        "crs": crs,
-        "transform": transform,
-        "compress": "deflate",
-        "tiled": True,
-        "blockxsize": 256,
-        "blockysize": 256,
-        "nodata": np.nan,
-    }
-    with rasterio.open(output_path, "w", **profile) as dst:
-        dst.write(ndwi, 1)
-        dst.build_overviews([2, 4, 8, 16], Resampling.average)
-        dst.update_tags(ns="rio_overview", resampling="average")
+    spool_path = output_path.with_name(f".{output_path.stem}.raw.tif")
+    sketch = PercentileSketch()
+    try:
+        with BandReader(hrefs, grid) as reader, \
+                rasterio.open(spool_path, "w", **cog_profile(grid, "uint16", 3)) as spool:
+            for window in block_windows(grid):
+                bands = reader.read(window)
+                # (3, h, w) — every band is already on the same grid
+                stack = np.stack([bands[name] for name in TRUE_COLOR_BANDS])
+                sketch.update(stack[stack > 0])
+                spool.write(stack, window=window)
+
+        low_val = sketch.percentile(stretch_low)
+        high_val = sketch.percentile(stretch_high)
+        if low_val is None or high_val <= low_val:
+            low_val, high_val = 0, 10000
+        log.info("  Stretch p%d-p%d: %g-%g", stretch_low, stretch_high, low_val, high_val)
+
+        scale = 255 / (high_val - low_val)
+        with rasterio.open(spool_path) as spool, \
+                rasterio.open(output_path, "w", **cog_profile(grid, "uint8", 3)) as dst:
+            for window in block_windows(grid):
+                stack = spool.read(window=window).astype(np.float32)
+                stretched = np.clip((stack - low_val) * scale, 0, 255).astype(np.uint8)
+                dst.write(stretched, window=window)
+            add_overviews(dst)
+    finally:
+        spool_path.unlink(missing_ok=True)
+
+    log.info("Wrote true-color COG: %s (%d x %d)", output_path, grid.width, grid.height)
+
+
+def compute_ndwi(
+    hrefs: dict[str, str],
+    grid: TargetGrid,
+    output_path: Path,
+) -> None:
+    """Compute NDWI = (Green - NIR) / (Green + NIR) and write as float32 COG, block by block."""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with BandReader(hrefs, grid) as reader, \
+            rasterio.open(output_path, "w", **cog_profile(grid, "float32", nodata=np.nan)) as dst:
+        for window in block_windows(grid):
+            bands = reader.read(window)
+            green = bands[NDWI_GREEN].astype(np.float32)
+            nir = bands[NDWI_NIR].astype(np.float32)
+
+            # NDWI: positive values = water
+            denominator = green + nir
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ndwi = np.where(denominator > 0, (green - nir) / denominator, 0.0)
+            dst.write(ndwi.astype(np.float32), 1, window=window)
+        add_overviews(dst)
 
     log.info("Wrote NDWI COG: %s", output_path)
-    return ndwi
 
 
 def compute_ndwi_diff(
-    before_ndwi: np.ndarray,
-    after_ndwi: np.ndarray,
-    transform: rasterio.transform.Affine,
-    crs: CRS,
+    before_path: Path,
+    after_path: Path,
+    grid: TargetGrid,
     output_path: Path,
 ) -> None:
-    """Compute NDWI difference (after - before). Positive = new water (flooding)."""
-    min_h = min(before_ndwi.shape[0], after_ndwi.shape[0])
-    min_w = min(before_ndwi.shape[1], after_ndwi.shape[1])
-
-    diff = (after_ndwi[:min_h, :min_w] - before_ndwi[:min_h, :min_w]).astype(np.float32)
-
+    """Compute NDWI difference (after - before) from the two NDWI COGs. Positive = new water (flooding)."""
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    profile = {
-        "driver": "GTiff",
-        "dtype": "float32",
-        "width": min_w,
-        "height": min_h,
-        "count": 1,
-        "crs": crs,
-        "transform": transform,
-        "compress": "deflate",
-        "tiled": True,
-        "blockxsize": 256,
-        "blockysize": 256,
-        "nodata": np.nan,
-    }
-    with rasterio.open(output_path, "w", **profile) as dst:
-        dst.write(diff, 1)
-        dst.build_overviews([2, 4, 8, 16], Resampling.average)
-        dst.update_tags(ns="rio_overview", resampling="average")
-
-    positive = (diff > 0).sum()
-    total = diff.size
+    positive = 0
+    with rasterio.open(before_path) as before, rasterio.open(after_path) as after, \
+            rasterio.open(output_path, "w", **cog_profile(grid, "float32", nodata=np.nan)) as dst:
+        for window in block_windows(grid):
+            diff = after.read(1, window=window) - before.read(1, window=window)
+            positive += int((diff > 0).sum())
+            dst.write(diff.astype(np.float32), 1, window=window)
+        add_overviews(dst)
+
+    total = grid.width * grid.height
     log.info(
         "Wrote NDWI diff COG: %s — %d/%d pixels positive (%.1f%%)",
         output_path, positive, total, 100 * positive / total if total else 0,
     )
 
 
+# ---------------------------------------------------------------------------
+# Multi-scene compositing
+# ---------------------------------------------------------------------------
+
+def composite_block(
+    scenes: list[dict[str, np.ndarray]],
+    method: str,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Per-pixel composite of one block across scenes.
+
+    Returns the (bands, h, w) uint16 composite of COMPOSITE_BANDS (0 where
+    no scene had a clear observation) and the (h, w) clear-observation count.
+    """
+    bands = np.stack([
+        np.stack([scene[name] for name in COMPOSITE_BANDS]) for scene in scenes
+    ])  # (scenes, bands, h, w)
+    clear = np.stack([
+        np.isin(scene[SCL_BAND], CLEAR_SCL) & (scene[NDWI_GREEN] > 0) for scene in scenes
+    ])  # (scenes, h, w)
+    count = clear.sum(axis=0)
+
+    if method == "median":
+        values = np.where(clear[:, None], bands.astype(np.float32), np.nan)
+        with np.errstate(all="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN pixels
+            composite = np.nanmedian(values, axis=0)
+        composite = np.nan_to_num(composite, nan=0.0).round()
+    elif method == "max-ndwi":
+        green = bands[:, COMPOSITE_BANDS.index(NDWI_GREEN)].astype(np.float32)
+        nir = bands[:, COMPOSITE_BANDS.index(NDWI_NIR)].astype(np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ndwi = (green - nir) / (green + nir)
+        ndwi = np.where(clear, ndwi, -np.inf)
+        best = ndwi.argmax(axis=0)  # (h, w)
+        composite = np.take_along_axis(bands, best[None, None], axis=0)[0]
+        composite = np.where(count > 0, composite, 0)
+    else:
+        raise ValueError(f"Unknown composite method: {method}")
+
+    return composite.astype(np.uint16), np.minimum(count, 255).astype(np.uint8)
+
+
+def build_composite(
+    items: list,
+    grid: TargetGrid,
+    output_prefix: Path,
+    method: str,
+) -> dict[str, str]:
+    """Cloud-free per-pixel composite of all candidate items, tile by tile.
+
+    Each item's bands and SCL are read through its own BandReader, and the
+    items of a tile are read concurrently, so memory is bounded by
+    len(items) x len(COMPOSITE_BANDS) BLOCK-sized arrays. Writes one uint16
+    COG per band plus a clear-observation count band, and returns band
+    name → path for build_true_color / compute_ndwi.
+    """
+    output_prefix.parent.mkdir(parents=True, exist_ok=True)
+    paths = {name: output_prefix.with_name(f"{output_prefix.name}-{name}.tif")
+             for name in COMPOSITE_BANDS}
+    count_path = output_prefix.with_name(f"{output_prefix.name}-clear-count.tif")
+    resampling = {SCL_BAND: Resampling.nearest}
+    empty = 0
+
+    with ExitStack() as stack:
+        readers = []
+        for item in items:
+            log.info("  Compositing %s (cloud=%.1f%%)", item.id, item.properties.get("eo:cloud_cover", -1))
+            hrefs = asset_hrefs(item, COMPOSITE_BANDS + [SCL_BAND])
+            readers.append(stack.enter_context(BandReader(hrefs, grid, resampling)))
+        outputs = {name: stack.enter_context(rasterio.open(path, "w", **cog_profile(grid, "uint16", nodata=0)))
+                   for name, path in paths.items()}
+        counts = stack.enter_context(rasterio.open(count_path, "w", **cog_profile(grid, "uint8")))
+        pool = stack.enter_context(ThreadPoolExecutor(max_workers=len(readers)))
+
+        for window in block_windows(grid):
+            scenes = list(pool.map(lambda reader: reader.read(window), readers))
+            composite, count = composite_block(scenes, method)
+            for i, name in enumerate(COMPOSITE_BANDS):
+                outputs[name].write(composite[i], 1, window=window)
+            counts.write(count, 1, window=window)
+            empty += int((count == 0).sum())
+
+        for dst in [*outputs.values(), counts]:
+            add_overviews(dst)
+
+    log.info(
+        "Wrote %s composite of %d scenes: %s-*.tif (%.1f%% of pixels without a clear observation)",
+        method, len(items), output_prefix, 100 * empty / (grid.width * grid.height),
+    )
+    return {name: str(path) for name, path in paths.items()}
+
+
 # ---------------------------------------------------------------------------
 # STAC Item JSON output
 # ---------------------------------------------------------------------------
 
-def write_stac_item(item: Any, output_path: Path, local_assets: dict[str, str]) -> None:
+def write_stac_item(
+    item: Any,
+    output_path: Path,
+    local_assets: dict[str, str],
+    extra_properties: dict[str, Any] | None = None,
+) -> None:
     """Write a STAC 1.0.0-compliant Item JSON for a selected scene.
 
     Includes original STAC metadata plus references to local processed assets.
+    For composites, `item` is the least cloudy contributing scene and
+    `extra_properties` lists the composite method and all contributing items.
     """
     stac_item = {
         "type": "Feature",
@@ -357,6 +589,7 @@ def write_stac_item(item: Any, output_path: Path, local_assets: dict[str, str])
             "proj:epsg": item.properties.get("proj:epsg"),
             "sentinel:mgrs_tile": item.properties.get("grid:code", ""),
             "processing:software": {"cheias.pt/fetch_sentinel2_stac": "1.0"},
+            **(extra_properties or {}),
         },
         "links": [
             {
@@ -445,6 +678,7 @@ Examples:
   %(prog)s                              # Default parameters
   %(prog)s --max-cloud-before 10        # Stricter cloud filter for before scene
   %(prog)s --output-dir data/sentinel-2 # Custom output directory
+  %(prog)s --composite median           # Cloud-free per-pixel composites of all candidates
 
 Products:
   - True-color composites (3-band uint8 COG with overviews)
@@ -486,20 +720,30 @@ Attribution:
         "--after-end", default=AFTER_END,
         help="After period end date (default: %(default)s)",
     )
+    parser.add_argument(
+        "--composite", choices=COMPOSITE_METHODS, default=None,
+        help="Composite all candidate scenes per pixel (SCL cloud mask) instead of "
+             "using the single least-cloudy scene: median, or max-ndwi (wettest clear "
+             "observation, for the flood window)",
+    )
+    parser.add_argument(
+        "--refresh-search", action="store_true",
+        help="Ignore cached STAC search results and query Earth Search again",
+    )
     args = parser.parse_args()
 
     out = args.output_dir
     out.mkdir(parents=True, exist_ok=True)
 
-    # --- Step 1: Connect to STAC catalog ---
-    log.info("Connecting to Earth Search STAC: %s", STAC_URL)
-    catalog = Client.open(STAC_URL)
+    # --- Step 1: STAC searches are cached per query under the output dir ---
+    cache_dir = out / ".search-cache"
 
     # --- Step 2: Search for before scenes ---
     log.info("Searching for BEFORE scenes (%s to %s, cloud < %d%%)",
              args.before_start, args.before_end, args.max_cloud_before)
     before_items = search_scenes(
-        catalog, args.before_start, args.before_end, args.max_cloud_before,
+        args.before_start, args.before_end, args.max_cloud_before,
+        cache_dir=cache_dir, refresh=args.refresh_search,
     )
     before = select_best_scene(before_items)
     if before is None:
@@ -512,7 +756,8 @@ Attribution:
     log.info("Searching for AFTER scenes (%s to %s, cloud < %d%%)",
              args.after_start, args.after_end, args.max_cloud_after)
     after_items = search_scenes(
-        catalog, args.after_start, args.after_end, args.max_cloud_after,
+        args.after_start, args.after_end, args.max_cloud_after,
+        cache_dir=cache_dir, refresh=args.refresh_search,
     )
     after = select_best_scene(after_items)
     if after is None:
@@ -524,47 +769,84 @@ Attribution:
     # --- Step 4: Write search results ---
     write_search_results(before_items, after_items, before, after, out / "search-results.json")
 
-    # --- Step 5: Build true-color composites ---
-    before_date = before.datetime.strftime("%Y%m%d")
-    after_date = after.datetime.strftime("%Y%m%d")
+    # One grid for both periods, so before/after/diff align pixel for pixel
+    grid = target_grid(BBOX)
+    log.info("Target grid: %d x %d px at %g m (%s)", grid.width, grid.height, RESOLUTION, grid.crs)
+
+    # --- Step 5: Band sources — best single scene, or a per-pixel composite ---
+    if args.composite:
+        before_date = f"{args.before_start}_{args.before_end}".replace("-", "")
+        after_date = f"{args.after_start}_{args.after_end}".replace("-", "")
+        log.info("Building %s composite: BEFORE (%d scenes)", args.composite, len(before_items))
+        before_hrefs = build_composite(
+            before_items, grid, out / "composite" / f"before-{before_date}", args.composite,
+        )
+        log.info("Building %s composite: AFTER (%d scenes)", args.composite, len(after_items))
+        after_hrefs = build_composite(
+            after_items, grid, out / "composite" / f"after-{after_date}", args.composite,
+        )
+        composite_properties = {
+            "before": {"composite:method": args.composite, "composite:items": [i.id for i in before_items]},
+            "after": {"composite:method": args.composite, "composite:items": [i.id for i in after_items]},
+        }
+    else:
+        before_date = before.datetime.strftime("%Y%m%d")
+        after_date = after.datetime.strftime("%Y%m%d")
+        before_hrefs = asset_hrefs(before, COMPOSITE_BANDS)
+        after_hrefs = asset_hrefs(after, COMPOSITE_BANDS)
+        composite_properties = {"before": None, "after": None}
 
+    # --- Step 6: Build true-color composites ---
     before_tc_path = out / f"salvaterra-before-{before_date}.tif"
     after_tc_path = out / f"salvaterra-after-{after_date}.tif"
 
-    log.info("Building true-color composite: BEFORE (%s)", before.id)
-    build_true_color(before, BBOX, before_tc_path)
+    log.info("Building true-color composite: BEFORE (%s)", before_date)
+    build_true_color({b: before_hrefs[b] for b in TRUE_COLOR_BANDS}, grid, before_tc_path)
 
-    log.info("Building true-color composite: AFTER (%s)", after.id)
-    build_true_color(after, BBOX, after_tc_path)
+    log.info("Building true-color composite: AFTER (%s)", after_date)
+    build_true_color({b: after_hrefs[b] for b in TRUE_COLOR_BANDS}, grid, after_tc_path)
 
-    # --- Step 6: Compute NDWI ---
+    # --- Step 7: Compute NDWI ---
     before_ndwi_path = out / f"salvaterra-ndwi-before-{before_date}.tif"
     after_ndwi_path = out / f"salvaterra-ndwi-after-{after_date}.tif"
     diff_path = out / "salvaterra-ndwi-diff.tif"
 
-    log.info("Computing NDWI: BEFORE (%s)", before.id)
-    before_ndwi = compute_ndwi(before, BBOX, before_ndwi_path)
-
-    log.info("Computing NDWI: AFTER (%s)", after.id)
-    after_ndwi = compute_ndwi(after, BBOX, after_ndwi_path)
+    log.info("Computing NDWI: BEFORE (%s)", before_date)
+    compute_ndwi({b: before_hrefs[b] for b in (NDWI_GREEN, NDWI_NIR)}, grid, before_ndwi_path)
 
-    # Get transform from the before green band for the diff output
-    green_href = before.assets[NDWI_GREEN].href
-    _, diff_transform, diff_crs = read_band_clipped(green_href, BBOX)
+    log.info("Computing NDWI: AFTER (%s)", after_date)
+    compute_ndwi({b: after_hrefs[b] for b in (NDWI_GREEN, NDWI_NIR)}, grid, after_ndwi_path)
 
     log.info("Computing NDWI difference (after - before)")
-    compute_ndwi_diff(before_ndwi, after_ndwi, diff_transform, diff_crs, diff_path)
+    compute_ndwi_diff(before_ndwi_path, after_ndwi_path, grid, diff_path)
 
-    # --- Step 7: Write STAC Items ---
+    # --- Step 8: Write STAC Items ---
     write_stac_item(before, out / "before-item.json", {
         "true-color": str(before_tc_path),
         "ndwi": str(before_ndwi_path),
-    })
+    }, composite_properties["before"])
     write_stac_item(after, out / "after-item.json", {
         "true-color": str(after_tc_path),
         "ndwi": str(after_ndwi_path),
         "ndwi-diff": str(diff_path),
-    })
+    }, composite_properties["after"])
+
+    # --- Step 9: Register products in the local STAC catalog (data/stac) ---
+    products = {"before": [before_tc_path, before_ndwi_path], "after": [after_tc_path, after_ndwi_path]}
+    if args.composite:  # the composite band COGs too
+        products["before"] += [Path(p) for p in before_hrefs.values()]
+        products["after"] += [Path(p) for p in after_hrefs.values()]
+    scenes = {"before": before, "after": after}
+    try:
+        touched = set()
+        for period, paths in products.items():
+            properties = composite_properties[period] or {"sentinel:item": scenes[period].id}
+            touched |= index_files(paths, properties)
+        touched |= index_files([diff_path], {"sentinel:before": before.id, "sentinel:after": after.id})
+        write_catalog(only=touched)
+        log.info("Indexed %d collections in the local STAC catalog", len(touched))
+    except ValueError:
+        log.info("Output dir is outside data/, not indexed in the local STAC catalog")
 
     # --- Summary ---
     log.info("=" * 60)
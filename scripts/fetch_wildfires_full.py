@@ -3,70 +3,187 @@
 Fetch full-resolution wildfire burned area polygons from EFFIS WFS.
 
 Downloads ms:modis.ba.poly features for Portugal, filters to 2024-2025
-fires >= 30 ha, and saves as full-resolution GeoJSON (no simplification).
+fires >= 30 ha, saves as full-resolution GeoJSON (no simplification) and
+tiles both years into one PMTiles archive (layer "wildfires").
+
+The country/year/bbox filter is sent to the WFS as an OGC FILTER (falling
+back to BBOX + client-side filtering if the server rejects it or it
+matches nothing); a
+resultType=hits request gives the page count, pages are fetched
+MAX_WORKERS at a time and each is filtered and streamed to disk as it
+arrives, so raw pages are never accumulated.
 
 Output:
   data/qgis/wildfires-2024.geojson
   data/qgis/wildfires-2025.geojson
-  /tmp/wildfires-combined-full.geojson (for tippecanoe input)
+  data/qgis/wildfires-combined.pmtiles
+  data/qgis/wildfires-generalized.parquet  (per-zoom simplified tiers, generalize.py)
 """
 
+import itertools
 import json
+import re
 import sys
 import time
 import urllib.request
 import urllib.parse
 import urllib.error
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from pathlib import Path
 
+import geopandas as gpd
+import pandas as pd
+
+from feature_writer import FeatureWriter
+from generalize import write_tiers
+from vector_tiles import VectorLayer, write_pmtiles
+
 # --- Configuration ---
 WFS_BASE = "https://maps.effis.emergency.copernicus.eu/effis"
 TYPENAME = "ms:modis.ba.poly"
 BBOX = "36.9,-9.6,42.2,-6.1,EPSG:4326"
+COUNTRY = "PT"
 PAGE_SIZE = 5000
+MAX_WORKERS = 4  # concurrent page requests
+MAX_RETRIES = 5
 OUTPUT_DIR = Path(__file__).resolve().parent.parent / "data" / "qgis"
-TMP_COMBINED = Path("/tmp/wildfires-combined-full.geojson")
+PMTILES_PATH = OUTPUT_DIR / "wildfires-combined.pmtiles"
+GENERALIZED_PATH = OUTPUT_DIR / "wildfires-generalized.parquet"
 
 # Years to include
 TARGET_YEARS = {2024, 2025}
 MIN_AREA_HA = 30
 
 
-def build_url(start_index: int) -> str:
-    """Build WFS GetFeature URL with pagination."""
+def build_filter() -> str:
+    """OGC Filter Encoding 2.0: bbox AND country AND fire year, evaluated server-side.
+
+    WFS 2.0 does not allow BBOX together with FILTER, so the bbox moves
+    into the filter. The client-side filter below still runs on every
+    feature, so a server that ignores part of this only costs bandwidth.
+    """
+    s, w, n, e = BBOX.split(",")[:4]
+    years = "".join(
+        f"<fes:PropertyIsLike wildCard='*' singleChar='.' escapeChar='!'>"
+        f"<fes:ValueReference>FIREDATE</fes:ValueReference><fes:Literal>{y}*</fes:Literal>"
+        f"</fes:PropertyIsLike>"
+        for y in sorted(TARGET_YEARS)
+    )
+    if len(TARGET_YEARS) > 1:
+        years = f"<fes:Or>{years}</fes:Or>"
+    return (
+        "<fes:Filter xmlns:fes='http://www.opengis.net/fes/2.0' xmlns:gml='http://www.opengis.net/gml/3.2'>"
+        "<fes:And>"
+        "<fes:BBOX><gml:Envelope srsName='urn:ogc:def:crs:EPSG::4326'>"
+        f"<gml:lowerCorner>{s} {w}</gml:lowerCorner><gml:upperCorner>{n} {e}</gml:upperCorner>"
+        "</gml:Envelope></fes:BBOX>"
+        "<fes:PropertyIsEqualTo><fes:ValueReference>COUNTRY</fes:ValueReference>"
+        f"<fes:Literal>{COUNTRY}</fes:Literal></fes:PropertyIsEqualTo>"
+        f"{years}"
+        "</fes:And></fes:Filter>"
+    )
+
+
+def build_url(start_index: int = 0, hits: bool = False, server_filter: bool = True) -> str:
+    """Build WFS GetFeature URL with pagination (or a resultType=hits count)."""
     params = {
         "SERVICE": "WFS",
         "REQUEST": "GetFeature",
         "VERSION": "2.0.0",
         "TYPENAMES": TYPENAME,
-        "OUTPUTFORMAT": "application/json; subtype=geojson",
-        "BBOX": BBOX,
         "SRSNAME": "EPSG:4326",
-        "COUNT": str(PAGE_SIZE),
-        "STARTINDEX": str(start_index),
     }
+    if server_filter:
+        params["FILTER"] = build_filter()
+    else:
+        params["BBOX"] = BBOX
+    if hits:
+        params["RESULTTYPE"] = "hits"
+    else:
+        params.update({
+            "OUTPUTFORMAT": "application/json; subtype=geojson",
+            "COUNT": str(PAGE_SIZE),
+            "STARTINDEX": str(start_index),
+        })
     return WFS_BASE + "?" + urllib.parse.urlencode(params)
 
 
-def fetch_page(start_index: int, attempt: int = 0) -> dict:
-    """Fetch one page of WFS results with retry."""
-    url = build_url(start_index)
-    print(f"  Fetching STARTINDEX={start_index} ...", end=" ", flush=True)
-
+def fetch(url: str) -> bytes:
+    """GET with exponential backoff on network errors, 429 and 5xx."""
+    for attempt in range(MAX_RETRIES):
+        try:
+            req = urllib.request.Request(url, headers={"User-Agent": "cheias-pt/1.0"})
+            with urllib.request.urlopen(req, timeout=120) as resp:
+                return resp.read()
+        except urllib.error.HTTPError as e:
+            if e.code != 429 and e.code < 500 or attempt == MAX_RETRIES - 1:
+                raise
+            error = e
+        except (urllib.error.URLError, TimeoutError) as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            error = e
+        wait = 5 * (2 ** attempt)  # 5, 10, 20, 40 seconds
+        print(f"  error ({error}), retrying in {wait}s (attempt {attempt + 1})", flush=True)
+        time.sleep(wait)
+    raise RuntimeError(f"Max retries exceeded for {url}")
+
+
+def fetch_hits(server_filter: bool) -> int | None:
+    """numberMatched from a resultType=hits request, or None if unavailable.
+
+    With the server-side filter, an HTTP error (e.g. 400 for an unknown
+    property in the FILTER) also returns None so the caller can fall back.
+    """
     try:
-        req = urllib.request.Request(url, headers={"User-Agent": "cheias-pt/1.0"})
-        with urllib.request.urlopen(req, timeout=120) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
-        n = len(data.get("features", []))
-        print(f"got {n} features")
-        return data
-    except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError) as e:
-        if attempt < 3:
-            wait = 5 * (attempt + 1)
-            print(f"error ({e}), retrying in {wait}s ...")
-            time.sleep(wait)
-            return fetch_page(start_index, attempt + 1)
+        body = fetch(build_url(hits=True, server_filter=server_filter)).decode("utf-8", "replace")
+    except urllib.error.HTTPError as e:
+        if server_filter:
+            print(f"  FILTER hits request failed: HTTP {e.code}")
+            return None
         raise
+    if "ExceptionReport" in body:
+        if server_filter:
+            return None
+        raise RuntimeError(f"WFS rejected hits request: {body[:500]}")
+    m = re.search(r'numberMatched="(\d+)"', body)
+    return int(m.group(1)) if m else None
+
+
+def fetch_page(start_index: int, server_filter: bool) -> list:
+    """Features of one WFS page."""
+    data = json.loads(fetch(build_url(start_index, server_filter=server_filter)))
+    features = data.get("features", [])
+    print(f"  STARTINDEX={start_index}: {len(features)} features", flush=True)
+    return features
+
+
+def iter_pages(total: int | None, server_filter: bool):
+    """Yield pages in order, keeping up to MAX_WORKERS requests in flight.
+
+    With a known total every page offset is planned up front; otherwise
+    pages are requested in windows until a short page comes back.
+    """
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        if total is not None:
+            starts = iter(range(0, total, PAGE_SIZE))
+        else:
+            starts = itertools.count(0, PAGE_SIZE)
+        inflight = deque()
+        for start in itertools.islice(starts, MAX_WORKERS):
+            inflight.append(pool.submit(fetch_page, start, server_filter))
+        while inflight:
+            features = inflight.popleft().result()
+            yield features
+            if total is None and len(features) < PAGE_SIZE:
+                for f in inflight:
+                    f.cancel()
+                return
+            start = next(starts, None)
+            if start is not None:
+                inflight.append(pool.submit(fetch_page, start, server_filter))
 
 
 def extract_fire_year(props: dict) -> int | None:
@@ -136,105 +253,135 @@ def _float(d: dict, key: str) -> float:
         return 0.0
 
 
-def main():
-    print("=== EFFIS Wildfire Full-Resolution Fetch ===")
-    print(f"Target: Portugal, years {sorted(TARGET_YEARS)}, area >= {MIN_AREA_HA} ha")
-    print()
+def count_coords(geom: dict) -> int:
+    """Number of coordinate pairs in a (Multi)Polygon geometry."""
+    if geom["type"] == "MultiPolygon":
+        return sum(len(ring) for poly in geom["coordinates"] for ring in poly)
+    if geom["type"] == "Polygon":
+        return sum(len(ring) for ring in geom["coordinates"])
+    return 0
 
-    # --- Fetch all pages ---
-    all_raw_features = []
-    start_index = 0
 
-    while True:
-        page = fetch_page(start_index)
-        features = page.get("features", [])
-        all_raw_features.extend(features)
+def collect(total: int | None, server_filter: bool, out_paths: dict) -> tuple:
+    """Fetch all pages; filter, normalize and stream features out per year as they arrive.
 
-        if len(features) < PAGE_SIZE:
-            break
-        start_index += PAGE_SIZE
-        time.sleep(1)  # Be polite to the WFS
+    Returns (n_raw, counts, total_ha, total_coords), the last three keyed by year.
+    Raises LookupError if no feature passes the filters; the writers are
+    then aborted, so nothing is written (and earlier outputs are kept).
+    """
+    counts = {year: 0 for year in TARGET_YEARS}
+    total_ha = {year: 0.0 for year in TARGET_YEARS}
+    total_coords = {year: 0 for year in TARGET_YEARS}
 
-    print(f"\nTotal raw features from WFS: {len(all_raw_features)}")
+    n_raw = 0
+    with ExitStack() as stack:
+        writers = {year: stack.enter_context(FeatureWriter(path)) for year, path in out_paths.items()}
+        for page in iter_pages(total, server_filter):
+            n_raw += len(page)
+            for feat in page:
+                props = feat.get("properties", {})
 
-    # --- Filter and normalize ---
-    by_year: dict[int, list] = {y: [] for y in TARGET_YEARS}
+                # Country filter
+                country = (props.get("COUNTRY") or props.get("country") or "").strip().upper()
+                if country != COUNTRY:
+                    continue
 
-    for feat in all_raw_features:
-        props = feat.get("properties", {})
+                # Year filter
+                fire_year = extract_fire_year(props)
+                if fire_year not in TARGET_YEARS:
+                    continue
 
-        # Country filter
-        country = (props.get("COUNTRY") or props.get("country") or "").strip().upper()
-        if country != "PT":
-            continue
+                # Area filter
+                area_ha = extract_area_ha(props)
+                if area_ha < MIN_AREA_HA:
+                    continue
 
-        # Year filter
-        fire_year = extract_fire_year(props)
-        if fire_year not in TARGET_YEARS:
-            continue
+                # Normalize and keep
+                clean_props = normalize_properties(props, fire_year, area_ha)
+                writers[fire_year].write(clean_props, feat["geometry"])
+                counts[fire_year] += 1
+                total_ha[fire_year] += clean_props["area_ha"]
+                total_coords[fire_year] += count_coords(feat["geometry"])
 
-        # Area filter
-        area_ha = extract_area_ha(props)
-        if area_ha < MIN_AREA_HA:
-            continue
+        if not any(counts.values()):
+            raise LookupError(f"no features matched filters ({n_raw} raw features from WFS)")
 
-        # Normalize and keep
-        clean_props = normalize_properties(props, fire_year, area_ha)
-        clean_feat = {
-            "type": "Feature",
-            "geometry": feat["geometry"],
-            "properties": clean_props,
-        }
-        by_year[fire_year].append(clean_feat)
+    return n_raw, counts, total_ha, total_coords
 
-    # --- Summary ---
-    total_features = sum(len(v) for v in by_year.values())
-    print(f"\nFiltered features: {total_features}")
-    for year in sorted(TARGET_YEARS):
-        feats = by_year[year]
-        total_ha = sum(f["properties"]["area_ha"] for f in feats)
-        print(f"  {year}: {len(feats):,} fires, {total_ha:,.0f} ha")
 
-    if total_features == 0:
-        print("ERROR: No features matched filters. Check WFS response.")
-        sys.exit(1)
+def main():
+    print("=== EFFIS Wildfire Full-Resolution Fetch ===")
+    print(f"Target: Portugal, years {sorted(TARGET_YEARS)}, area >= {MIN_AREA_HA} ha")
+    print()
 
-    # --- Save per-year GeoJSON ---
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    out_paths = {year: OUTPUT_DIR / f"wildfires-{year}.geojson" for year in TARGET_YEARS}
+
+    # --- Count matches (server-side filter if the WFS accepts it) ---
+    # The FILTER names COUNTRY/FIREDATE; a server with other property names
+    # either rejects it (HTTP 400 / ExceptionReport) or matches nothing, and
+    # both cases fall back to BBOX + the client-side filter.
+    server_filter = True
+    total = fetch_hits(server_filter)
+    if not total:
+        print("  Server-side FILTER not supported or matched nothing, "
+              "falling back to BBOX + client-side filter")
+        server_filter = False
+        total = fetch_hits(server_filter)
+    if total is not None:
+        n_pages = -(-total // PAGE_SIZE)
+        print(f"  {total:,} matching features in {n_pages} pages, {MAX_WORKERS} at a time")
+    else:
+        print(f"  Feature count unavailable, paging until a short page, {MAX_WORKERS} at a time")
+
+    # --- Fetch pages; filter, normalize and stream out per year as they arrive ---
+    stats = None
+    if server_filter:
+        try:
+            stats = collect(total, server_filter, out_paths)
+        except (urllib.error.HTTPError, LookupError) as e:
+            print(f"  Server-side FILTER fetch failed ({e}), "
+                  "re-querying with BBOX + client-side filter")
+            server_filter = False
+            total = fetch_hits(server_filter)
+    if stats is None:
+        try:
+            stats = collect(total, server_filter, out_paths)
+        except LookupError as e:
+            print(f"ERROR: {e}. Check WFS response.")
+            sys.exit(1)
+    n_raw, counts, total_ha, total_coords = stats
 
+    # --- Summary ---
+    print(f"\nTotal raw features from WFS: {n_raw}")
+    print(f"Filtered features: {sum(counts.values())}")
     for year in sorted(TARGET_YEARS):
-        feats = by_year[year]
-        geojson = {"type": "FeatureCollection", "features": feats}
-        out_path = OUTPUT_DIR / f"wildfires-{year}.geojson"
-        with open(out_path, "w") as f:
-            json.dump(geojson, f)
-        size_mb = out_path.stat().st_size / 1024 / 1024
-        print(f"\nSaved {out_path} ({size_mb:.1f} MB, {len(feats)} features)")
+        print(f"  {year}: {counts[year]:,} fires, {total_ha[year]:,.0f} ha")
 
-    # --- Save combined for tippecanoe ---
-    combined_feats = []
     for year in sorted(TARGET_YEARS):
-        combined_feats.extend(by_year[year])
-
-    combined_geojson = {"type": "FeatureCollection", "features": combined_feats}
-    with open(TMP_COMBINED, "w") as f:
-        json.dump(combined_geojson, f)
-    size_mb = TMP_COMBINED.stat().st_size / 1024 / 1024
-    print(f"\nSaved {TMP_COMBINED} ({size_mb:.1f} MB, {len(combined_feats)} features)")
+        out_path = out_paths[year]
+        size_mb = out_path.stat().st_size / 1024 / 1024
+        print(f"\nSaved {out_path} ({size_mb:.1f} MB, {counts[year]} features)")
+
+    # --- Tile both years into one archive (read back from the streamed files) ---
+    combined = pd.concat([gpd.read_file(out_paths[year]) for year in sorted(TARGET_YEARS)
+                          if counts[year]], ignore_index=True)
+    combined = gpd.GeoDataFrame(combined, crs="EPSG:4326")
+    n_tiles = write_pmtiles(
+        PMTILES_PATH,
+        [VectorLayer("wildfires", combined, minzoom=4, maxzoom=12)],
+        metadata={"name": "wildfires", "attribution": "EFFIS / Copernicus EMS"},
+    )
+    size_mb = PMTILES_PATH.stat().st_size / 1024 / 1024
+    print(f"\nSaved {PMTILES_PATH} ({size_mb:.1f} MB, {n_tiles} tiles, {len(combined)} features)")
 
     # --- Coordinate complexity report ---
     print("\n=== Geometry Complexity ===")
     for year in sorted(TARGET_YEARS):
-        total_coords = 0
-        for feat in by_year[year]:
-            geom = feat["geometry"]
-            if geom["type"] == "MultiPolygon":
-                total_coords += sum(
-                    len(ring) for poly in geom["coordinates"] for ring in poly
-                )
-            elif geom["type"] == "Polygon":
-                total_coords += sum(len(ring) for ring in geom["coordinates"])
-        print(f"  {year}: {total_coords:,} coordinate pairs")
+        print(f"  {year}: {total_coords[year]:,} coordinate pairs")
+
+    # --- Per-zoom simplified tiers (one fire season = one coverage group) ---
+    write_tiers(combined, GENERALIZED_PATH, group_by=["fire_year"], max_zoom=12)
 
     print("\nDone.")
 
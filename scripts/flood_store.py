@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""GeoParquet store for CEMS flood-extent polygons.
+
+download_cems.py used to rebuild emsr861/emsr864/combined.geojson from
+scratch on every run, reprojecting each product to EPSG:3035 only to get
+area_ha, and anything downstream had to re-parse multi-MB GeoJSON. The
+store keeps every processed product in one GeoParquet instead:
+
+  - one row per polygon, keyed by product (activation, aoi, product,
+    version); area_ha is computed once when a product is first added and
+    cached in the file, never recomputed on reload
+  - rows are sorted along a Hilbert curve of their bbox centres and written
+    in small row groups with a GeoParquet 1.1 `bbox` covering column, so a
+    bbox query only touches the row groups whose min/max stats intersect
+  - `upsert` replaces whole products: a new monitoring product
+    (DEL_MONIT03…) or a new version of an existing one is swapped in
+    without reprocessing anything else
+
+Output: data/flood-extent/flood-extent.parquet
+
+Usage:
+    from flood_store import load, upsert, product_keys
+
+    upsert(gdf)                                     # gdf of one or more products
+    load(bbox=(-9.0, 38.5, -8.0, 39.5), product_type="Monitoring 1")
+"""
+
+import os
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+
+STORE = Path(__file__).resolve().parent.parent / "data" / "flood-extent" / "flood-extent.parquet"
+
+# Columns identifying one CEMS product; upsert replaces rows by this key
+KEY = ["activation", "aoi", "product", "version"]
+
+ROW_GROUP_SIZE = 2048
+HILBERT_LEVEL = 16
+
+
+def product_keys(path=STORE):
+    """Set of (activation, aoi, product, version) tuples already in the store."""
+    if not path.exists():
+        return set()
+    keys = pd.read_parquet(path, columns=KEY).drop_duplicates()
+    return set(keys.itertuples(index=False, name=None))
+
+
+def load(bbox=None, activation=None, aoi=None, product_type=None, columns=None, path=STORE):
+    """Read (a subset of) the store.
+
+    `bbox` is (west, south, east, north) in EPSG:4326 and is pushed down to
+    the row-group bbox statistics; the attribute filters are pushed down as
+    Parquet predicates.
+    """
+    if not path.exists():
+        return None
+    filters = [(col, "==", val) for col, val in
+               (("activation", activation), ("aoi", aoi), ("product_type", product_type))
+               if val is not None]
+    gdf = gpd.read_parquet(path, columns=columns, bbox=bbox, filters=filters or None)
+    return gdf.drop(columns="bbox", errors="ignore")
+
+
+def area_ha(gdf):
+    """Equal-area (ETRS89-LAEA, EPSG:3035) polygon area in hectares."""
+    return gdf.geometry.to_crs(epsg=3035).area / 10000
+
+
+def _write(gdf, path):
+    """Hilbert-sort and write atomically with bbox covering and small row groups."""
+    if len(gdf):
+        order = gdf.geometry.hilbert_distance(level=HILBERT_LEVEL).argsort(kind="stable")
+        gdf = gdf.iloc[order.values].reset_index(drop=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    gdf.to_parquet(tmp, compression="zstd", write_covering_bbox=True, schema_version="1.1.0",
+                   row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp, path)
+
+
+def upsert(gdf, path=STORE):
+    """Insert or replace the products in `gdf`. Returns the full store frame.
+
+    Rows without a cached area_ha get one computed here.
+    """
+    gdf = gdf.to_crs(epsg=4326) if gdf.crs and gdf.crs.to_epsg() != 4326 else gdf
+    if "area_ha" not in gdf.columns or gdf["area_ha"].isna().any():
+        gdf = gdf.copy()
+        missing = gdf["area_ha"].isna() if "area_ha" in gdf.columns else slice(None)
+        gdf.loc[missing, "area_ha"] = area_ha(gdf.loc[missing])
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        store = load(path=path)
+        # A product replaces all stored rows of that product, whatever their version
+        products = pd.MultiIndex.from_frame(gdf[KEY[:-1]].drop_duplicates())
+        stale = pd.MultiIndex.from_frame(store[KEY[:-1]]).isin(products)
+        merged = pd.concat([store[~stale], gdf], ignore_index=True)
+        gdf = gpd.GeoDataFrame(merged, geometry="geometry", crs="EPSG:4326")
+    _write(gdf, path)
+    return gdf
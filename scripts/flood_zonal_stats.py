@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""Inundated area per district and per river basin from the CEMS flood polygons.
+
+The story quotes 226,764 ha flooded (the sum of polygon areas in
+combined.geojson), but nothing broke that down by district or basin, and
+overlapping products (a delineation and its monitoring updates) are
+double-counted in that sum. This script computes it on a raster instead of
+by pairwise polygon overlay:
+
+  - an equal-area grid (ETRS89-LAEA, EPSG:3035) at RES metres, processed in
+    WINDOW × WINDOW pixel windows; windows without flood polygons are never
+    rasterized (an STRtree picks the polygons per window)
+  - per window, district and basin label rasters are burned once and fused
+    into one zone index (district × basin); every (activation, product
+    type) flood mask is then counted against it with a single bincount, so
+    all zone tables come out of one pass
+  - an extra "any" category counts the union of all products, i.e. land
+    flooded at least once, without double counting
+  - windows are spread over a process pool
+
+Output: data/flood-extent/flood-area-by-zone.csv (long format)
+        data/consequences/flood-area-by-zone.json (frontend summary)
+
+Usage:
+    python scripts/flood_zonal_stats.py
+    python scripts/flood_zonal_stats.py --res 20 --workers 4
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from rasterio.features import rasterize
+from rasterio.transform import from_origin
+
+from flood_store import STORE, load
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+
+ROOT = Path(__file__).resolve().parent.parent
+COMBINED = ROOT / "data" / "flood-extent" / "combined.geojson"
+DISTRICTS = ROOT / "assets" / "districts.geojson"
+BASINS = ROOT / "assets" / "basins.geojson"
+CSV_OUT = ROOT / "data" / "flood-extent" / "flood-area-by-zone.csv"
+JSON_OUT = ROOT / "data" / "consequences" / "flood-area-by-zone.json"
+
+CRS = "EPSG:3035"
+RES = 10.0  # metres; CEMS delineations are mapped from ~10–20 m imagery
+WINDOW = 2048  # pixels per window side
+
+ANY = ("any", "any")  # union of every product
+
+
+# ─── Inputs ──────────────────────────────────────────────────────────────────
+
+def load_flood():
+    """Flood polygons (from the GeoParquet store, else combined.geojson) in CRS."""
+    gdf = load(columns=["activation", "product_type", "geometry"]) if STORE.exists() else None
+    if gdf is None:
+        gdf = gpd.read_file(COMBINED, columns=["activation", "product_type"])
+    gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+    return gdf.to_crs(CRS).reset_index(drop=True)
+
+
+def load_zones(path, name_col):
+    """Zone polygons in CRS; label i + 1 is row i (0 = outside every zone)."""
+    gdf = gpd.read_file(path).to_crs(CRS)
+    return gdf[name_col].tolist(), gdf.geometry.values
+
+
+def windows(bounds, res=RES, size=WINDOW):
+    """Top-left corners of grid-aligned windows covering `bounds`."""
+    west, south, east, north = bounds
+    x0 = np.floor(west / res) * res
+    y0 = np.ceil(north / res) * res
+    step = size * res
+    for y in np.arange(y0, south, -step):
+        for x in np.arange(x0, east, step):
+            yield float(x), float(y)
+
+
+# ─── Tabulation ──────────────────────────────────────────────────────────────
+
+_state = {}
+
+
+def _init_worker(flood_geoms, flood_cat, n_cat, district_geoms, basin_geoms, res, size):
+    _state.update(
+        flood_geoms=flood_geoms, flood_cat=flood_cat, n_cat=n_cat,
+        flood_tree=shapely.STRtree(flood_geoms),
+        districts=district_geoms, district_tree=shapely.STRtree(district_geoms),
+        basins=basin_geoms, basin_tree=shapely.STRtree(basin_geoms),
+        res=res, size=size,
+    )
+
+
+def _burn(geoms, tree, box, shape, transform):
+    """Label raster (row index + 1) of the zone polygons intersecting `box`."""
+    idx = tree.query(box, predicate="intersects")
+    if not len(idx):
+        return np.zeros(shape, dtype=np.uint8)
+    return rasterize(((geoms[i], i + 1) for i in idx), out_shape=shape, transform=transform,
+                     fill=0, dtype=np.uint8)
+
+
+def _tabulate(origin):
+    """Pixel counts [category, district * (n_basins + 1) + basin] for one window, or None."""
+    s = _state
+    x, y = origin
+    res, size = s["res"], s["size"]
+    box = shapely.box(x, y - size * res, x + size * res, y)
+    idx = s["flood_tree"].query(box, predicate="intersects")
+    if not len(idx):
+        return None
+
+    shape = (size, size)
+    transform = from_origin(x, y, res, res)
+    n_basin = len(s["basins"]) + 1
+    n_zone = (len(s["districts"]) + 1) * n_basin
+    district = _burn(s["districts"], s["district_tree"], box, shape, transform)
+    basin = _burn(s["basins"], s["basin_tree"], box, shape, transform)
+    zone = district.astype(np.int32) * n_basin + basin
+
+    counts = np.zeros((s["n_cat"] + 1, n_zone), dtype=np.int64)
+    flooded = np.zeros(shape, dtype=bool)
+    cats = s["flood_cat"][idx]
+    for c in np.unique(cats):
+        mask = rasterize(s["flood_geoms"][idx[cats == c]], out_shape=shape, transform=transform,
+                         fill=0, default_value=1, dtype=np.uint8).view(bool)
+        counts[c] = np.bincount(zone[mask], minlength=n_zone)
+        flooded |= mask
+    counts[-1] = np.bincount(zone[flooded], minlength=n_zone)
+    return counts
+
+
+def tabulate(flood, district_geoms, basin_geoms, res=RES, size=WINDOW, workers=None):
+    """Pixel counts [category, district, basin] over all windows + the category list."""
+    categories = sorted(set(zip(flood["activation"], flood["product_type"])))
+    lookup = {c: i for i, c in enumerate(categories)}
+    flood_cat = np.array([lookup[c] for c in zip(flood["activation"], flood["product_type"])],
+                         dtype=np.int32)
+    origins = list(windows(flood.total_bounds, res, size))
+
+    shape = (len(categories) + 1, len(district_geoms) + 1, len(basin_geoms) + 1)
+    total = np.zeros((shape[0], shape[1] * shape[2]), dtype=np.int64)
+    initargs = (flood.geometry.values, flood_cat, len(categories), district_geoms, basin_geoms,
+                res, size)
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=initargs) as pool:
+        for counts in pool.map(_tabulate, origins, chunksize=4):
+            if counts is not None:
+                total += counts
+                done += 1
+    print(f"  {done} of {len(origins)} windows ({size}² px at {res:g} m) contained flood polygons")
+    return total.reshape(shape), categories + [ANY]
+
+
+# ─── Output ──────────────────────────────────────────────────────────────────
+
+def to_frame(counts, categories, district_names, basin_names, res=RES):
+    """Long table: zone_type, zone, activation, product_type, area_ha."""
+    pixel_ha = res * res / 10_000
+    districts = ["(outside)"] + district_names
+    basins = ["(outside)"] + basin_names
+    rows = []
+    for c, (activation, product_type) in enumerate(categories):
+        for zone_type, names, axis in (("district", districts, 1), ("basin", basins, 0)):
+            per_zone = counts[c].sum(axis=axis)
+            for z in np.flatnonzero(per_zone):
+                rows.append((zone_type, names[z], activation, product_type, per_zone[z] * pixel_ha))
+        rows.append(("total", "all", activation, product_type, counts[c].sum() * pixel_ha))
+    df = pd.DataFrame(rows, columns=["zone_type", "zone", "activation", "product_type", "area_ha"])
+    df["area_ha"] = df["area_ha"].round(2)
+    return df
+
+
+def to_summary(df, res):
+    """Frontend JSON: flooded-at-least-once area per district and basin."""
+    union = df[(df["activation"] == ANY[0]) & (df["zone"] != "(outside)")]
+    return {
+        "resolution_m": res,
+        "crs": CRS,
+        "total_ha": round(float(union.loc[union["zone_type"] == "total", "area_ha"].sum()), 1),
+        "districts": {r.zone: round(r.area_ha, 1) for r in union[union["zone_type"] == "district"]
+                      .sort_values("area_ha", ascending=False).itertuples()},
+        "basins": {r.zone: round(r.area_ha, 1) for r in union[union["zone_type"] == "basin"]
+                   .sort_values("area_ha", ascending=False).itertuples()},
+    }
+
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Flooded area per district / basin from CEMS polygons")
+    parser.add_argument("--res", type=float, default=RES, help="Grid resolution in metres")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: all cores)")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    flood = load_flood()
+    if flood.empty:
+        print("⚠ No flood polygons — run download_cems.py first")
+        return
+    district_names, district_geoms = load_zones(DISTRICTS, "district")
+    basin_names, basin_geoms = load_zones(BASINS, "river")
+    print(f"Rasterizing {len(flood)} flood polygons against {len(district_names)} districts "
+          f"× {len(basin_names)} basins")
+
+    counts, categories = tabulate(flood, district_geoms, basin_geoms, args.res, workers=args.workers)
+    df = to_frame(counts, categories, district_names, basin_names, args.res)
+
+    CSV_OUT.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(CSV_OUT, index=False)
+    JSON_OUT.parent.mkdir(parents=True, exist_ok=True)
+    summary = to_summary(df, args.res)
+    with open(JSON_OUT, "w") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    polygon_sum = flood.geometry.area.sum() / 10_000
+    print(f"✓ Flooded at least once: {summary['total_ha']:,.0f} ha "
+          f"(polygon area sum incl. overlaps: {polygon_sum:,.0f} ha)")
+    for name, ha in list(summary["districts"].items())[:5]:
+        print(f"    {name:20s} {ha:>10,.0f} ha")
+    print(f"✓ {CSV_OUT} ({len(df)} rows), {JSON_OUT} in {time.time() - t0:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
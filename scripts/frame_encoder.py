@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Frame encoders for pre-rendered raster frames.
+
+`img.save(path, optimize=True, compress_level=9)` on an RGBA truecolor frame
+is the slowest step per frame, yet frames are colored through ≤256-entry
+colormap LUTs. `encode_frame` writes an indexed PNG (palette + tRNS alpha
+table) whenever the frame has ≤256 distinct RGBA values — a quarter of the
+raw bytes to deflate, so both faster and smaller — and falls back to
+truecolor PNG otherwise (or, opt-in via the renderers' --quantize flag, to
+a lossy FASTOCTREE-quantized palette with `quantize=True`).
+
+Lossless WebP and near-lossless AVIF variants can be written next to each PNG; the
+manifest builder records each frame's format, its variants and their byte
+sizes so the client can pick the smallest file it decodes (an indexed PNG
+often beats both).
+
+Usage:
+    python scripts/frame_encoder.py --benchmark                 # time vs bytes per encoder
+    python scripts/frame_encoder.py --variants webp avif        # write variants next to PNGs
+    python scripts/frame_encoder.py --benchmark --dir data/raster-frames/precipitation
+"""
+
+import argparse
+import io
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, features
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+
+ROOT = Path(__file__).resolve().parent.parent
+FRAME_DIRS = [
+    ROOT / "data" / "raster-frames" / "soil-moisture",
+    ROOT / "data" / "raster-frames" / "precipitation",
+]
+
+# png8 = indexed PNG with tRNS (falls back to "png" truecolor if > 256 colors)
+FORMATS = ("png8", "png", "webp", "avif")
+VARIANT_FORMATS = ("webp", "avif")
+EXTENSIONS = {"png8": ".png", "png": ".png", "webp": ".webp", "avif": ".avif"}
+
+PNG_LEVEL = 9
+WEBP_METHOD = 4        # 0 fast … 6 smallest
+AVIF_QUALITY = 90      # AVIF has no true lossless RGBA mode in Pillow
+BENCHMARK_FRAMES = 8
+
+
+# ─── Encoding ────────────────────────────────────────────────────────────────
+
+def available_formats():
+    """Formats this Pillow build can write."""
+    out = ["png8", "png"]
+    if features.check("webp"):
+        out.append("webp")
+    if features.check("avif"):
+        out.append("avif")
+    return out
+
+
+def to_indexed(rgba):
+    """(H, W, 4) uint8 → (indices, palette) if ≤256 distinct colors, else None.
+
+    Palette entries are ordered non-opaque first so the tRNS chunk can stop
+    at the last translucent entry.
+    """
+    packed = np.ascontiguousarray(rgba).view(np.uint32).reshape(-1)
+    colors, inverse = np.unique(packed, return_inverse=True)
+    if len(colors) > 256:
+        return None
+    palette = colors.view(np.uint8).reshape(-1, 4)
+    order = np.argsort(palette[:, 3] == 255, kind="stable")
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+    indices = remap[inverse].astype(np.uint8).reshape(rgba.shape[:2])
+    return indices, palette[order]
+
+
+def _as_rgba(img):
+    if isinstance(img, Image.Image):
+        return np.asarray(img.convert("RGBA"))
+    return np.asarray(img, dtype=np.uint8)
+
+
+def _save_indexed(indices, palette, fp, level):
+    img = Image.fromarray(indices, "P")
+    img.putpalette(palette[:, :3].tobytes(), rawmode="RGB")
+    n_trns = int(np.count_nonzero(palette[:, 3] != 255))
+    kwargs = {"transparency": palette[:n_trns, 3].tobytes()} if n_trns else {}
+    img.save(fp, format="PNG", compress_level=level, **kwargs)
+
+
+def encode_frame(img, path, fmt="png8", level=PNG_LEVEL, quantize=False):
+    """Write one RGBA frame (PIL Image or (H, W, 4) array) to `path`.
+
+    Returns the format actually written ("png8" may fall back to "png").
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown frame format {fmt!r}, expected one of {FORMATS}")
+    rgba = _as_rgba(img)
+
+    if fmt == "png8":
+        indexed = to_indexed(rgba)
+        if indexed is not None:
+            _save_indexed(*indexed, path, level)
+            return "png8"
+        if quantize:
+            q = Image.fromarray(rgba, "RGBA").quantize(
+                256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+            q.save(path, format="PNG", compress_level=level)
+            return "png8"
+        fmt = "png"
+
+    out = Image.fromarray(rgba, "RGBA")
+    if fmt == "png":
+        out.save(path, format="PNG", compress_level=level)
+    elif fmt == "webp":
+        out.save(path, format="WEBP", lossless=True, quality=100, method=WEBP_METHOD, exact=True)
+    else:
+        out.save(path, format="AVIF", quality=AVIF_QUALITY)
+    return fmt
+
+
+def frame_format(path):
+    """Format of an existing PNG frame: "png8" if indexed, else "png"."""
+    with Image.open(path) as img:
+        return "png8" if img.mode == "P" else "png"
+
+
+def frame_variants(path):
+    """{format: sibling path} for variant files written next to a PNG frame."""
+    return {
+        fmt: path.with_suffix(EXTENSIONS[fmt])
+        for fmt in VARIANT_FORMATS
+        if path.with_suffix(EXTENSIONS[fmt]).exists()
+    }
+
+
+# ─── CLI ─────────────────────────────────────────────────────────────────────
+
+def write_variants(dirs, formats):
+    """Transcode every PNG frame in `dirs` to the given variant formats."""
+    for d in dirs:
+        pngs = sorted(d.glob("*.png"))
+        if not pngs:
+            print(f"  {d.name}: no PNG frames, skipping")
+            continue
+        totals = {fmt: 0 for fmt in formats}
+        for png in pngs:
+            with Image.open(png) as img:
+                rgba = _as_rgba(img)
+            for fmt in formats:
+                out = png.with_suffix(EXTENSIONS[fmt])
+                encode_frame(rgba, out, fmt)
+                totals[fmt] += out.stat().st_size
+        png_total = sum(p.stat().st_size for p in pngs)
+        sizes = ", ".join(f"{fmt} {b / 1e6:.1f} MB" for fmt, b in totals.items())
+        print(f"  {d.name}: {len(pngs)} frames, png {png_total / 1e6:.1f} MB → {sizes}")
+
+
+def benchmark(dirs, formats):
+    """Encode a sample of frames with each encoder; print time vs bytes."""
+    samples = []
+    for d in dirs:
+        pngs = sorted(d.glob("*.png"))
+        step = max(len(pngs) // BENCHMARK_FRAMES, 1)
+        samples += pngs[::step][:BENCHMARK_FRAMES]
+    if not samples:
+        print("No frames to benchmark")
+        return
+    frames = []
+    for p in samples:
+        with Image.open(p) as img:
+            frames.append(_as_rgba(img))
+    baseline = sum(p.stat().st_size for p in samples) / len(samples)
+
+    configs = [("png (optimize, 9)", None)]
+    for fmt in formats:
+        levels = (1, 6, 9) if fmt in ("png8", "png") else (None,)
+        configs += [(f"{fmt}" + (f" (level {lv})" if lv else ""), (fmt, lv)) for lv in levels]
+
+    print(f"Benchmark: {len(frames)} frames, current files avg {baseline / 1024:.0f} KB")
+    print(f"  {'encoder':<24} {'ms/frame':>9} {'KB/frame':>9} {'vs current':>11}  written")
+    for label, cfg in configs:
+        written = set()
+        nbytes = 0
+        t0 = time.perf_counter()
+        for rgba in frames:
+            buf = io.BytesIO()
+            if cfg is None:
+                Image.fromarray(rgba, "RGBA").save(buf, format="PNG", optimize=True, compress_level=9)
+                written.add("png")
+            else:
+                fmt, lv = cfg
+                written.add(encode_frame(rgba, buf, fmt, level=lv or PNG_LEVEL))
+            nbytes += buf.tell()
+        ms = 1000 * (time.perf_counter() - t0) / len(frames)
+        kb = nbytes / len(frames) / 1024
+        print(f"  {label:<24} {ms:>9.1f} {kb:>9.0f} {100 * kb * 1024 / baseline:>10.0f}%  "
+              f"{','.join(sorted(written))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame encoder benchmark and variant writer")
+    parser.add_argument("--dir", dest="dirs", action="append", type=Path,
+                        help="Frame directory, repeatable (default: raster-frames/*)")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--benchmark", action="store_true", help="Compare encode time against bytes")
+    mode.add_argument("--variants", nargs="+", choices=VARIANT_FORMATS,
+                      help="Write these formats next to each PNG frame")
+    args = parser.parse_args()
+
+    dirs = args.dirs or FRAME_DIRS
+    supported = available_formats()
+
+    if args.benchmark:
+        benchmark(dirs, [f for f in FORMATS if f in supported])
+        return
+
+    missing = [f for f in args.variants if f not in supported]
+    if missing:
+        parser.error(f"This Pillow build cannot write: {', '.join(missing)}")
+    print(f"Writing {', '.join(args.variants)} variants")
+    write_variants(dirs, args.variants)
+
+
+if __name__ == "__main__":
+    main()
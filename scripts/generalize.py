@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Per-zoom generalization tiers for polygon layers (wildfires, CEMS flood extent).
+
+fetch_wildfires_full.py and download_cems.py keep source-resolution
+geometry (tens of vertices per 20 m pixel edge), which is right for
+analysis but means the browser and the tile builder chew through millions
+of vertices to draw a z6 overview. This stage precomputes simplified
+copies once:
+
+  - one tier per zoom band (TIERS); each tier is simplified to one 256 px
+    tile pixel at the most detailed zoom it serves, so the error never
+    exceeds a pixel on screen
+  - simplification is topology-aware: polygons of one coverage group (e.g.
+    one CEMS product, one fire season) go through shapely.coverage_simplify,
+    which simplifies each shared edge once so neighbours stay glued
+    together with no gaps or slivers; any polygon it cannot simplify
+    validly (overlapping inputs) falls back to per-feature
+    topology-preserving simplification
+  - polygons that collapse below a pixel at a tier are dropped from it
+
+All tiers go into one GeoParquet with a `zoom` column (the minimum zoom the
+tier is meant for); a reader picks `zoom == max(t for t in tiers if t <= z)`.
+
+Output: data/qgis/wildfires-generalized.parquet,
+        data/flood-extent/combined-generalized.parquet
+
+Usage:
+    python scripts/generalize.py                      # re-generalize both from saved sources
+    python scripts/generalize.py --only flood-extent
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+
+ROOT = Path(__file__).resolve().parent.parent
+DATA = ROOT / "data"
+
+# Minimum zoom of each tier; a tier serves zooms up to the next tier's minimum - 1
+TIERS = (4, 6, 8, 10, 12)
+MAX_ZOOM = 14
+TILE_SIZE = 256
+
+# name → (sources, output, coverage group columns, max zoom — as the PMTiles layers)
+LAYERS = {
+    "flood-extent": ([DATA / "flood-extent" / "combined.geojson"],
+                     DATA / "flood-extent" / "combined-generalized.parquet",
+                     ["activation", "aoi", "product_type", "source_date"], 14),
+    "wildfires": ([DATA / "qgis" / "wildfires-2024.geojson", DATA / "qgis" / "wildfires-2025.geojson"],
+                  DATA / "qgis" / "wildfires-generalized.parquet",
+                  ["fire_year"], 12),
+}
+
+
+def pixel_degrees(z):
+    """Width of one tile pixel at zoom z, in degrees of longitude."""
+    return 360.0 / (TILE_SIZE * (1 << z))
+
+
+def tier_tolerances(tiers=TIERS, max_zoom=MAX_ZOOM):
+    """(tier zoom, tolerance in degrees) — one pixel at the tier's most detailed zoom."""
+    upper = [z - 1 for z in tiers[1:]] + [max_zoom]
+    return [(z, pixel_degrees(hi)) for z, hi in zip(tiers, upper)]
+
+
+# ─── Simplification ──────────────────────────────────────────────────────────
+
+def simplify_group(geoms, tolerance):
+    """Simplify one coverage group, keeping shared edges shared where possible.
+
+    coverage_simplify only guarantees valid output for a valid coverage;
+    any polygon it breaks (overlapping inputs) is redone on its own with
+    topology-preserving Douglas-Peucker.
+    """
+    out = shapely.coverage_simplify(geoms, tolerance)
+    bad = ~shapely.is_valid(out) | (shapely.is_empty(out) & ~shapely.is_empty(geoms))
+    if bad.any():
+        out[bad] = shapely.simplify(geoms[bad], tolerance, preserve_topology=True)
+    return out
+
+
+def generalize(gdf, group_by=None, tiers=TIERS, max_zoom=MAX_ZOOM):
+    """All zoom tiers of a polygon GeoDataFrame (EPSG:4326) as one frame with a `zoom` column."""
+    gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty].reset_index(drop=True)
+    geoms = shapely.make_valid(gdf.geometry.values, method="structure", keep_collapsed=False)
+    group_by = [c for c in (group_by or []) if c in gdf.columns]
+    if group_by:
+        groups = list(gdf.groupby(group_by, dropna=False, sort=False).indices.values())
+    else:
+        groups = [np.arange(len(gdf))]
+
+    parts = []
+    for zoom, tolerance in tier_tolerances(tiers, max_zoom):
+        simplified = np.empty(len(gdf), dtype=object)
+        for idx in groups:
+            simplified[idx] = simplify_group(geoms[idx], tolerance)
+        keep = ~shapely.is_empty(simplified) & (shapely.area(simplified) >= tolerance ** 2)
+
+        tier = gdf.loc[keep].copy()
+        tier["geometry"] = simplified[keep]
+        tier.insert(0, "zoom", np.uint8(zoom))
+        parts.append(tier)
+
+    out = pd.concat(parts, ignore_index=True)
+    return gpd.GeoDataFrame(out, geometry="geometry", crs=gdf.crs)
+
+
+def write_tiers(gdf, out_path, group_by=None, tiers=TIERS, max_zoom=MAX_ZOOM):
+    """Generalize and save as GeoParquet; prints a per-tier vertex summary."""
+    t0 = time.time()
+    tiered = generalize(gdf, group_by, tiers, max_zoom)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tiered.to_parquet(out_path, compression="zstd")
+
+    source = int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+    coords = shapely.get_num_coordinates(tiered.geometry.values)
+    print(f"  Generalized {len(gdf)} features ({source:,} vertices) → {out_path.name} "
+          f"in {time.time() - t0:.0f}s")
+    for zoom, tier in tiered.groupby("zoom"):
+        n = int(coords[tier.index].sum())
+        print(f"    z{zoom}+: {len(tier):>6,} features, {n:>10,} vertices ({n / max(source, 1):.1%})")
+    return tiered
+
+
+# ─── CLI ─────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Build per-zoom simplified GeoParquet tiers")
+    parser.add_argument("--only", action="append", choices=list(LAYERS),
+                        help="Layer to generalize, repeatable (default: all)")
+    args = parser.parse_args()
+
+    for name in args.only or LAYERS:
+        sources, out_path, group_by, max_zoom = LAYERS[name]
+        present = [p for p in sources if p.exists()]
+        if not present:
+            print(f"  {name}: no source data, skipping")
+            continue
+        gdf = pd.concat([gpd.read_file(p) for p in present], ignore_index=True)
+        write_tiers(gpd.GeoDataFrame(gdf, crs="EPSG:4326"), out_path, group_by, max_zoom=max_zoom)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,13 @@ Open-Meteo API → COGs (canonical) → pre-rendered PNGs (scrollytelling) → m
 Two variables, 77 days each (2025-12-01 → 2026-02-15):
   - Soil moisture (hourly → daily mean)
   - Precipitation (daily sum)
+
+Usage:
+    python scripts/generate-cog-frames.py
+    python scripts/generate-cog-frames.py --quantize   # 256-colour palette PNGs (lossy, smaller)
 """
 
+import argparse
 import json
 import time
 import sys
@@ -29,6 +34,13 @@ import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 from PIL import Image
 
+from build_frame_atlas import MAX_SHEET_SIDE, build_atlas
+from daily_aggregate import hourly_to_daily, nan_to_none
+from encode_frame_deltas import encode_variable
+from frame_encoder import encode_frame, frame_format, frame_variants
+from render_pool import RenderPool, lut_from_cmap, lut_lookup, lut_lookup_index
+from stac_catalog import lookup, scan
+
 # ─── Configuration ───────────────────────────────────────────────────────────
 
 ROOT = Path(__file__).resolve().parent.parent
@@ -227,19 +239,8 @@ def phase1_fetch(grid_points):
         hourly_times = data["hourly"]["time"]
         hourly_sm = data["hourly"]["soil_moisture_0_to_7cm"]
 
-        sm_by_date = {}
-        for t, v in zip(hourly_times, hourly_sm):
-            date = t[:10]
-            if date not in sm_by_date:
-                sm_by_date[date] = []
-            if v is not None:
-                sm_by_date[date].append(v)
-
-        sm_dates = sorted(sm_by_date.keys())
-        sm_values = [
-            float(np.mean(sm_by_date[d])) if sm_by_date[d] else None
-            for d in sm_dates
-        ]
+        sm_dates, sm_daily = hourly_to_daily(hourly_times, hourly_sm, how="mean")
+        sm_values = nan_to_none(sm_daily)
 
         sm_result = {"lat": lat, "lon": lon, "dates": sm_dates, "values": sm_values}
 
@@ -385,8 +386,8 @@ def phase2_generate_cogs(variable, grid_points, polygon):
 # PHASE 3: PNG Rendering
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def render_sm_png(cog_path, output_path, vmin, vmax):
-    """Render soil moisture COG → transparent RGBA PNG."""
+def render_sm_png(cog_path, output_path, shared, vmin, vmax, quantize=False):
+    """Render soil moisture COG → transparent RGBA PNG (RenderPool job)."""
     with rasterio.open(cog_path) as ds:
         data = ds.read(1)
 
@@ -397,7 +398,7 @@ def render_sm_png(cog_path, output_path, vmin, vmax):
 
     # Normalize to [0, 1]
     norm = np.clip((data - max(vmin, 0)) / (vmax - max(vmin, 0)), 0, 1)
-    colored = SM_CMAP(norm)  # (H, W, 4) float [0,1]
+    colored = lut_lookup(shared["sm_lut"], norm)  # (H, W, 4) float [0,1]
 
     # Alpha: 0.80 for data, 0 for nodata
     colored[..., 3] = 0.80
@@ -412,18 +413,18 @@ def render_sm_png(cog_path, output_path, vmin, vmax):
     arr[..., :3] = (arr[..., :3] // 4) * 4
     img = Image.fromarray(arr, 'RGBA')
 
-    img.save(output_path, optimize=True, compress_level=9)
+    encode_frame(img, output_path, quantize=quantize)
 
 
-def render_precip_png(cog_path, output_path):
-    """Render precipitation COG → transparent RGBA PNG."""
+def render_precip_png(cog_path, output_path, shared, quantize=False):
+    """Render precipitation COG → transparent RGBA PNG (RenderPool job)."""
     with rasterio.open(cog_path) as ds:
         data = ds.read(1)
 
     nodata = np.isnan(data)
 
     # Color from BoundaryNorm
-    colored = PRECIP_CMAP(PRECIP_NORM(data))  # (H, W, 4) float
+    colored = lut_lookup_index(shared["precip_lut"], PRECIP_NORM(data))  # (H, W, 4) float
 
     # Alpha by value
     alpha = np.zeros_like(data)
@@ -442,32 +443,35 @@ def render_precip_png(cog_path, output_path):
     arr[..., :3] = (arr[..., :3] // 4) * 4
     img = Image.fromarray(arr, 'RGBA')
 
-    img.save(output_path, optimize=True, compress_level=9)
+    encode_frame(img, output_path, quantize=quantize)
 
 
-def phase3_render_pngs(sm_min, sm_max):
+def phase3_render_pngs(sm_min, sm_max, quantize=False):
     print("\n" + "=" * 60)
     print("PHASE 3: PNG Rendering")
     print("=" * 60)
 
-    # Soil moisture
     PNG_SM.mkdir(parents=True, exist_ok=True)
-    sm_cogs = sorted(COG_SM.glob("*.tif"))
-    print(f"Rendering {len(sm_cogs)} soil moisture PNGs...")
-    for i, cog in enumerate(sm_cogs):
-        if i == 0 or (i + 1) % 10 == 0:
-            print(f"  PNG {i + 1}/{len(sm_cogs)}: {cog.stem}")
-        render_sm_png(cog, PNG_SM / f"{cog.stem}.png", sm_min, sm_max)
-
-    # Precipitation
     PNG_PRECIP.mkdir(parents=True, exist_ok=True)
+    sm_cogs = sorted(COG_SM.glob("*.tif"))
     precip_cogs = sorted(COG_PRECIP.glob("*.tif"))
-    print(f"Rendering {len(precip_cogs)} precipitation PNGs...")
-    for i, cog in enumerate(precip_cogs):
-        if i == 0 or (i + 1) % 10 == 0:
-            print(f"  PNG {i + 1}/{len(precip_cogs)}: {cog.stem}")
-        render_precip_png(cog, PNG_PRECIP / f"{cog.stem}.png")
 
+    shared = {"sm_lut": lut_from_cmap(SM_CMAP), "precip_lut": lut_from_cmap(PRECIP_CMAP)}
+    with RenderPool(shared) as pool:
+        print(f"Rendering {len(sm_cogs)} soil moisture + {len(precip_cogs)} precipitation PNGs "
+              f"on {pool.workers} workers...")
+        for cog in sm_cogs:
+            pool.submit(f"soil-moisture/{cog.stem}", render_sm_png, cog,
+                        PNG_SM / f"{cog.stem}.png", vmin=sm_min, vmax=sm_max,
+                        quantize=quantize)
+        for cog in precip_cogs:
+            pool.submit(f"precipitation/{cog.stem}", render_precip_png, cog,
+                        PNG_PRECIP / f"{cog.stem}.png", quantize=quantize)
+        failed = pool.wait()
+
+    if failed:
+        print(f"⚠ {len(failed)} PNGs failed")
+        sys.exit(1)
     print("✓ All PNGs rendered")
 
 
@@ -485,20 +489,30 @@ def phase4_manifest():
     sm_frames = sorted(PNG_SM.glob("*.png"))
     precip_frames = sorted(PNG_PRECIP.glob("*.png"))
 
+    # Each frame's source COG is resolved through the STAC index (incremental rescan first)
+    scan(["cog/soil-moisture", "cog/precipitation"])
+
+    def frame_entry(f, subdir):
+        entry = {"date": f.stem, "url": f"raster-frames/{subdir}/{f.name}", "format": frame_format(f)}
+        cog = lookup(subdir, f.stem)
+        if cog:
+            entry["cog"] = cog
+        variants = frame_variants(f)
+        if variants:
+            entry["variants"] = {fmt: f"raster-frames/{subdir}/{v.name}" for fmt, v in variants.items()}
+            # Per-frame sizes so the client picks the smallest decodable file
+            entry["bytes"] = {"png": f.stat().st_size,
+                              **{fmt: v.stat().st_size for fmt, v in variants.items()}}
+        return entry
+
     manifest = {
         "soil_moisture": {
             "bounds": [WEST, SOUTH, EAST, NORTH],
-            "frames": [
-                {"date": f.stem, "url": f"raster-frames/soil-moisture/{f.name}"}
-                for f in sm_frames
-            ]
+            "frames": [frame_entry(f, "soil-moisture") for f in sm_frames]
         },
         "precipitation": {
             "bounds": [WEST, SOUTH, EAST, NORTH],
-            "frames": [
-                {"date": f.stem, "url": f"raster-frames/precipitation/{f.name}"}
-                for f in precip_frames
-            ]
+            "frames": [frame_entry(f, "precipitation") for f in precip_frames]
         },
         "cog": {
             "soil_moisture_dir": "cog/soil-moisture/",
@@ -509,6 +523,34 @@ def phase4_manifest():
     }
 
     path = FRONTEND / "raster-manifest.json"
+    previous = {}
+    if path.exists():
+        with open(path) as f:
+            previous = json.load(f)
+
+    # Blocks added by the derived-frame scripts: delta and atlas are rebuilt
+    # from the frames just rendered (with their previous settings) so they
+    # never go stale; anything else (e.g. bake_tile_pyramid's "tiles") is
+    # carried over with a reminder to rerun its script.
+    for key, png_dir in (("soil_moisture", PNG_SM), ("precipitation", PNG_PRECIP)):
+        old = previous.get(key, {})
+        subdir = png_dir.name
+        if "delta" in old:
+            block = encode_variable(
+                png_dir, png_dir.with_name(f"{subdir}-delta"), f"raster-frames/{subdir}-delta",
+                interval=old["delta"]["keyframe_interval"], step=old["delta"]["step"])
+            if block is not None:
+                manifest[key]["delta"] = block
+        if "atlas" in old:
+            block = build_atlas(
+                png_dir, png_dir.with_name(f"{subdir}-atlas"), f"raster-frames/{subdir}-atlas",
+                fmt=old["atlas"]["format"], max_side=old["atlas"].get("max_side", MAX_SHEET_SIDE))
+            if block is not None:
+                manifest[key]["atlas"] = block
+        for name in sorted(set(old) - set(manifest[key])):
+            manifest[key][name] = old[name]
+            print(f"  ⚠ kept {key}.{name} from the previous manifest — rerun its script if stale")
+
     with open(path, 'w') as f:
         json.dump(manifest, f, indent=2)
 
@@ -643,6 +685,11 @@ def phase5_qa():
 # ═══════════════════════════════════════════════════════════════════════════════
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--quantize", action="store_true",
+                        help="palette-quantize frames with > 256 RGBA values (lossy)")
+    args = parser.parse_args()
+
     t0 = time.time()
     print("Sprint 04: Cloud-Optimized Raster Pipeline")
     print("=" * 60)
@@ -668,7 +715,7 @@ def main():
     )
 
     # Phase 3
-    phase3_render_pngs(sm_min, sm_max)
+    phase3_render_pngs(sm_min, sm_max, quantize=args.quantize)
 
     # Phase 4
     phase4_manifest()
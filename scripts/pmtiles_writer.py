@@ -0,0 +1,218 @@
+"""Minimal PMTiles v3 writer.
+
+Writes single-file tile archives (https://github.com/protomaps/PMTiles,
+spec v3) that MapLibre reads through the `pmtiles://` protocol registered in
+map-setup.ts, so baked tile sets are served as static files.
+
+Tiles may be added in any order. They are spooled to a temp file and written
+out in tile-ID (Hilbert) order, with identical tile contents stored once and
+consecutive identical tiles collapsed into a single run-length entry.
+Directories are gzip-compressed; the root directory is kept within the first
+16 KiB, spilling to leaf directories for large archives.
+
+Usage:
+    from pmtiles_writer import PMTilesWriter
+
+    with PMTilesWriter(path, "png") as w:
+        w.add_tile(z, x, y, png_bytes)
+        w.metadata = {"name": "precipitation 2026-01-28"}
+        w.bounds = (west, south, east, north)
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+MAGIC = b"PMTiles"
+VERSION = 3
+HEADER_SIZE = 127
+ROOT_MAX_BYTES = 16384 - HEADER_SIZE
+LEAF_SIZE = 4096  # entries per leaf directory (grown until the root fits)
+
+COMPRESSION = {"unknown": 0, "none": 1, "gzip": 2, "brotli": 3, "zstd": 4}
+TILE_TYPES = {"unknown": 0, "mvt": 1, "png": 2, "jpeg": 3, "webp": 4, "avif": 5}
+
+
+# ─── Tile IDs ────────────────────────────────────────────────────────────────
+
+def zxy_to_tileid(z, x, y):
+    """Hilbert-curve tile ID: all tiles of lower zooms first, then d(x, y) at z."""
+    n = 1 << z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tile {z}/{x}/{y} out of range")
+    acc = ((1 << (2 * z)) - 1) // 3
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        acc += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x = s - 1 - x
+                y = s - 1 - y
+            x, y = y, x
+        x &= s - 1
+        y &= s - 1
+        s >>= 1
+    return acc
+
+
+# ─── Directories ─────────────────────────────────────────────────────────────
+
+def _varint(n, out):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def serialize_directory(entries):
+    """[(tile_id, offset, length, run_length)] → gzip-compressed directory bytes."""
+    out = bytearray()
+    _varint(len(entries), out)
+    last = 0
+    for tile_id, _, _, _ in entries:
+        _varint(tile_id - last, out)
+        last = tile_id
+    for _, _, _, run in entries:
+        _varint(run, out)
+    for _, _, length, _ in entries:
+        _varint(length, out)
+    for i, (_, offset, _, _) in enumerate(entries):
+        prev = entries[i - 1] if i else None
+        if prev and offset == prev[1] + prev[2]:
+            _varint(0, out)
+        else:
+            _varint(offset + 1, out)
+    return gzip.compress(bytes(out), mtime=0)
+
+
+def build_directories(entries):
+    """Root directory bytes, plus concatenated leaf directories if it overflows."""
+    root = serialize_directory(entries)
+    if len(root) <= ROOT_MAX_BYTES:
+        return root, b""
+
+    leaf_size = LEAF_SIZE
+    while True:
+        leaves = bytearray()
+        root_entries = []
+        for i in range(0, len(entries), leaf_size):
+            chunk = entries[i:i + leaf_size]
+            leaf = serialize_directory(chunk)
+            root_entries.append((chunk[0][0], len(leaves), len(leaf), 0))
+            leaves += leaf
+        root = serialize_directory(root_entries)
+        if len(root) <= ROOT_MAX_BYTES:
+            return root, bytes(leaves)
+        leaf_size *= 2
+
+
+# ─── Writer ──────────────────────────────────────────────────────────────────
+
+class PMTilesWriter:
+    """Collect tiles, then write a clustered PMTiles v3 archive on close()."""
+
+    def __init__(self, path, tile_type, tile_compression="none"):
+        self.path = path
+        self.tile_type = TILE_TYPES[tile_type]
+        self.tile_compression = COMPRESSION[tile_compression]
+        self.metadata = {}
+        self.bounds = (-180.0, -85.0511, 180.0, 85.0511)
+        self.center = None   # (lon, lat, zoom); defaults to the bounds centre
+        self._spool = tempfile.TemporaryFile()
+        self._tiles = {}     # tile_id → (z, spool offset, length)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._spool.close()
+        return False
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def add_tile(self, z, x, y, data):
+        """Add (or replace) one tile's bytes, already compressed per tile_compression."""
+        self._spool.seek(0, os.SEEK_END)
+        offset = self._spool.tell()
+        self._spool.write(data)
+        self._tiles[zxy_to_tileid(z, x, y)] = (z, offset, len(data))
+
+    def close(self):
+        """Write the archive. Tile data is stored in tile-ID order, deduplicated."""
+        entries = []         # (tile_id, offset, length, run_length)
+        by_hash = {}         # content hash → (offset, length)
+        data_len = 0
+        zooms = set()
+
+        data = tempfile.TemporaryFile()
+        for tile_id in sorted(self._tiles):
+            z, spool_offset, length = self._tiles[tile_id]
+            zooms.add(z)
+            self._spool.seek(spool_offset)
+            blob = self._spool.read(length)
+            digest = hashlib.sha256(blob).digest()
+            if digest in by_hash:
+                offset, length = by_hash[digest]
+            else:
+                offset = data_len
+                by_hash[digest] = (offset, length)
+                data.write(blob)
+                data_len += length
+            last = entries[-1] if entries else None
+            if last and last[1] == offset and last[0] + last[3] == tile_id:
+                entries[-1] = (last[0], offset, length, last[3] + 1)
+            else:
+                entries.append((tile_id, offset, length, 1))
+        self._spool.close()
+
+        root, leaves = build_directories(entries)
+        metadata = gzip.compress(json.dumps(self.metadata).encode(), mtime=0)
+
+        root_offset = HEADER_SIZE
+        metadata_offset = root_offset + len(root)
+        leaves_offset = metadata_offset + len(metadata)
+        data_offset = leaves_offset + len(leaves)
+
+        west, south, east, north = self.bounds
+        min_zoom, max_zoom = (min(zooms), max(zooms)) if zooms else (0, 0)
+        lon, lat, center_zoom = self.center or ((west + east) / 2, (south + north) / 2, min_zoom)
+
+        header = MAGIC + struct.pack(
+            "<BQQQQQQQQQQQBBBBBBiiiiBii",
+            VERSION,
+            root_offset, len(root),
+            metadata_offset, len(metadata),
+            leaves_offset, len(leaves),
+            data_offset, data_len,
+            len(self._tiles), len(entries), len(by_hash),
+            1,                                  # clustered
+            COMPRESSION["gzip"],                # internal (directory/metadata) compression
+            self.tile_compression,
+            self.tile_type,
+            min_zoom, max_zoom,
+            round(west * 1e7), round(south * 1e7), round(east * 1e7), round(north * 1e7),
+            center_zoom, round(lon * 1e7), round(lat * 1e7),
+        )
+        assert len(header) == HEADER_SIZE
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.write(root)
+            f.write(metadata)
+            f.write(leaves)
+            data.seek(0)
+            while chunk := data.read(1 << 20):
+                f.write(chunk)
+        data.close()
+        os.replace(tmp, self.path)
+        return self.path
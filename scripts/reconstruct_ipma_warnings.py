@@ -23,10 +23,11 @@ Output:
 
 import json
 import os
-import copy
 from datetime import date, timedelta
 from collections import defaultdict
 
+from feature_writer import FeatureWriter, SharedGeometry
+
 # --- Configuration ---
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DISTRICTS_PATH = os.path.join(PROJECT_ROOT, "assets", "districts.geojson")
@@ -376,7 +377,7 @@ def main():
 
     # --- Step 4: Generate timeline GeoJSON ---
     print("Generating timeline GeoJSON...")
-    features = []
+    timeline = []  # (district code, properties); geometry is attached at write time
     for code in sorted(districts.keys()):
         for date_str in dates_list:
             # Get the highest warning level across all types for this district-day
@@ -427,16 +428,9 @@ def main():
             if coastal_info:
                 props["coastal_level"] = coastal_info["level"]
 
-            feature = {
-                "type": "Feature",
-                "properties": props,
-                "geometry": copy.deepcopy(districts[code]["geometry"]),
-            }
-            features.append(feature)
+            timeline.append((code, props))
 
-    geojson = {
-        "type": "FeatureCollection",
-        "features": features,
+    collection = {
         "metadata": {
             "description": "Reconstructed IPMA weather warnings for Portugal flood crisis, Jan 25 - Feb 14, 2026",
             "source_methodology": (
@@ -453,11 +447,13 @@ def main():
         },
     }
 
-    os.makedirs(os.path.dirname(GEOJSON_OUT), exist_ok=True)
-    with open(GEOJSON_OUT, "w") as f:
-        json.dump(geojson, f, ensure_ascii=False, indent=None)
+    # Each district polygon is serialized once and spliced into all of its day features
+    geometries = {code: SharedGeometry(d["geometry"]) for code, d in districts.items()}
+    with FeatureWriter(GEOJSON_OUT, members=collection) as writer:
+        for code, props in timeline:
+            writer.write(props, geometries[code])
 
-    print(f"  Written {len(features)} features to {GEOJSON_OUT}")
+    print(f"  Written {len(writer)} features to {GEOJSON_OUT}")
     size_kb = os.path.getsize(GEOJSON_OUT) / 1024
     print(f"  File size: {size_kb:.0f} KB")
 
@@ -519,12 +515,12 @@ def main():
     # --- Step 6: Summary statistics ---
     print("\n=== Summary ===")
     from collections import Counter
-    levels = Counter(f["properties"]["warning_level"] for f in features)
-    sources = Counter(f["properties"]["source"] for f in features)
-    types = Counter(f["properties"]["warning_type"] for f in features)
-    storms_count = Counter(f["properties"]["storm"] for f in features if f["properties"]["storm"])
+    levels = Counter(p["warning_level"] for _, p in timeline)
+    sources = Counter(p["source"] for _, p in timeline)
+    types = Counter(p["warning_type"] for _, p in timeline)
+    storms_count = Counter(p["storm"] for _, p in timeline if p["storm"])
 
-    print(f"Total features: {len(features)}")
+    print(f"Total features: {len(timeline)}")
     print(f"Date range: {dates_list[0]} to {dates_list[-1]} ({len(dates_list)} days)")
     print(f"Districts: {len(districts)}")
     print(f"Warning levels: {dict(levels)}")
@@ -534,8 +530,7 @@ def main():
 
     # Show red warning days
     print("\nRed warning days:")
-    for f in features:
-        p = f["properties"]
+    for _, p in timeline:
         if p["warning_level"] == "red":
             print(f"  {p['date']} | {p['district']:20s} | {p['warning_type']:20s} | {p['source']}")
 
@@ -0,0 +1,203 @@
+"""Process-pool scheduler for rendering raster frames in parallel.
+
+The PNG renderers (generate-cog-frames.py phase 3, rerender-pngs.py,
+rerender_precip_pngs.py) spend most of each frame in bicubic upscaling and
+PNG encoding, one frame at a time. This module fans frames out over a
+process pool:
+
+  - Read-only inputs every frame needs (Portugal mask, feathered alpha,
+    colormap LUTs) are copied once into shared memory; workers attach to
+    them at start-up instead of receiving a pickled copy per job.
+  - Each job has a key and a fixed output path. Workers write to a hidden
+    temp file next to the output and `os.replace` it, so a file only ever
+    appears under its final, deterministic name once complete.
+  - A job that writes nothing (e.g. an empty tile) is skipped, not failed.
+  - `cancel(key)` drops a pending job, or tells a running one to discard
+    its output, via a per-job flag in shared memory.
+
+Usage:
+    from render_pool import RenderPool
+
+    with RenderPool({"mask": mask, "alpha": alpha}) as pool:
+        for cog in cogs:
+            pool.submit(cog.stem, render_frame, cog, PNG_DIR / f"{cog.stem}.png", vmin=0, vmax=1)
+        failed = pool.wait()
+
+`render_frame(src, dst, shared, **kwargs)` must be a module-level function;
+`shared` is a dict of read-only numpy views onto the shared arrays.
+"""
+
+import os
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Slots in the shared cancel-flag array (one per submitted job)
+MAX_JOBS = 1 << 16
+
+# Worker-side views onto the shared arrays, set by _attach()
+_SHARED = {}
+_SHM_HANDLES = []
+
+
+# ─── Colormap LUTs ───────────────────────────────────────────────────────────
+
+def lut_from_cmap(cmap):
+    """matplotlib colormap → (N + 3, 4) float table: N colors, under, over, bad."""
+    return np.vstack([
+        cmap(np.arange(cmap.N)),
+        cmap.get_under(), cmap.get_over(), cmap.get_bad(),
+    ])
+
+
+def lut_lookup(lut, x):
+    """Same result as `cmap(x)` for normalized floats, using a shared LUT."""
+    n = lut.shape[0] - 3
+    xa = np.array(x, dtype=np.float64) * n
+    xa[xa == n] = n - 1
+    under, over, bad = xa < 0, xa >= n, np.isnan(xa)
+    with np.errstate(invalid="ignore"):
+        idx = xa.astype(np.intp)
+    idx[under] = n
+    idx[over] = n + 1
+    idx[bad] = n + 2
+    return lut.take(idx, axis=0)
+
+
+def lut_lookup_index(lut, idx):
+    """Same result as `cmap(norm(x))` for a BoundaryNorm (integer, masked) index."""
+    n = lut.shape[0] - 3
+    bad = np.ma.getmaskarray(idx)
+    ia = np.ma.getdata(idx).astype(np.intp)
+    ia = np.where(ia < 0, n, np.where(ia >= n, n + 1, ia))
+    ia[bad] = n + 2
+    return lut.take(ia, axis=0)
+
+
+# ─── Shared memory ───────────────────────────────────────────────────────────
+
+def _open_shm(name):
+    """Attach to a block created by the parent (which alone unlinks it)."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13: workers share the parent's resource tracker
+        return shared_memory.SharedMemory(name=name)
+
+
+def _attach(spec):
+    """Pool initializer: map every shared array into this worker."""
+    for key, (name, shape, dtype) in spec.items():
+        shm = _open_shm(name)
+        _SHM_HANDLES.append(shm)
+        view = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        if key != "__cancel__":
+            view.flags.writeable = False
+        _SHARED[key] = view
+
+
+def _run(fn, slot, src, dst, kwargs):
+    """Worker entry point: render to a temp file, then atomically rename."""
+    cancel = _SHARED["__cancel__"]
+    if cancel[slot]:
+        return None
+    shared = {k: v for k, v in _SHARED.items() if k != "__cancel__"}
+    tmp = dst.with_name(f".{dst.stem}.tmp{dst.suffix}")
+    try:
+        fn(src, tmp, shared, **kwargs)
+        if cancel[slot] or not tmp.exists():
+            return None
+        os.replace(tmp, dst)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return dst
+
+
+class RenderPool:
+    """Process pool with shared read-only arrays and per-job cancellation."""
+
+    def __init__(self, arrays, workers=None):
+        self.arrays = arrays
+        self.workers = workers or os.cpu_count() or 1
+        self._blocks = []
+        self._jobs = {}       # key → (slot, future)
+        self._executor = None
+        self._cancel = None
+
+    def __enter__(self):
+        spec = {}
+        cancel = np.zeros(MAX_JOBS, dtype=np.uint8)
+        for key, arr in {**self.arrays, "__cancel__": cancel}.items():
+            arr = np.ascontiguousarray(arr)
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            self._blocks.append(shm)
+            view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+            view[...] = arr
+            spec[key] = (shm.name, arr.shape, arr.dtype.str)
+            if key == "__cancel__":
+                self._cancel = view
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_attach, initargs=(spec,),
+        )
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.cancel_all()
+        self._executor.shutdown(wait=True, cancel_futures=exc_type is not None)
+        self._cancel = None
+        for shm in self._blocks:
+            shm.close()
+            shm.unlink()
+        self._blocks = []
+        return False
+
+    def submit(self, key, fn, src, dst, **kwargs):
+        """Queue one frame. `key` must be unique; `dst` is its final output path."""
+        if key in self._jobs:
+            raise ValueError(f"Duplicate render job key: {key}")
+        slot = len(self._jobs)
+        if slot >= MAX_JOBS:
+            raise ValueError(f"More than {MAX_JOBS} jobs in one RenderPool")
+        future = self._executor.submit(_run, fn, slot, src, dst, kwargs)
+        self._jobs[key] = (slot, future)
+
+    def cancel(self, key):
+        """Cancel one job. Returns False if it had already finished."""
+        slot, future = self._jobs[key]
+        if future.done():
+            return False
+        self._cancel[slot] = 1
+        future.cancel()
+        return True
+
+    def cancel_all(self):
+        for key in self._jobs:
+            self.cancel(key)
+
+    def results(self):
+        """Yield (key, output_path | None, error | None) in submission order.
+
+        Output is None for cancelled or skipped jobs; errors are returned,
+        not raised, so one bad frame does not abort the rest.
+        """
+        for key, (_slot, future) in self._jobs.items():
+            try:
+                yield key, future.result(), None
+            except CancelledError:
+                yield key, None, None
+            except Exception as e:
+                yield key, None, e
+
+    def wait(self, every=10):
+        """Block until all jobs finish, printing progress. Returns failed keys."""
+        total = len(self._jobs)
+        failed = []
+        for i, (key, _path, error) in enumerate(self.results()):
+            if error is not None:
+                print(f"  ⚠ {key}: {error}")
+                failed.append(key)
+            elif i == 0 or (i + 1) % every == 0 or i == total - 1:
+                print(f"  [{i+1}/{total}] {key}")
+        return failed
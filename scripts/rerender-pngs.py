@@ -8,12 +8,20 @@ Fixes two Sprint 04 defects:
 Approach: read COG float data → upscale data only (bicubic) → rasterize mask at
 final resolution → apply colormap → clean alpha. No color quantization.
 
+Each variable's COG stack is upscaled in one batched pass (resample.py:
+nearest-fill map and separable bicubic weights computed once), then frames
+render in parallel over a RenderPool (one process per core); the upscaled
+stacks, mask, feathered alpha and colormap LUTs are shared with workers via
+shared memory.
+
 Usage:
   cd /home/nls/Documents/dev/cheias-pt
   source .venv/bin/activate
   python scripts/rerender-pngs.py
+  python scripts/rerender-pngs.py --quantize   # 256-colour palette PNGs (lossy, smaller)
 """
 
+import argparse
 import sys
 import time
 from pathlib import Path
@@ -29,6 +37,10 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.colors as mcolors
 
+from frame_encoder import encode_frame
+from render_pool import RenderPool, lut_from_cmap, lut_lookup, lut_lookup_index
+from resample import read_stack, upscale_stack
+
 # ─── Config ──────────────────────────────────────────────────────────────────
 
 ROOT = Path(__file__).resolve().parent.parent
@@ -112,37 +124,6 @@ def get_portugal_mask():
     return mask, alpha
 
 
-def upscale_data(cog_path, target_h, target_w):
-    """Read COG float data and upscale to target resolution using bicubic.
-    Returns (H, W) float array with NaN for nodata."""
-    with rasterio.open(cog_path) as ds:
-        data = ds.read(1)  # (265, 175) float32
-
-    # Replace nodata with NaN for interpolation
-    nodata_mask = np.isnan(data)
-
-    # For interpolation: fill nodata with nearest valid value to avoid edge NaN propagation
-    if nodata_mask.any():
-        from scipy.ndimage import distance_transform_edt
-        _, nearest_idx = distance_transform_edt(nodata_mask, return_distances=True, return_indices=True)
-        data_filled = data[tuple(nearest_idx)]
-    else:
-        data_filled = data
-
-    # Bicubic upscale using PIL (high quality, handles float via intermediate)
-    img_f = Image.fromarray(data_filled.astype(np.float32), mode='F')
-    img_up = img_f.resize((target_w, target_h), Image.BICUBIC)
-    result = np.array(img_up)
-
-    # Upscale the nodata mask with nearest-neighbor to preserve hard edges
-    mask_img = Image.fromarray(nodata_mask.astype(np.uint8) * 255, mode='L')
-    mask_up = mask_img.resize((target_w, target_h), Image.NEAREST)
-    nodata_up = np.array(mask_up) > 128
-    result[nodata_up] = np.nan
-
-    return result
-
-
 def get_global_sm_range():
     """Scan all soil moisture COGs for global min/max."""
     vmin, vmax = float('inf'), float('-inf')
@@ -156,13 +137,13 @@ def get_global_sm_range():
     return vmin, vmax
 
 
-def render_sm(data, mask, alpha_feather, vmin, vmax):
+def render_sm(data, mask, alpha_feather, vmin, vmax, lut):
     """Render soil moisture float array → RGBA PIL Image."""
     # Normalize to [0, 1]
     norm = np.clip((data - max(vmin, 0)) / (max(vmax, 0.01) - max(vmin, 0)), 0, 1)
 
-    # Apply colormap
-    colored = SM_CMAP(norm)  # (H, W, 4)
+    # Apply colormap (LUT from SM_CMAP)
+    colored = lut_lookup(lut, norm)  # (H, W, 4)
 
     # Alpha: feathered mask × 0.85 (slightly translucent for basemap labels)
     colored[..., 3] = alpha_feather * 0.85
@@ -174,10 +155,10 @@ def render_sm(data, mask, alpha_feather, vmin, vmax):
     return Image.fromarray(rgba, 'RGBA')
 
 
-def render_precip(data, mask, alpha_feather):
+def render_precip(data, mask, alpha_feather, lut):
     """Render precipitation float array → RGBA PIL Image."""
-    # Apply classified colormap
-    colored = PRECIP_CMAP(PRECIP_NORM(data))  # (H, W, 4)
+    # Apply classified colormap (LUT from PRECIP_CMAP)
+    colored = lut_lookup_index(lut, PRECIP_NORM(data))  # (H, W, 4)
 
     # Alpha varies with intensity
     value_alpha = np.zeros_like(data)
@@ -195,9 +176,28 @@ def render_precip(data, mask, alpha_feather):
     return Image.fromarray(rgba, 'RGBA')
 
 
+def render_sm_frame(index, out_path, shared, vmin, vmax, quantize=False):
+    """RenderPool job: one frame of the upscaled soil moisture stack → PNG."""
+    data = shared["sm_stack"][index]
+    img = render_sm(data, shared["mask"], shared["alpha"], vmin, vmax, shared["sm_lut"])
+    encode_frame(img, out_path, quantize=quantize)
+
+
+def render_precip_frame(index, out_path, shared, quantize=False):
+    """RenderPool job: one frame of the upscaled precipitation stack → PNG."""
+    data = shared["precip_stack"][index]
+    img = render_precip(data, shared["mask"], shared["alpha"], shared["precip_lut"])
+    encode_frame(img, out_path, quantize=quantize)
+
+
 # ─── Main ────────────────────────────────────────────────────────────────────
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--quantize", action="store_true",
+                        help="palette-quantize frames with > 256 RGBA values (lossy)")
+    args = parser.parse_args()
+
     t0 = time.time()
     print("Re-rendering PNGs from existing COGs")
     print(f"Target resolution: {TARGET_WIDTH}×{TARGET_HEIGHT} (~0.005°/px)")
@@ -214,31 +214,39 @@ def main():
     sm_min, sm_max = get_global_sm_range()
     print(f"  Range: {sm_min:.4f} → {sm_max:.4f}")
 
-    # Render soil moisture
     sm_cogs = sorted(COG_SM.glob("*.tif"))
-    print(f"\nRendering {len(sm_cogs)} soil moisture PNGs...")
-    PNG_SM.mkdir(parents=True, exist_ok=True)
-
-    for i, cog in enumerate(sm_cogs):
-        if i == 0 or (i + 1) % 10 == 0 or i == len(sm_cogs) - 1:
-            print(f"  [{i+1}/{len(sm_cogs)}] {cog.stem}")
-
-        data = upscale_data(cog, TARGET_HEIGHT, TARGET_WIDTH)
-        img = render_sm(data, mask, alpha_feather, sm_min, sm_max)
-        img.save(PNG_SM / f"{cog.stem}.png", optimize=True, compress_level=9)
-
-    # Render precipitation
     precip_cogs = sorted(COG_PRECIP.glob("*.tif"))
-    print(f"\nRendering {len(precip_cogs)} precipitation PNGs...")
+    PNG_SM.mkdir(parents=True, exist_ok=True)
     PNG_PRECIP.mkdir(parents=True, exist_ok=True)
 
-    for i, cog in enumerate(precip_cogs):
-        if i == 0 or (i + 1) % 10 == 0 or i == len(precip_cogs) - 1:
-            print(f"  [{i+1}/{len(precip_cogs)}] {cog.stem}")
-
-        data = upscale_data(cog, TARGET_HEIGHT, TARGET_WIDTH)
-        img = render_precip(data, mask, alpha_feather)
-        img.save(PNG_PRECIP / f"{cog.stem}.png", optimize=True, compress_level=9)
+    # Upscale each variable's whole stack at once (one resampler per nodata mask)
+    print("Upscaling COG stacks...")
+    sm_stack = upscale_stack(read_stack(sm_cogs), TARGET_HEIGHT, TARGET_WIDTH)
+    precip_stack = upscale_stack(read_stack(precip_cogs), TARGET_HEIGHT, TARGET_WIDTH)
+
+    shared = {
+        "mask": mask,
+        "alpha": alpha_feather,
+        "sm_lut": lut_from_cmap(SM_CMAP),
+        "precip_lut": lut_from_cmap(PRECIP_CMAP),
+        "sm_stack": sm_stack,
+        "precip_stack": precip_stack,
+    }
+    with RenderPool(shared) as pool:
+        print(f"\nRendering {len(sm_cogs)} soil moisture + {len(precip_cogs)} precipitation PNGs "
+              f"on {pool.workers} workers...")
+        for i, cog in enumerate(sm_cogs):
+            pool.submit(f"soil-moisture/{cog.stem}", render_sm_frame, i,
+                        PNG_SM / f"{cog.stem}.png", vmin=sm_min, vmax=sm_max,
+                        quantize=args.quantize)
+        for i, cog in enumerate(precip_cogs):
+            pool.submit(f"precipitation/{cog.stem}", render_precip_frame, i,
+                        PNG_PRECIP / f"{cog.stem}.png", quantize=args.quantize)
+        failed = pool.wait()
+
+    if failed:
+        print(f"⚠ {len(failed)} frames failed")
+        sys.exit(1)
 
     # Summary
     elapsed = time.time() - t0
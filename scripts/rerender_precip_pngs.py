@@ -6,12 +6,18 @@ Scroll timeline spec (Ch.3):
   - Alpha proportional to intensity
   - Gaussian blur σ=3 for soft rain-band appearance
 
+The COG stack is upscaled in one batched pass (resample.py), then frames
+render in parallel over a RenderPool; the upscaled stack, mask, feathered
+alpha and blues LUT are shared with workers via shared memory.
+
 Usage:
   cd /home/nls/Documents/dev/cheias-pt
   source .venv/bin/activate
   python scripts/rerender_precip_pngs.py
+  python scripts/rerender_precip_pngs.py --quantize   # 256-colour palette PNGs (lossy, smaller)
 """
 
+import argparse
 import sys
 import time
 from pathlib import Path
@@ -22,12 +28,16 @@ import rasterio
 from rasterio.features import rasterize
 from rasterio.transform import from_bounds
 from shapely.ops import unary_union
-from scipy.ndimage import gaussian_filter, distance_transform_edt
+from scipy.ndimage import gaussian_filter
 from PIL import Image
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.colors as mcolors
 
+from frame_encoder import encode_frame
+from render_pool import RenderPool, lut_from_cmap, lut_lookup
+from resample import read_stack, upscale_stack
+
 # ─── Config ──────────────────────────────────────────────────────────────────
 
 ROOT = Path(__file__).resolve().parent.parent
@@ -95,36 +105,6 @@ def get_portugal_mask():
     return mask, alpha
 
 
-def upscale_data(cog_path, target_h, target_w):
-    """Read COG float data and upscale to target resolution using bicubic.
-    Returns (H, W) float array with NaN for nodata."""
-    with rasterio.open(cog_path) as ds:
-        data = ds.read(1)
-
-    # Replace nodata with NaN for interpolation
-    nodata_mask = np.isnan(data)
-
-    # For interpolation: fill nodata with nearest valid value to avoid edge NaN propagation
-    if nodata_mask.any():
-        _, nearest_idx = distance_transform_edt(nodata_mask, return_distances=True, return_indices=True)
-        data_filled = data[tuple(nearest_idx)]
-    else:
-        data_filled = data
-
-    # Bicubic upscale using PIL (high quality)
-    img_f = Image.fromarray(data_filled.astype(np.float32), mode='F')
-    img_up = img_f.resize((target_w, target_h), Image.BICUBIC)
-    result = np.array(img_up)
-
-    # Upscale the nodata mask with nearest-neighbor to preserve hard edges
-    mask_img = Image.fromarray(nodata_mask.astype(np.uint8) * 255, mode='L')
-    mask_up = mask_img.resize((target_w, target_h), Image.NEAREST)
-    nodata_up = np.array(mask_up) > 128
-    result[nodata_up] = np.nan
-
-    return result
-
-
 def scan_global_max():
     """Scan all precip COGs for global maximum to inform normalization."""
     gmax = 0.0
@@ -138,7 +118,7 @@ def scan_global_max():
     return gmax
 
 
-def render_precip_blues(data, mask, alpha_feather):
+def render_precip_blues(data, mask, alpha_feather, lut):
     """Render precipitation float array → RGBA PIL Image with blues colormap.
 
     Steps:
@@ -158,8 +138,8 @@ def render_precip_blues(data, mask, alpha_feather):
     # 3. Normalize to [0, 1]
     normalized = np.clip(data_blurred / PRECIP_MAX_MM, 0, 1)
 
-    # 4. Apply blues colormap → (H, W, 4) float [0, 1]
-    colored = BLUES_CMAP(normalized)
+    # 4. Apply blues colormap (LUT from BLUES_CMAP) → (H, W, 4) float [0, 1]
+    colored = lut_lookup(lut, normalized)
 
     # 5. Intensity-proportional alpha: alpha = clip(80 + 175 * normalized, 0, 255) / 255
     #    For zero/trace (normalized < ~0.004 = 0.3mm/80mm), set alpha to 0 (transparent)
@@ -178,9 +158,21 @@ def render_precip_blues(data, mask, alpha_feather):
     return Image.fromarray(rgba, 'RGBA')
 
 
+def render_frame(index, out_path, shared, quantize=False):
+    """RenderPool job: one frame of the upscaled precipitation stack → PNG."""
+    data = shared["stack"][index]
+    img = render_precip_blues(data, shared["mask"], shared["alpha"], shared["lut"])
+    encode_frame(img, out_path, quantize=quantize)
+
+
 # ─── Main ────────────────────────────────────────────────────────────────────
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--quantize", action="store_true",
+                        help="palette-quantize frames with > 256 RGBA values (lossy)")
+    args = parser.parse_args()
+
     t0 = time.time()
     print("Re-rendering precipitation PNGs — blues colormap")
     print(f"Target resolution: {TARGET_WIDTH}×{TARGET_HEIGHT}")
@@ -202,16 +194,22 @@ def main():
 
     # Gather COGs (skip .aux.xml)
     cogs = sorted(p for p in COG_PRECIP.iterdir() if p.suffix == '.tif')
-    print(f"\nRendering {len(cogs)} precipitation PNGs...")
     PNG_PRECIP.mkdir(parents=True, exist_ok=True)
 
-    for i, cog in enumerate(cogs):
-        if i == 0 or (i + 1) % 10 == 0 or i == len(cogs) - 1:
-            print(f"  [{i+1}/{len(cogs)}] {cog.stem}")
+    print("Upscaling COG stack...")
+    stack = upscale_stack(read_stack(cogs), TARGET_HEIGHT, TARGET_WIDTH)
+
+    shared = {"mask": mask, "alpha": alpha_feather, "lut": lut_from_cmap(BLUES_CMAP), "stack": stack}
+    with RenderPool(shared) as pool:
+        print(f"\nRendering {len(cogs)} precipitation PNGs on {pool.workers} workers...")
+        for i, cog in enumerate(cogs):
+            pool.submit(cog.stem, render_frame, i, PNG_PRECIP / f"{cog.stem}.png",
+                        quantize=args.quantize)
+        failed = pool.wait()
 
-        data = upscale_data(cog, TARGET_HEIGHT, TARGET_WIDTH)
-        img = render_precip_blues(data, mask, alpha_feather)
-        img.save(PNG_PRECIP / f"{cog.stem}.png", optimize=True, compress_level=9)
+    if failed:
+        print(f"  WARNING: {len(failed)} frames failed")
+        sys.exit(1)
 
     # Summary
     elapsed = time.time() - t0
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""Local STAC catalog + SQLite index of every COG the project produces.
+
+Each producer writes its COGs into its own directory (data/cog/<variable>/,
+data/sentinel-2/), and every consumer found them again by globbing and
+parsing file names; fetch_sentinel2_stac.py also wrote loose STAC Item
+JSONs that nothing read. This module indexes them once:
+
+  - one collection per variable: the directory path under the root plus
+    whatever is left of the file stem once the timestamp is removed, e.g.
+    cog/precipitation/2026-02-05.tif            → precipitation
+    cog/arpege/mslp/2026-02-05T06.tif           → arpege-mslp
+    cog/wind-gust-icon/2026-02-05_daily-max.tif → wind-gust-icon-daily-max
+    sentinel-2/salvaterra-ndwi-after-20260220   → sentinel-2-salvaterra-ndwi-after
+  - timestamps are parsed from the stem (YYYY-MM-DD, YYYY-MM-DDTHH,
+    YYYY-MM-DDTHH-MM, YYYYMMDD, YYYYMMDD_YYYYMMDD ranges); files without
+    one (storm totals, diffs) are static items with a null datetime
+  - the index (SQLite) has a (collection, datetime) B-tree for "variable X
+    at time T" and an R*Tree on the EPSG:4326 bbox for spatial queries;
+    rescans only open files whose size or mtime changed
+  - a static STAC 1.0.0 catalog (catalog.json → collection.json → item
+    JSONs, asset hrefs relative) is written alongside for external tools
+
+Hrefs are relative to data/, as in data/frontend/raster-manifest.json.
+
+Output: data/stac/index.sqlite, data/stac/catalog.json, data/stac/<collection>/
+
+Usage:
+    python scripts/stac_catalog.py                       # rescan everything, write catalog
+    python scripts/stac_catalog.py --only cog/precipitation  # rescan one directory
+    python scripts/stac_catalog.py --lookup mslp 2026-02-05T06
+
+    from stac_catalog import lookup, search
+    lookup("mslp", "2026-02-05T06:00:00")                # → "cog/mslp/2026-02-05T06.tif"
+    lookup("sst", "2026-02-05T12:00:00", nearest=True)   # latest item at or before T
+    search(collection="ivt", bbox=(-10, 36, -6, 42), start="2026-02-01", end="2026-02-10")
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+
+import rasterio
+from rasterio.errors import RasterioIOError
+from rasterio.warp import transform_bounds
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+
+ROOT = Path(__file__).resolve().parent.parent
+DATA = ROOT / "data"
+STAC_DIR = DATA / "stac"
+INDEX = STAC_DIR / "index.sqlite"
+
+# Directories under data/ holding COGs → collection name prefix ("" = subdirectory names only)
+ROOTS = {
+    "cog": "",
+    "sentinel-2": "sentinel-2",
+}
+
+# Timestamp patterns in file stems, most specific first: (regex, strptime formats of start[, end])
+TIME_PATTERNS = [
+    (re.compile(r"(\d{4}-\d{2}-\d{2}T\d{2}-\d{2})"), "%Y-%m-%dT%H-%M"),
+    (re.compile(r"(\d{4}-\d{2}-\d{2}T\d{2})"), "%Y-%m-%dT%H"),
+    (re.compile(r"(\d{4}-\d{2}-\d{2})"), "%Y-%m-%d"),
+    (re.compile(r"(\d{8})_(\d{8})"), "%Y%m%d"),
+    (re.compile(r"(\d{8})"), "%Y%m%d"),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    rowid       INTEGER PRIMARY KEY,
+    collection  TEXT NOT NULL,
+    id          TEXT NOT NULL,
+    datetime    TEXT,               -- ISO 8601 UTC, NULL for static items
+    end_datetime TEXT,              -- set for items covering a range
+    href        TEXT NOT NULL UNIQUE,  -- relative to data/
+    crs         TEXT,
+    width       INTEGER,
+    height      INTEGER,
+    dtype       TEXT,
+    properties  TEXT,               -- extra JSON properties from the producer
+    size        INTEGER,
+    mtime_ns    INTEGER,
+    UNIQUE (collection, id)
+);
+CREATE INDEX IF NOT EXISTS items_time ON items (collection, datetime);
+CREATE VIRTUAL TABLE IF NOT EXISTS items_bbox USING rtree (rowid, west, east, south, north);
+"""
+
+
+# ─── Parsing ─────────────────────────────────────────────────────────────────
+
+def _iso(dt):
+    return dt.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def parse_name(rel):
+    """(collection, item id, datetime, end_datetime) for a COG path relative to data/."""
+    top, *dirs = rel.parent.parts
+    stem = rel.stem
+    start = end = None
+    for pattern, fmt in TIME_PATTERNS:
+        m = pattern.search(stem)
+        if m:
+            start = _iso(datetime.strptime(m.group(1), fmt))
+            if m.lastindex > 1:
+                end = _iso(datetime.strptime(m.group(2), fmt))
+            stem = stem[:m.start()] + stem[m.end():]
+            break
+    rest = re.sub(r"[^a-z0-9]+", "-", stem.lower()).strip("-")
+    parts = [p for p in (ROOTS.get(top, top), *dirs, rest) if p]
+    collection = "-".join(parts) if parts else top
+    return collection, rel.stem, start, end
+
+
+def normalize_time(when):
+    """ISO string / datetime → the index's ISO UTC form ('2026-02-05T06' style accepted)."""
+    if isinstance(when, datetime):
+        dt = when.astimezone(timezone.utc).replace(tzinfo=None) if when.tzinfo else when
+        return _iso(dt)
+    text = str(when).rstrip("Z")
+    for pattern, fmt in TIME_PATTERNS[:3]:
+        if pattern.fullmatch(text):
+            return _iso(datetime.strptime(text, fmt))
+    return _iso(datetime.fromisoformat(text).replace(tzinfo=None))
+
+
+def read_metadata(path):
+    """Raster metadata for the index: crs, shape, dtype and EPSG:4326 bbox."""
+    with rasterio.open(path) as ds:
+        bbox = ds.bounds
+        if ds.crs and ds.crs.to_epsg() != 4326:
+            bbox = transform_bounds(ds.crs, "EPSG:4326", *bbox)
+        return {
+            "crs": ds.crs.to_string() if ds.crs else None,
+            "width": ds.width,
+            "height": ds.height,
+            "dtype": ds.dtypes[0],
+            "bbox": [round(float(v), 6) for v in bbox],
+        }
+
+
+# ─── Index ───────────────────────────────────────────────────────────────────
+
+def connect(path=INDEX):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _upsert(conn, rel, stat, properties=None):
+    collection, item_id, start, end = parse_name(rel)
+    meta = read_metadata(DATA / rel)
+    if properties is None:  # a rescan keeps what the producer registered
+        row = conn.execute("SELECT properties FROM items WHERE href = ?", (rel.as_posix(),)).fetchone()
+        properties = json.loads(row["properties"]) if row and row["properties"] else None
+    conn.execute("DELETE FROM items_bbox WHERE rowid IN (SELECT rowid FROM items WHERE href = ?)",
+                 (rel.as_posix(),))
+    conn.execute("DELETE FROM items WHERE href = ?", (rel.as_posix(),))
+    # Item ids are unique per collection; a second file with the same stem
+    # (x.tif next to x.tiff) is indexed under its file name instead of
+    # replacing the first one on every scan
+    clash = conn.execute("SELECT 1 FROM items WHERE collection = ? AND id = ?",
+                         (collection, item_id)).fetchone()
+    if clash:
+        item_id = rel.name
+    cur = conn.execute(
+        "INSERT INTO items (collection, id, datetime, end_datetime, href, crs, width, height,"
+        " dtype, properties, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (collection, item_id, start, end, rel.as_posix(), meta["crs"], meta["width"], meta["height"],
+         meta["dtype"], json.dumps(properties) if properties else None, stat.st_size, stat.st_mtime_ns),
+    )
+    west, south, east, north = meta["bbox"]
+    conn.execute("INSERT INTO items_bbox VALUES (?, ?, ?, ?, ?)", (cur.lastrowid, west, east, south, north))
+    return collection
+
+
+def index_files(paths, properties=None, path=INDEX):
+    """Add or refresh specific COGs (e.g. right after a producer wrote them).
+
+    `properties` (JSON-serializable) are stored with each item and copied
+    into its STAC properties. Returns the set of collections touched.
+    """
+    touched = set()
+    with closing(connect(path)) as conn, conn:
+        for p in paths:
+            p = Path(p).resolve()
+            touched.add(_upsert(conn, p.relative_to(DATA), p.stat(), properties))
+    return touched
+
+
+def scan(roots=None, path=INDEX):
+    """Walk the COG roots once, index new/changed files and drop deleted ones.
+
+    `roots` are directories relative to data/ (default: all ROOTS). Returns
+    (added or updated, removed, unchanged) counts and the touched collections.
+    """
+    roots = roots or list(ROOTS)
+    touched = set()
+    added = removed = unchanged = 0
+    with closing(connect(path)) as conn, conn:
+        for root in roots:
+            known = {r["href"]: (r["size"], r["mtime_ns"], r["collection"]) for r in conn.execute(
+                "SELECT href, size, mtime_ns, collection FROM items WHERE href LIKE ?", (f"{root}/%",))}
+            seen = set()
+            for dirpath, dirnames, filenames in os.walk(DATA / root):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith((".", "_")))
+                for name in filenames:
+                    if not name.endswith((".tif", ".tiff")) or name.startswith("."):
+                        continue
+                    file = Path(dirpath) / name
+                    rel = file.relative_to(DATA)
+                    href = rel.as_posix()
+                    seen.add(href)
+                    stat = file.stat()
+                    if href in known and known[href][:2] == (stat.st_size, stat.st_mtime_ns):
+                        unchanged += 1
+                        continue
+                    try:
+                        touched.add(_upsert(conn, rel, stat))
+                        added += 1
+                    except RasterioIOError as e:
+                        print(f"  ⚠ {href}: {e}")
+            for href in known.keys() - seen:
+                conn.execute("DELETE FROM items_bbox WHERE rowid IN "
+                             "(SELECT rowid FROM items WHERE href = ?)", (href,))
+                conn.execute("DELETE FROM items WHERE href = ?", (href,))
+                touched.add(known[href][2])
+                removed += 1
+    return (added, removed, unchanged), touched
+
+
+def collections(path=INDEX):
+    """{collection: (item count, first datetime, last datetime)}."""
+    with closing(connect(path)) as conn:
+        return {r[0]: tuple(r[1:]) for r in conn.execute(
+            "SELECT collection, COUNT(*), MIN(datetime), MAX(datetime) FROM items GROUP BY collection")}
+
+
+def lookup(collection, when, nearest=False, path=INDEX):
+    """href (relative to data/) of `collection` at time `when`, or None.
+
+    With nearest=True, the latest item at or before `when` (e.g. the daily
+    SST field valid at an hourly timestep). One indexed B-tree probe.
+    """
+    when = normalize_time(when)
+    with closing(connect(path)) as conn:
+        if nearest:
+            row = conn.execute("SELECT href FROM items WHERE collection = ? AND datetime <= ? "
+                               "ORDER BY datetime DESC LIMIT 1", (collection, when)).fetchone()
+        else:
+            row = conn.execute("SELECT href FROM items WHERE collection = ? AND datetime = ?",
+                               (collection, when)).fetchone()
+    return row["href"] if row else None
+
+
+def search(collection=None, bbox=None, start=None, end=None, path=INDEX):
+    """Items (dicts, ordered by collection and time) matching all given filters.
+
+    `bbox` is (west, south, east, north) in EPSG:4326 and is answered by the
+    R*Tree; `start` / `end` bound the item datetime (inclusive).
+    """
+    sql = ["SELECT items.*, b.west, b.south, b.east, b.north FROM items "
+           "JOIN items_bbox b ON b.rowid = items.rowid WHERE 1"]
+    args = []
+    if collection is not None:
+        sql.append("AND items.collection = ?")
+        args.append(collection)
+    if bbox is not None:
+        west, south, east, north = bbox
+        sql.append("AND b.west <= ? AND b.east >= ? AND b.south <= ? AND b.north >= ?")
+        args += [east, west, north, south]
+    if start is not None:
+        sql.append("AND items.datetime >= ?")
+        args.append(normalize_time(start))
+    if end is not None:
+        sql.append("AND items.datetime <= ?")
+        args.append(normalize_time(end))
+    sql.append("ORDER BY items.collection, items.datetime, items.id")
+    with closing(connect(path)) as conn:
+        return [dict(r) for r in conn.execute(" ".join(sql), args)]
+
+
+# ─── Static catalog ──────────────────────────────────────────────────────────
+
+def _item_json(row, collection_dir):
+    asset = os.path.relpath(DATA / row["href"], collection_dir)
+    bbox = [row["west"], row["south"], row["east"], row["north"]]
+    properties = {"datetime": row["datetime"]}
+    if row["end_datetime"]:
+        properties.update(start_datetime=row["datetime"], end_datetime=row["end_datetime"])
+    properties.update({"proj:shape": [row["height"], row["width"]], "cheias:dtype": row["dtype"],
+                       "cheias:crs": row["crs"]})
+    if row["properties"]:
+        properties.update(json.loads(row["properties"]))
+    return {
+        "type": "Feature",
+        "stac_version": "1.0.0",
+        "stac_extensions": ["https://stac-extensions.github.io/projection/v1.1.0/schema.json"],
+        "id": row["id"],
+        "collection": row["collection"],
+        "geometry": {"type": "Polygon", "coordinates": [[
+            [bbox[0], bbox[1]], [bbox[2], bbox[1]], [bbox[2], bbox[3]], [bbox[0], bbox[3]],
+            [bbox[0], bbox[1]]]]},
+        "bbox": bbox,
+        "properties": properties,
+        "links": [
+            {"rel": "collection", "href": "./collection.json", "type": "application/json"},
+            {"rel": "parent", "href": "./collection.json", "type": "application/json"},
+            {"rel": "root", "href": "../catalog.json", "type": "application/json"},
+        ],
+        "assets": {"data": {
+            "href": asset,
+            "type": "image/tiff; application=geotiff; profile=cloud-optimized",
+            "roles": ["data"],
+        }},
+    }
+
+
+def _write_json(obj, out):
+    tmp = out.with_name(f".{out.name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(obj, f, indent=1)
+    os.replace(tmp, out)
+
+
+def write_catalog(only=None, path=INDEX, out_dir=STAC_DIR):
+    """Write catalog.json and collection/item JSONs (only the given collections' items)."""
+    stats = collections(path)
+    for name in sorted(only if only is not None else stats):
+        collection_dir = out_dir / name
+        collection_dir.mkdir(parents=True, exist_ok=True)
+        items = search(collection=name, path=path)
+        wanted = set()
+        for row in items:
+            wanted.add(f"{row['id']}.json")
+            _write_json(_item_json(row, collection_dir), collection_dir / f"{row['id']}.json")
+        for stale in collection_dir.glob("*.json"):
+            if stale.name != "collection.json" and stale.name not in wanted:
+                stale.unlink()
+        if not items:
+            (collection_dir / "collection.json").unlink(missing_ok=True)
+            continue
+        times = [t for r in items for t in (r["datetime"], r["end_datetime"]) if t]
+        _write_json({
+            "type": "Collection",
+            "stac_version": "1.0.0",
+            "id": name,
+            "description": f"cheias.pt {name} COGs",
+            "license": "proprietary",
+            "extent": {
+                "spatial": {"bbox": [[min(r["west"] for r in items), min(r["south"] for r in items),
+                                      max(r["east"] for r in items), max(r["north"] for r in items)]]},
+                "temporal": {"interval": [[min(times) if times else None, max(times) if times else None]]},
+            },
+            "links": [
+                {"rel": "root", "href": "../catalog.json", "type": "application/json"},
+                {"rel": "parent", "href": "../catalog.json", "type": "application/json"},
+                *({"rel": "item", "href": f"./{r['id']}.json", "type": "application/geo+json"}
+                  for r in items),
+            ],
+        }, collection_dir / "collection.json")
+
+    _write_json({
+        "type": "Catalog",
+        "stac_version": "1.0.0",
+        "id": "cheias-pt",
+        "description": "COGs produced by the cheias.pt pipeline (Portugal, winter 2025-26 floods)",
+        "links": [
+            {"rel": "root", "href": "./catalog.json", "type": "application/json"},
+            *({"rel": "child", "href": f"./{name}/collection.json", "type": "application/json",
+               "title": name} for name in sorted(collections(path))),
+        ],
+    }, out_dir / "catalog.json")
+
+
+# ─── CLI ─────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Index project COGs into a local STAC catalog")
+    parser.add_argument("--only", action="append", metavar="DIR",
+                        help="Directory under data/ to rescan, e.g. cog/mslp (repeatable; default: all roots)")
+    parser.add_argument("--lookup", nargs=2, metavar=("COLLECTION", "TIME"),
+                        help="Print the href of COLLECTION at TIME and exit")
+    args = parser.parse_args()
+
+    if args.lookup:
+        print(lookup(*args.lookup) or lookup(*args.lookup, nearest=True) or "(none)")
+        return
+
+    t0 = time.time()
+    (added, removed, unchanged), touched = scan(args.only)
+    write_catalog(only=touched)
+    print(f"✓ Indexed {added} new/changed, removed {removed}, {unchanged} unchanged "
+          f"in {time.time() - t0:.1f}s → {INDEX.relative_to(ROOT)}")
+    for name, (n, first, last) in sorted(collections().items()):
+        print(f"    {name:40s} {n:>6} items  {first or '(static)'} … {last or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,8 @@ DEPLOY_DIRS=(
   data/consequences
   data/raster-frames
   data/cog
+  data/stac
+  data/tiles
 )
 
 # Research data (needed for development/analysis only)
@@ -0,0 +1,457 @@
+"""In-process vector tiling: GeoDataFrames → MVT → PMTiles.
+
+Replaces the tippecanoe step (fetch_lightning.py shelled out to it when on
+PATH; download_cems.py and fetch_wildfires_full.py left it to the user) so
+CEMS flood extent, wildfires and lightning are tiled in the same run that
+produces them, straight from GeoDataFrames or Arrow tables, without an
+intermediate GeoJSON.
+
+Per layer and zoom:
+  - only tiles touched by a feature's bounding box are generated
+  - geometries are clipped to the tile (plus a small buffer), simplified
+    with a tolerance of `simplify` tile pixels and snapped to the 4096
+    extent grid; polygons smaller than `min_area_px` pixels are dropped
+  - points are thinned below `base_zoom` at tippecanoe's default rate
+    (keep 1 / drop_rate per zoom step), by a stable per-feature rank
+  - a tile still over MAX_TILE_BYTES drops its densest points / smallest
+    polygons until it fits (tippecanoe's --drop-densest-as-needed)
+
+Tiles are encoded in parallel: each worker receives the layers once (WKB
+in Web Mercator metres) and indexes them with an STRtree. Output tiles are
+gzip-compressed MVT in a PMTiles v3 archive (pmtiles_writer.py).
+
+Usage:
+    from vector_tiles import VectorLayer, write_pmtiles
+
+    write_pmtiles(path, [VectorLayer("lightning", gdf, minzoom=4, maxzoom=14)])
+
+    python scripts/vector_tiles.py                       # re-tile all archives from saved sources
+    python scripts/vector_tiles.py --only flood-extent
+"""
+
+import argparse
+import gzip
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from pmtiles_writer import PMTilesWriter
+
+ROOT = Path(__file__).resolve().parent.parent
+DATA = ROOT / "data"
+
+# Archives the fetch scripts write, re-tileable from their saved sources:
+# layer name → (sources, output archive, minzoom, maxzoom)
+ARCHIVES = {
+    "flood-extent": ([DATA / "flood-extent" / "combined.geojson"],
+                     DATA / "flood-extent" / "combined.pmtiles", 4, 14),
+    "wildfires": ([DATA / "qgis" / "wildfires-2024.geojson", DATA / "qgis" / "wildfires-2025.geojson"],
+                  DATA / "qgis" / "wildfires-combined.pmtiles", 4, 12),
+    "lightning": ([DATA / "lightning" / "lightning-kristin.geojson"],
+                  DATA / "lightning" / "lightning-kristin.pmtiles", 4, 14),
+}
+
+EXTENT = 4096
+BUFFER = 64                 # tile-unit buffer around each tile (MVT convention)
+MAX_TILE_BYTES = 500_000    # uncompressed, as tippecanoe
+TILES_PER_CHUNK = 64        # tiles per worker task
+ORIGIN = 20037508.342789244  # Web Mercator half-width, metres
+
+GEOM_POINT, GEOM_LINE, GEOM_POLYGON = 1, 2, 3
+
+# Worker-side layers, set by _init_worker()
+_LAYERS = []
+
+
+# ─── Layers ──────────────────────────────────────────────────────────────────
+
+class VectorLayer:
+    """One MVT layer: features plus per-zoom generalization settings."""
+
+    def __init__(self, name, data, minzoom=0, maxzoom=14, properties=None,
+                 simplify=1.0, min_area_px=1.0, drop_rate=2.5, base_zoom=None):
+        if not isinstance(data, gpd.GeoDataFrame):
+            data = gpd.GeoDataFrame.from_arrow(data)
+        if data.crs is not None and data.crs.to_epsg() != 4326:
+            data = data.to_crs(epsg=4326)
+        data = data[~(data.geometry.isna() | data.geometry.is_empty)]
+
+        self.name = name
+        self.minzoom = minzoom
+        self.maxzoom = maxzoom
+        self.simplify = simplify
+        self.min_area_px = min_area_px
+        self.drop_rate = drop_rate
+        self.base_zoom = maxzoom if base_zoom is None else base_zoom
+
+        columns = [c for c in (properties or data.columns) if c != data.geometry.name]
+        self.properties = pd.DataFrame(data[columns]).reset_index(drop=True)
+        self.geometry = np.asarray(data.geometry.values)
+        self.bounds = shapely.bounds(self.geometry)
+
+    def field_types(self):
+        """vector_layers "fields" entry for the archive metadata."""
+        fields = {}
+        for col, dtype in self.properties.dtypes.items():
+            if pd.api.types.is_bool_dtype(dtype):
+                fields[col] = "Boolean"
+            elif pd.api.types.is_numeric_dtype(dtype):
+                fields[col] = "Number"
+            else:
+                fields[col] = "String"
+        return fields
+
+    def payload(self):
+        """What a worker needs: WKB in Web Mercator, properties, settings."""
+        merc = shapely.transform(self.geometry, lnglat_to_mercator)
+        return {
+            "name": self.name,
+            "wkb": shapely.to_wkb(merc),
+            "properties": self.properties,
+            "rank": _feature_rank(len(self.geometry)),
+            "minzoom": self.minzoom,
+            "maxzoom": self.maxzoom,
+            "simplify": self.simplify,
+            "min_area_px": self.min_area_px,
+            "drop_rate": self.drop_rate,
+            "base_zoom": self.base_zoom,
+        }
+
+
+def lnglat_to_mercator(coords):
+    """(N, 2) lon/lat → Web Mercator metres."""
+    lon = coords[:, 0]
+    lat = np.clip(coords[:, 1], -85.0511, 85.0511)
+    x = lon * ORIGIN / 180.0
+    y = np.log(np.tan(np.radians(90.0 + lat) / 2.0)) * ORIGIN / math.pi
+    return np.column_stack([x, y])
+
+
+def _feature_rank(n):
+    """Stable pseudo-random rank in [0, 1) per feature, for point thinning.
+
+    Lower ranks survive longer: both the per-zoom thinning and `_fit_tile`
+    keep the lowest ranks, so a point kept at zoom z is kept at every z' > z.
+    """
+    return np.random.default_rng(0x5EED).random(n)
+
+
+def tiles_for_layer(layer, z):
+    """Set of (x, y) tiles at zoom z touched by any feature's bounding box."""
+    n = 1 << z
+    b = layer.bounds
+    west, south, east, north = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    x0 = np.floor((west + 180.0) / 360.0 * n).astype(np.int64)
+    x1 = np.floor((east + 180.0) / 360.0 * n).astype(np.int64)
+    lat_n = np.radians(np.clip(north, -85.0511, 85.0511))
+    lat_s = np.radians(np.clip(south, -85.0511, 85.0511))
+    y0 = np.floor((1.0 - np.arcsinh(np.tan(lat_n)) / math.pi) / 2.0 * n).astype(np.int64)
+    y1 = np.floor((1.0 - np.arcsinh(np.tan(lat_s)) / math.pi) / 2.0 * n).astype(np.int64)
+    x0, x1, y0, y1 = (np.clip(a, 0, n - 1) for a in (x0, x1, y0, y1))
+
+    tiles = set()
+    single = (x0 == x1) & (y0 == y1)
+    tiles.update(zip(x0[single].tolist(), y0[single].tolist()))
+    for i in np.flatnonzero(~single):
+        tiles.update((x, y) for x in range(x0[i], x1[i] + 1) for y in range(y0[i], y1[i] + 1))
+    return tiles
+
+
+# ─── Protobuf / MVT encoding ─────────────────────────────────────────────────
+
+def _varint(n, out):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def _field_bytes(num, payload, out):
+    _varint((num << 3) | 2, out)
+    _varint(len(payload), out)
+    out += payload
+
+
+def _field_varint(num, value, out):
+    _varint(num << 3, out)
+    _varint(value, out)
+
+
+def _packed(values):
+    buf = bytearray()
+    for v in values:
+        _varint(v, buf)
+    return buf
+
+
+def _encode_value(v):
+    """Python scalar → MVT Value message bytes."""
+    out = bytearray()
+    if isinstance(v, (bool, np.bool_)):
+        _field_varint(7, int(v), out)
+    elif isinstance(v, (int, np.integer)):
+        v = int(v)
+        if v < 0:
+            _field_varint(6, _zigzag(v), out)
+        else:
+            _field_varint(5, v, out)
+    elif isinstance(v, (float, np.floating)):
+        out.append((3 << 3) | 1)
+        out += np.float64(v).tobytes()
+    else:
+        _field_bytes(1, str(v).encode(), out)
+    return bytes(out)
+
+
+class _GeometryEncoder:
+    """Command-integer stream for one feature (cursor carried across parts)."""
+
+    def __init__(self):
+        self.cmds = []
+        self.cx = self.cy = 0
+
+    def _moves(self, pts):
+        for x, y in pts:
+            self.cmds.append(_zigzag(int(x) - self.cx))
+            self.cmds.append(_zigzag(int(y) - self.cy))
+            self.cx, self.cy = int(x), int(y)
+
+    def point(self, pts):
+        self.cmds.append((len(pts) << 3) | 1)
+        self._moves(pts)
+
+    def line(self, pts):
+        self.cmds.append((1 << 3) | 1)
+        self._moves(pts[:1])
+        self.cmds.append(((len(pts) - 1) << 3) | 2)
+        self._moves(pts[1:])
+
+    def ring(self, pts):
+        pts = pts[:-1]  # closing point is implicit
+        self.line(pts)
+        self.cmds.append((1 << 3) | 7)
+
+
+def _drop_repeats(coords):
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+    return coords[keep]
+
+
+def encode_geometry(geom):
+    """Tile-space shapely geometry → (MVT geometry type, command list) or None."""
+    enc = _GeometryEncoder()
+    gtype = shapely.get_type_id(geom)
+    if gtype in (0, 4):  # Point, MultiPoint
+        pts = shapely.get_coordinates(geom).astype(np.int64)
+        enc.point(pts)
+        return GEOM_POINT, enc.cmds
+    if gtype in (1, 5):  # LineString, MultiLineString
+        for part in shapely.get_parts(geom):
+            pts = _drop_repeats(shapely.get_coordinates(part).astype(np.int64))
+            if len(pts) >= 2:
+                enc.line(pts)
+        return (GEOM_LINE, enc.cmds) if enc.cmds else None
+    if gtype in (3, 6):  # Polygon, MultiPolygon
+        for part in shapely.get_parts(geom):
+            rings = [part.exterior, *part.interiors]
+            for ring in rings:
+                pts = _drop_repeats(shapely.get_coordinates(ring).astype(np.int64))
+                if len(pts) >= 4:
+                    enc.ring(pts)
+        return (GEOM_POLYGON, enc.cmds) if enc.cmds else None
+    return None
+
+
+def encode_layer(name, features, records):
+    """[(index, geometry_type, commands)] → MVT Layer message bytes.
+
+    `records` is one property dict per feature index (or None).
+    """
+    keys, key_idx = [], {}
+    values, value_idx = [], {}
+    out = bytearray()
+    _field_varint(15, 2, out)
+    _field_bytes(1, name.encode(), out)
+
+    for idx, gtype, cmds in features:
+        tags = []
+        if records is not None:
+            for k, v in records[idx].items():
+                if v is None or (pd.api.types.is_scalar(v) and pd.isna(v)):
+                    continue
+                if isinstance(v, pd.Timestamp):
+                    v = v.isoformat()
+                if k not in key_idx:
+                    key_idx[k] = len(keys)
+                    keys.append(k)
+                val = _encode_value(v)
+                if val not in value_idx:
+                    value_idx[val] = len(values)
+                    values.append(val)
+                tags += [key_idx[k], value_idx[val]]
+        feat = bytearray()
+        _field_varint(1, idx + 1, feat)
+        if tags:
+            _field_bytes(2, _packed(tags), feat)
+        _field_varint(3, gtype, feat)
+        _field_bytes(4, _packed(cmds), feat)
+        _field_bytes(2, feat, out)
+
+    for k in keys:
+        _field_bytes(3, k.encode(), out)
+    for v in values:
+        _field_bytes(4, v, out)
+    _field_varint(5, EXTENT, out)
+    return bytes(out)
+
+
+# ─── Tiling ──────────────────────────────────────────────────────────────────
+
+def _init_worker(payloads):
+    """Pool initializer: rebuild geometries and spatial indexes once per worker."""
+    _LAYERS.clear()
+    for p in payloads:
+        geoms = shapely.from_wkb(p["wkb"])
+        props = p["properties"]
+        layer = dict(p, geometry=geoms, tree=shapely.STRtree(geoms),
+                     is_point=np.isin(shapely.get_type_id(geoms), (0, 4)),
+                     records=props.to_dict("records") if len(props.columns) else None)
+        del layer["wkb"], layer["properties"]
+        _LAYERS.append(layer)
+
+
+def _tile_features(layer, z, x, y):
+    """Clip, generalize and encode one layer's features for tile z/x/y."""
+    size = 2 * ORIGIN / (1 << z)
+    minx = -ORIGIN + x * size
+    maxy = ORIGIN - y * size
+    pad = size * BUFFER / EXTENT
+    idx = layer["tree"].query(shapely.box(minx - pad, maxy - size - pad, minx + size + pad, maxy + pad))
+    if not len(idx):
+        return []
+    idx = np.sort(idx)
+
+    # Point thinning below base zoom
+    if z < layer["base_zoom"]:
+        keep = layer["rank"][idx] < layer["drop_rate"] ** (z - layer["base_zoom"])
+        idx = idx[keep | ~layer["is_point"][idx]]
+
+    geoms = shapely.clip_by_rect(layer["geometry"][idx], minx - pad, maxy - size - pad,
+                                 minx + size + pad, maxy + pad)
+    scale = EXTENT / size
+    geoms = shapely.transform(geoms, lambda c: np.column_stack(
+        [(c[:, 0] - minx) * scale, (maxy - c[:, 1]) * scale]))
+    if layer["simplify"] and z < layer["maxzoom"]:
+        geoms = shapely.simplify(geoms, layer["simplify"] * EXTENT / 256, preserve_topology=True)
+    geoms = shapely.set_precision(geoms, 1.0)
+
+    px_area = (EXTENT / 256) ** 2
+    areas = shapely.area(geoms)
+    polygonal = np.isin(shapely.get_type_id(geoms), (3, 6))
+    ok = ~shapely.is_empty(geoms) & ~(polygonal & (areas < layer["min_area_px"] * px_area))
+    geoms = shapely.orient_polygons(geoms[ok], exterior_cw=False)
+
+    features = []
+    for i, g, a in zip(idx[ok], geoms, areas[ok]):
+        encoded = encode_geometry(g)
+        if encoded is not None:
+            features.append((int(i), *encoded, a))
+    return features
+
+
+def _fit_tile(layer, features):
+    """Encode a layer, dropping densest points / smallest polygons while over budget."""
+    data = encode_layer(layer["name"], [f[:3] for f in features], layer["records"])
+    while len(data) > MAX_TILE_BYTES and len(features) > 1:
+        # Keep the lowest-ranked half of points (same order as the zoom thinning)
+        # and the largest half of polygons
+        features = sorted(features, key=lambda f: (
+            layer["rank"][f[0]] if f[1] == GEOM_POINT else 0, -f[3]))
+        features = features[:len(features) // 2]
+        features.sort(key=lambda f: f[0])
+        data = encode_layer(layer["name"], [f[:3] for f in features], layer["records"])
+    return data
+
+
+def _render_tiles(tiles):
+    """Worker task: [(z, x, y)] → [(z, x, y, gzip MVT bytes | None)]."""
+    out = []
+    for z, x, y in tiles:
+        tile = bytearray()
+        for layer in _LAYERS:
+            if not layer["minzoom"] <= z <= layer["maxzoom"]:
+                continue
+            features = _tile_features(layer, z, x, y)
+            if features:
+                _field_bytes(3, _fit_tile(layer, features), tile)
+        out.append((z, x, y, gzip.compress(bytes(tile), mtime=0) if tile else None))
+    return out
+
+
+def write_pmtiles(path, layers, workers=None, metadata=None):
+    """Tile `layers` (VectorLayer list) into one PMTiles archive. Returns the tile count."""
+    tiles = set()
+    for layer in layers:
+        for z in range(layer.minzoom, layer.maxzoom + 1):
+            tiles.update((z, x, y) for x, y in tiles_for_layer(layer, z))
+    tiles = sorted(tiles)
+    chunks = [tiles[i:i + TILES_PER_CHUNK] for i in range(0, len(tiles), TILES_PER_CHUNK)]
+
+    bounds = np.vstack([layer.bounds for layer in layers if len(layer.bounds)])
+    workers = workers or os.cpu_count() or 1
+    with PMTilesWriter(path, "mvt", tile_compression="gzip") as writer, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                initargs=([layer.payload() for layer in layers],)) as pool:
+        for result in pool.map(_render_tiles, chunks):
+            for z, x, y, data in result:
+                if data is not None:
+                    writer.add_tile(z, x, y, data)
+        writer.bounds = (bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max())
+        writer.metadata = {
+            **(metadata or {}),
+            "vector_layers": [
+                {"id": layer.name, "fields": layer.field_types(),
+                 "minzoom": layer.minzoom, "maxzoom": layer.maxzoom}
+                for layer in layers
+            ],
+        }
+        return len(writer)
+
+
+# ─── CLI ─────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-tile vector PMTiles archives in-process")
+    parser.add_argument("--only", action="append", choices=list(ARCHIVES),
+                        help="Archive to rebuild, repeatable (default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="Tiling processes (default: all cores)")
+    args = parser.parse_args()
+
+    for name in args.only or ARCHIVES:
+        sources, out_path, minzoom, maxzoom = ARCHIVES[name]
+        present = [p for p in sources if p.exists()]
+        if not present:
+            print(f"  {name}: no source data, skipping")
+            continue
+        t0 = time.time()
+        gdf = pd.concat([gpd.read_file(p) for p in present], ignore_index=True)
+        layer = VectorLayer(name, gpd.GeoDataFrame(gdf, crs="EPSG:4326"), minzoom, maxzoom)
+        n_tiles = write_pmtiles(out_path, [layer], workers=args.workers, metadata={"name": name})
+        print(f"  {name}: {len(gdf)} features → {n_tiles} tiles, "
+              f"{out_path.stat().st_size / 1e6:.1f} MB in {time.time() - t0:.0f}s ({out_path})")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,18 @@
  */
 
 import { fromUrl } from 'geotiff';
-import type { RasterManifest, DischargeData, DecodedRaster, PaletteStop, PaletteConfig } from './types';
+import type {
+  RasterManifest, RasterFrame, FrameVariant, DischargeData, DecodedRaster, DeltaEncoding, FrameAtlas,
+  PaletteStop, PaletteConfig,
+} from './types';
 import paletteData from '../data/colormaps/palette.json';
 
 // ── Caches ──
 
 const jsonCache: Record<string, unknown> = {};
 const cogCache = new Map<string, DecodedRaster>();
+const keyframeCache = new Map<string, Promise<Uint8Array>>(); // LRU, insertion-ordered
+const MAX_CACHED_KEYFRAMES = 4;
 
 // ── JSON loaders ──
 
@@ -32,7 +37,62 @@ export const loadPrecipFrames = () => loadJSON('data/frontend/precip-frames.json
 export const loadDischargeTimeseries = () => loadJSON<DischargeData>('data/frontend/discharge-timeseries.json');
 export const loadPreconditionFrames = () => loadJSON('data/frontend/precondition-frames.json');
 export const loadPreconditionPeak = () => loadJSON('data/frontend/precondition-peak.json');
-export const loadRasterManifest = () => loadJSON<RasterManifest>('data/frontend/raster-manifest.json');
+export const loadRasterManifest = () =>
+  Promise.all([loadJSON<RasterManifest>('data/frontend/raster-manifest.json'), detectFrameFormats()])
+    .then(([manifest]) => manifest);
+
+// ── Frame format selection ──
+
+// 1×1 transparent probes, written with the same Pillow encoders as frame_encoder.py
+const FORMAT_PROBES: Record<FrameVariant, string> = {
+  avif: 'data:image/avif;base64,AAAAIGZ0eXBhdmlmAAAAAGF2aWZtaWYxbWlhZk1BMUIAAAGGbWV0YQAAAAAAAAAhaGRscgAAAAAAAAAAcGljdAAAAAAAAAAAAAAAAAAAAAAOcGl0bQAAAAAAAQAAACxpbG9jAAAAAEQAAAIAAQAAAAEAAAHCAAAAIQACAAAAAQAAAa4AAAAUAAAAQmlpbmYAAAAAAAIAAAAaaW5mZQIAAAAAAQAAYXYwMUNvbG9yAAAAABppbmZlAgAAAAACAABhdjAxQWxwaGEAAAAAGmlyZWYAAAAAAAAADmF1eGwAAgABAAEAAADDaXBycAAAAJ1pcGNvAAAAFGlzcGUAAAAAAAAAAQAAAAEAAAAQcGl4aQAAAAADCAgIAAAADGF2MUOBAAwAAAAAE2NvbHJuY2x4AAEADQAGgAAAAA5waXhpAAAAAAEIAAAADGF2MUOBABwAAAAAOGF1eEMAAAAAdXJuOm1wZWc6bXBlZ0I6Y2ljcDpzeXN0ZW1zOmF1eGlsaWFyeTphbHBoYQAAAAAeaXBtYQAAAAAAAAACAAEEAQKDBAACBAEFhgcAAAA9bWRhdBIACgQYAAYVMgoYACihAAIhHctgEgAKCBgABogIaDQgMhMZR4eGIYeeeeaAAACQQMkcYUK+',
+  webp: 'data:image/webp;base64,UklGRhoAAABXRUJQVlA4TA0AAAAvAAAAEAcQERGIiP4HAA==',
+};
+const FORMAT_PREFERENCE: FrameVariant[] = ['avif', 'webp'];
+let supportedVariants: Set<FrameVariant> | null = null;
+
+async function canDecode(uri: string): Promise<boolean> {
+  try {
+    const blob = await (await fetch(uri)).blob();
+    (await createImageBitmap(blob)).close();
+    return true;
+  } catch {
+    return false;
+  }
+}
+
+/**
+ * Detect which frame variants this browser decodes (once per page).
+ */
+export async function detectFrameFormats(): Promise<void> {
+  if (supportedVariants) return;
+  const ok = await Promise.all(FORMAT_PREFERENCE.map(f => canDecode(FORMAT_PROBES[f])));
+  supportedVariants = new Set(FORMAT_PREFERENCE.filter((_, i) => ok[i]));
+}
+
+/**
+ * URL of the smallest decodable encoding of a raster frame, by the byte
+ * sizes recorded in the manifest (FORMAT_PREFERENCE order without them).
+ * Falls back to the PNG until detectFrameFormats() has resolved.
+ */
+export function frameUrl(frame: RasterFrame): string {
+  let best = frame.url;
+  let bestBytes = frame.bytes?.png ?? Infinity;
+  for (const fmt of FORMAT_PREFERENCE) {
+    const url = frame.variants?.[fmt];
+    if (!url || !supportedVariants?.has(fmt)) continue;
+    const bytes = frame.bytes?.[fmt];
+    if (bytes === undefined) {
+      if (frame.bytes === undefined) return `data/${url}`;
+      continue;
+    }
+    if (bytes < bestBytes) {
+      best = url;
+      bestBytes = bytes;
+    }
+  }
+  return `data/${best}`;
+}
 
 // ── COG loading ──
 
@@ -96,6 +156,86 @@ export function clearCOGCache(): void {
   cogCache.clear();
 }
 
+// ── Keyframe/delta frames ──
+
+async function fetchInflated(url: string): Promise<Uint8Array> {
+  const resp = await fetch(url);
+  if (!resp.ok || !resp.body) throw new Error(`Failed to load ${url}: ${resp.status}`);
+  const stream = resp.body.pipeThrough(new DecompressionStream('deflate'));
+  return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+/**
+ * Reconstruct frame `index` of a keyframe/delta encoded variable.
+ * Needs at most two fetches: the group keyframe (cached) and the delta.
+ * Bytes are planar RGBA; delta bytes are added to the keyframe mod 256.
+ */
+export async function decodeDeltaFrame(enc: DeltaEncoding, index: number, baseUrl = 'data/'): Promise<ImageData> {
+  const frame = enc.frames[index];
+  if (!frame) throw new Error(`Delta frame ${index} out of range`);
+
+  const keyUrl = baseUrl + enc.frames[frame.key].url;
+  // Cache the promise so frames decoded in parallel share one keyframe fetch;
+  // re-inserting on every hit keeps the Map in least-recently-used order
+  let keyPromise = keyframeCache.get(keyUrl);
+  if (keyPromise) {
+    keyframeCache.delete(keyUrl);
+  } else {
+    keyPromise = fetchInflated(keyUrl);
+    keyPromise.catch(() => keyframeCache.delete(keyUrl));
+  }
+  keyframeCache.set(keyUrl, keyPromise);
+  while (keyframeCache.size > MAX_CACHED_KEYFRAMES) {
+    keyframeCache.delete(keyframeCache.keys().next().value as string);
+  }
+  const key = await keyPromise;
+
+  const n = enc.width * enc.height;
+  if (key.length !== n * 4) throw new Error(`Keyframe ${keyUrl} has ${key.length} bytes, expected ${n * 4}`);
+  const delta = frame.key === index ? null : await fetchInflated(baseUrl + frame.url);
+
+  const pixels = new Uint8ClampedArray(n * 4);
+  for (let c = 0; c < 4; c++) {
+    const plane = c * n;
+    for (let i = 0; i < n; i++) {
+      pixels[i * 4 + c] = delta ? (key[plane + i] + delta[plane + i]) & 0xff : key[plane + i];
+    }
+  }
+  return new ImageData(pixels, enc.width, enc.height);
+}
+
+/**
+ * Clear decoded keyframes (called once a player has decoded all its frames;
+ * the cache is also bounded to MAX_CACHED_KEYFRAMES).
+ */
+export function clearKeyframeCache(): void {
+  keyframeCache.clear();
+}
+
+// ── Sprite-atlas frames ──
+
+/**
+ * Load every frame of a sprite-atlas variable as ImageBitmaps.
+ * Each sheet is fetched once; frames are sliced out by their pixel rect.
+ */
+export async function loadAtlasFrames(atlas: FrameAtlas, baseUrl = 'data/'): Promise<ImageBitmap[]> {
+  const sheets = await Promise.all(atlas.sheets.map(async (sheet) => {
+    const resp = await fetch(baseUrl + sheet.url);
+    if (!resp.ok) throw new Error(`Failed to load ${sheet.url}: ${resp.status}`);
+    return createImageBitmap(await resp.blob(), { premultiplyAlpha: 'none' });
+  }));
+
+  try {
+    return await Promise.all(atlas.frames.map((frame) => {
+      const [x, y, w, h] = frame.rect;
+      return createImageBitmap(sheets[frame.sheet], x, y, w, h);
+    }));
+  } finally {
+    // Frames are independent copies; release the full-size sheets
+    for (const sheet of sheets) sheet.close();
+  }
+}
+
 // ── Palette parsing ──
 
 type RawPaletteEntry = {
@@ -196,28 +196,25 @@ const LAYER_DEFS: Record<string, LayerDef> = {
     initialUrl: 'data/raster-frames/precipitation/2025-12-01.png',
     paint: { 'raster-opacity': 0, 'raster-fade-duration': 0 },
   },
+  // Baked by scripts/bake_tile_pyramid.py (same colormap/rescale as the former TiTiler layers)
   'soil-moisture-tiles': {
     type: 'raster',
-    tileSource: true,
-    tiles: [
-      'https://titiler.cheias.pt/cog/tiles/WebMercatorQuad/{z}/{x}/{y}.png'
-      + '?url=https://pub-abad2527698d4bbab82318691c9b07a1.r2.dev/cog/soil-moisture/2026-01-28.tif'
-      + '&colormap_name=ylgnbu&rescale=0.05,0.50&return_mask=true'
-    ],
-    tileSize: 256,
-    attribution: 'Soil moisture: Open-Meteo / ERA5-Land',
+    source: {
+      type: 'raster',
+      url: 'pmtiles://data/tiles/soil-moisture/2026-01-28.pmtiles',
+      tileSize: 256,
+      attribution: 'Soil moisture: Open-Meteo / ERA5-Land',
+    },
     paint: { 'raster-opacity': 0 },
   },
   'precipitation-tiles': {
     type: 'raster',
-    tileSource: true,
-    tiles: [
-      'https://titiler.cheias.pt/cog/tiles/WebMercatorQuad/{z}/{x}/{y}.png'
-      + '?url=https://pub-abad2527698d4bbab82318691c9b07a1.r2.dev/cog/precipitation/2026-02-06.tif'
-      + '&colormap_name=ylorrd&rescale=1,80&return_mask=true'
-    ],
-    tileSize: 256,
-    attribution: 'Precipitation: Open-Meteo / ERA5',
+    source: {
+      type: 'raster',
+      url: 'pmtiles://data/tiles/precipitation/2026-02-06.pmtiles',
+      tileSize: 256,
+      attribution: 'Precipitation: Open-Meteo / ERA5',
+    },
     paint: { 'raster-opacity': 0 },
   },
   'wildfires-burn-scars': {
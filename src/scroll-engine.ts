@@ -10,8 +10,8 @@ import { gsap } from 'gsap';
 import type { Map as MLMap, FilterSpecification } from 'maplibre-gl';
 import { BitmapLayer, ScatterplotLayer } from '@deck.gl/layers';
 import type { Layer } from '@deck.gl/core';
-import type { Chapter, ResolvedChapter, RasterManifest, TemporalConfig } from './types';
-import { loadRasterManifest, loadDischargeTimeseries, loadJSON, loadCOG } from './data-loader';
+import type { Chapter, ResolvedChapter, RasterManifest, RasterFrame, TemporalConfig } from './types';
+import { loadRasterManifest, loadDischargeTimeseries, loadJSON, loadCOG, frameUrl } from './data-loader';
 import { ensureLayer, setLayerOpacity, updateSourceData, updateImageSource } from './layer-manager';
 import { setDeckOverlayLayers } from './map-setup';
 import { compositeUV, createWindParticles, updateWeatherFrame, weatherLayersToArray } from './weather-layers';
@@ -490,7 +490,7 @@ export async function enterChapter3(): Promise<void> {
     id: 'ch3-soil-moisture',
     frameType: 'png',
     mode: 'scroll-driven',
-    urls: smFrames.map(f => `data/${f.url}`),
+    urls: smFrames.map(f => frameUrl(f)),
     dates: smFrames.map(f => f.date),
     layerId: 'soil-moisture-raster',
   };
@@ -503,7 +503,7 @@ export async function enterChapter3(): Promise<void> {
     if (!map) return;
     const frame = smFrames[idx];
     if (frame) {
-      updateImageSource(map, 'soil-moisture-raster', `data/${frame.url}`);
+      updateImageSource(map, 'soil-moisture-raster', frameUrl(frame));
     }
     if (date) {
       updateDateLabel(date);
@@ -514,7 +514,7 @@ export async function enterChapter3(): Promise<void> {
 
   // Set initial frame
   if (smFrames.length > 0) {
-    updateImageSource(map, 'soil-moisture-raster', `data/${smFrames[0].url}`);
+    updateImageSource(map, 'soil-moisture-raster', frameUrl(smFrames[0]));
     updateDateLabel(smFrames[0].date);
   }
 
@@ -531,7 +531,7 @@ export async function enterChapter3(): Promise<void> {
   const precipFrames = manifest.precipitation.frames;
   const jan28Precip = precipFrames.find(f => f.date === '2026-01-28') || precipFrames[precipFrames.length - 1];
   if (jan28Precip) {
-    updateImageSource(map, 'precipitation-raster', `data/${jan28Precip.url}`);
+    updateImageSource(map, 'precipitation-raster', frameUrl(jan28Precip));
   }
 }
 
@@ -649,7 +649,7 @@ let ch4WarningOpacity = 0;
 let ch4LightningOpacity = 0;
 
 // Precipitation manifest cache
-let ch4PrecipFrames: { date: string; url: string }[] | null = null;
+let ch4PrecipFrames: RasterFrame[] | null = null;
 
 // Lightning GeoJSON cache
 let ch4LightningFeatures: GeoJSON.Feature[] | null = null;
@@ -819,13 +819,13 @@ function updateIPMAWarnings(dateStr: string, stormName?: string): void {
 function updatePrecipFrame(dateStr: string): void {
   if (!map || !ch4PrecipFrames) return;
   // Find exact match or most recent preceding frame
-  let best: { date: string; url: string } | undefined;
+  let best: RasterFrame | undefined;
   for (const f of ch4PrecipFrames) {
     if (f.date === dateStr) { best = f; break; }
     if (f.date <= dateStr) best = f;
   }
   if (best) {
-    updateImageSource(map, 'precipitation-raster', `data/${best.url}`);
+    updateImageSource(map, 'precipitation-raster', frameUrl(best));
   }
 }
 
@@ -1638,7 +1638,7 @@ export async function enterChapter5(): Promise<void> {
   ensureLayer(map, 'soil-moisture-raster');
   const jan28Frame = manifest.soil_moisture.frames.find(f => f.date === '2026-01-28');
   if (jan28Frame) {
-    updateImageSource(map, 'soil-moisture-raster', `data/${jan28Frame.url}`);
+    updateImageSource(map, 'soil-moisture-raster', frameUrl(jan28Frame));
   }
 
   const data = await loadDischargeTimeseries();
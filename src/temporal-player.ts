@@ -5,15 +5,17 @@
  *   - autoplay: rAF loop at configurable fps, loops automatically
  *   - scroll-driven: maps scroll progress (0-1) to frame index
  *
- * Three frame types:
+ * Five frame types:
  *   - png: fetch → ImageBitmap (pre-rendered frames)
+ *   - png-delta: keyframe + delta → ImageData → ImageBitmap (encode_frame_deltas.py)
+ *   - png-atlas: fetch sheets once → slice ImageBitmaps (build_frame_atlas.py)
  *   - cog: fetch → DecodedRaster → applyColormap → ImageBitmap
  *   - weather-layers: fetch GeoTIFF → WeatherLayers GL layer set
  */
 
 import type { Layer } from '@deck.gl/core';
 import type { TemporalConfig } from './types';
-import { loadCOG, applyColormap, gaussianBlur, rasterToImageBitmap, getPalette } from './data-loader';
+import { loadCOG, applyColormap, gaussianBlur, rasterToImageBitmap, getPalette, decodeDeltaFrame, clearKeyframeCache, loadAtlasFrames } from './data-loader';
 import { updateWeatherFrame, weatherLayersToArray } from './weather-layers';
 
 export type FrameCallback = (index: number, date: string | null) => void;
@@ -53,6 +55,10 @@ export class TemporalPlayer {
 
     if (frameType === 'png') {
       await this.loadPNGFrames(urls);
+    } else if (frameType === 'png-delta') {
+      await this.loadDeltaFrames();
+    } else if (frameType === 'png-atlas') {
+      await this.loadAtlasFrames();
     } else if (frameType === 'cog') {
       await this.loadCOGFrames(urls);
     } else if (frameType === 'weather-layers') {
@@ -72,6 +78,35 @@ export class TemporalPlayer {
     this.frames = await Promise.all(promises);
   }
 
+  private async loadDeltaFrames(): Promise<void> {
+    const enc = this.config.delta;
+    if (!enc) throw new Error(`png-delta frame type requires delta encoding`);
+
+    const promises = enc.frames.map(async (_frame, i) => {
+      const imageData = await decodeDeltaFrame(enc, i);
+      return rasterToImageBitmap(imageData);
+    });
+    try {
+      this.frames = await Promise.all(promises);
+    } finally {
+      // Every frame is now an ImageBitmap; the raw keyframes are no longer needed
+      clearKeyframeCache();
+    }
+    if (!this.config.dates) {
+      this.config = { ...this.config, dates: enc.frames.map(f => f.date) };
+    }
+  }
+
+  private async loadAtlasFrames(): Promise<void> {
+    const atlas = this.config.atlas;
+    if (!atlas) throw new Error(`png-atlas frame type requires atlas`);
+
+    this.frames = await loadAtlasFrames(atlas);
+    if (!this.config.dates) {
+      this.config = { ...this.config, dates: atlas.frames.map(f => f.date) };
+    }
+  }
+
   private async loadCOGFrames(urls: string[]): Promise<void> {
     const paletteId = this.config.paletteId;
     if (!paletteId) throw new Error(`COG frame type requires paletteId`);
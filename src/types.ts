@@ -94,7 +94,7 @@ export interface PaletteConfig {
 
 // ── Temporal player types ──
 
-export type FrameType = 'png' | 'cog' | 'weather-layers';
+export type FrameType = 'png' | 'png-delta' | 'png-atlas' | 'cog' | 'weather-layers';
 export type PlaybackMode = 'autoplay' | 'scroll-driven';
 
 export interface TemporalConfig {
@@ -109,16 +109,88 @@ export interface TemporalConfig {
   layerId?: string;            // MapLibre layer to update (for png type)
   bounds?: [number, number, number, number]; // for COG/weather-layers
   weatherBaseUrl?: string;     // for weather-layers frameType
+  delta?: DeltaEncoding;       // for png-delta frameType (urls unused)
+  atlas?: FrameAtlas;          // for png-atlas frameType (urls unused)
 }
 
+export type FrameFormat = 'png8' | 'png';
+export type FrameVariant = 'webp' | 'avif';
+
 export interface RasterFrame {
   date: string;
   url: string;
+  format?: FrameFormat;        // png8 = indexed PNG + tRNS (frame_encoder.py)
+  cog?: string;                // source COG, resolved through the STAC index
+  variants?: Partial<Record<FrameVariant, string>>; // same frame in other formats
+  bytes?: Partial<Record<'png' | FrameVariant, number>>; // file size of url + each variant
+}
+
+/** Keyframe/delta frame from scripts/encode_frame_deltas.py */
+export interface DeltaFrame {
+  date: string;
+  url: string;
+  key: number;                 // index of the keyframe this frame is relative to (== own index for keyframes)
+}
+
+export interface DeltaEncoding {
+  encoding: 'zlib-planar-rgba';
+  width: number;
+  height: number;
+  keyframe_interval: number;
+  step: number;                // residual quantization step (1 = lossless)
+  bytes: number;
+  frames: DeltaFrame[];
+}
+
+/** Sprite-atlas sheets from scripts/build_frame_atlas.py */
+export interface AtlasSheet {
+  url: string;
+  width: number;
+  height: number;
+  bytes: number;
+}
+
+export interface AtlasFrame {
+  date: string;
+  sheet: number;               // index into FrameAtlas.sheets
+  rect: [number, number, number, number]; // [x, y, width, height] in sheet pixels
+  uv: [number, number, number, number];   // [u0, v0, u1, v1] normalized, origin top-left
+}
+
+export interface FrameAtlas {
+  format: 'webp' | 'png';
+  max_side?: number;           // sheet side cap it was built with
+  frame_width: number;
+  frame_height: number;
+  bytes: number;
+  sheets: AtlasSheet[];
+  frames: AtlasFrame[];
+}
+
+/** Pre-rendered WebMercator tile archives from scripts/bake_tile_pyramid.py */
+export interface TilePyramid {
+  format: 'pmtiles';
+  tile_type: 'png';
+  tile_size: number;
+  minzoom: number;
+  maxzoom: number;
+  bounds: [number, number, number, number];
+  colormap: string;
+  rescale: [number, number];
+  bytes: number;
+  frames: RasterFrame[];       // one .pmtiles archive per date
+}
+
+export interface RasterVariable {
+  frames: RasterFrame[];
+  delta?: DeltaEncoding;
+  atlas?: FrameAtlas;
+  tiles?: TilePyramid;
 }
 
 export interface RasterManifest {
-  soil_moisture: { frames: RasterFrame[] };
-  precipitation: { frames: RasterFrame[] };
+  soil_moisture: RasterVariable;
+  precipitation: RasterVariable;
 }
 
 export interface DischargeStation {